@@ -0,0 +1,188 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Approximate nearest-neighbour (IVF) index for large recommender catalogs
+
+import os
+import numpy as np
+
+# file written next to the catalog arrays
+ANN_INDEX_FILE = "ann_index.npz"
+ANN_EMBEDDING_INDEX_FILE = "ann_embedding_index.npz"
+DEFAULT_N_PROBE = 8
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, block_rows: int = 65536) -> np.ndarray:
+    """
+    Find the closest centroid (squared L2) of every vector, in blocks to bound memory.
+
+    Args:
+        vectors (np.ndarray): (N, dimensions) vectors.
+        centroids (np.ndarray): (lists, dimensions) centroids.
+        block_rows (int): Number of vectors compared at a time.
+
+    Returns:
+        np.ndarray: int32 index of the nearest centroid of each vector.
+
+    Example:
+        assignments = nearest_centroids(vectors, centroids)
+    """
+
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for block_start in range(0, len(vectors), block_rows):
+        block = np.asarray(vectors[block_start:block_start + block_rows], dtype=np.float32)
+        # |x - c|^2 without the |x|^2 term, which does not change the argmin
+        block_distances = centroid_norms - 2.0 * (block @ centroids.T)
+        assignments[block_start:block_start + len(block)] = np.argmin(block_distances, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """
+    Inverted-file index over the catalog's prediction vectors.
+
+    The vectors are clustered into n_lists k-means cells. A query only scans the
+    rows in the n_probe cells whose centroids are closest to it, so the cost per
+    query is about n_probe / n_lists of an exact scan. Raising n_probe trades
+    latency for recall; n_probe equal to n_lists is an exact search.
+
+    Rows added after the index is built are assigned to their nearest existing
+    centroid. The centroids themselves are not moved, so rebuild the index after
+    the catalog has grown a lot. The fingerprint of the model whose vectors the
+    centroids were trained on is stored with the index, since centroids of
+    another model's vector space give poor recall.
+
+    Example:
+        index = IVFIndex.build(vectors)
+        candidate_rows = index.candidate_rows(query_vector, n_probe=8)
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray, n_probe: int = DEFAULT_N_PROBE,
+                 model_fingerprint: str = "") -> None:
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.assignments = np.asarray(assignments, dtype=np.int32)
+        self.n_probe = n_probe
+        self.model_fingerprint = model_fingerprint
+        self._build_lists()
+
+    def _build_lists(self) -> None:
+        # rows grouped by cell, with offsets[cell]:offsets[cell + 1] spanning each cell
+        self.list_rows = np.argsort(self.assignments, kind='stable').astype(np.int64)
+        list_sizes = np.bincount(self.assignments, minlength=len(self.centroids))
+        self.list_offsets = np.concatenate(([0], np.cumsum(list_sizes)))
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, n_lists: int = None, iterations: int = 10,
+              sample_size: int = 100000, n_probe: int = DEFAULT_N_PROBE, seed: int = 0,
+              model_fingerprint: str = "") -> "IVFIndex":
+        """
+        Train k-means centroids on a sample of the vectors and assign every row to a cell.
+
+        Args:
+            vectors (np.ndarray): (N, dimensions) catalog vectors.
+            n_lists (int): Number of cells. Default is about sqrt(N).
+            iterations (int): Number of k-means iterations.
+            sample_size (int): Maximum number of vectors used to train the centroids.
+            n_probe (int): Default number of cells scanned per query.
+            seed (int): Seed for sampling and centroid initialisation.
+            model_fingerprint (str): Fingerprint of the model that produced the vectors.
+
+        Returns:
+            IVFIndex: The built index.
+
+        Example:
+            index = IVFIndex.build(vectors, n_lists=1024)
+        """
+
+        rng = np.random.default_rng(seed)
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        sample_rows = rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)
+        sample = np.asarray(vectors[np.sort(sample_rows)], dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            sample_assignments = nearest_centroids(sample, centroids)
+            counts = np.bincount(sample_assignments, minlength=n_lists)
+            sums = np.stack([np.bincount(sample_assignments, weights=sample[:, dimension], minlength=n_lists)
+                             for dimension in range(sample.shape[1])], axis=1)
+            filled = counts > 0
+            centroids[filled] = (sums[filled] / counts[filled, np.newaxis]).astype(np.float32)
+            # move empty cells onto random sample points
+            empty_count = int(np.count_nonzero(~filled))
+            if empty_count:
+                centroids[~filled] = sample[rng.choice(len(sample), empty_count, replace=False)]
+
+        return cls(centroids, nearest_centroids(vectors, centroids), n_probe, model_fingerprint)
+
+    def add(self, vectors: np.ndarray) -> None:
+        """
+        Append rows to the index, assigning each to its nearest existing centroid.
+
+        Args:
+            vectors (np.ndarray): (M, dimensions) vectors of the new rows.
+
+        Returns:
+            None
+        """
+
+        self.assignments = np.concatenate((self.assignments, nearest_centroids(vectors, self.centroids)))
+        self._build_lists()
+
+    def candidate_rows(self, query_vector, n_probe: int = None) -> np.ndarray:
+        """
+        Return the catalog rows in the n_probe cells closest to a query.
+
+        Args:
+            query_vector (List[float]): Query vector.
+            n_probe (int): Number of cells to scan. Default is the index's n_probe.
+
+        Returns:
+            np.ndarray: Row indices to score exactly.
+        """
+
+        if n_probe is None:
+            n_probe = self.n_probe
+        n_probe = min(max(n_probe, 1), len(self.centroids))
+        query = np.asarray(query_vector, dtype=np.float32)
+        centroid_distances = np.einsum('ij,ij->i', self.centroids, self.centroids) - 2.0 * (self.centroids @ query)
+        probed_lists = np.argpartition(centroid_distances, n_probe - 1)[:n_probe]
+        return np.concatenate([self.list_rows[self.list_offsets[cell]:self.list_offsets[cell + 1]]
+                               for cell in probed_lists])
+
+    def save(self, index_path: str) -> None:
+        """
+        Write the index to an .npz file.
+
+        Args:
+            index_path (str): Path of the .npz file.
+
+        Returns:
+            None
+        """
+
+        temp_path = index_path + ".tmp.npz"
+        np.savez(temp_path, centroids=self.centroids, assignments=self.assignments,
+                 n_probe=np.array(self.n_probe), model_fingerprint=np.array(self.model_fingerprint))
+        os.replace(temp_path, index_path)
+
+    @classmethod
+    def load(cls, index_path: str) -> "IVFIndex":
+        """
+        Read an index written by save.
+
+        Args:
+            index_path (str): Path of the .npz file.
+
+        Returns:
+            IVFIndex: The loaded index; model_fingerprint is empty for indexes
+                saved before it was recorded.
+        """
+
+        with np.load(index_path) as index_arrays:
+            model_fingerprint = str(index_arrays["model_fingerprint"]) if "model_fingerprint" in index_arrays else ""
+            return cls(index_arrays["centroids"], index_arrays["assignments"], int(index_arrays["n_probe"]),
+                       model_fingerprint)
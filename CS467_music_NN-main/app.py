@@ -4,13 +4,94 @@
 # GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
 # Description: Flask app.py for web-based GUI
 
-from flask import Flask, render_template, request
-from genre_prediction import predict_genre
-from music_file_conversion import youtube_get_audio
+from flask import Flask, render_template, request, redirect, url_for, jsonify
+import genre_prediction as gp
+from genre_prediction import predict_genre, model_registry
+from music_file_conversion import youtube_get_audio, youtube_video_id
+from prediction_cache import PredictionCache, prediction_cache_key
+from job_queue import JobQueue, QueueFullError
 import os
+import hashlib
+import shutil
+import tempfile
 
 app = Flask(__name__)
 
+# genre results shared by all workers through the local disk
+prediction_cache = PredictionCache()
+
+# seconds a client is asked to wait before retrying when the queue is full
+QUEUE_FULL_RETRY_SECONDS = 5
+# top-1 probability at which a web prediction stops after a prefix of the window
+CONFIDENCE_THRESHOLD = gp.EARLY_EXIT_CONFIDENCE
+
+
+def fetch_audio(source: dict):
+    """
+    Return the audio of a job: the uploaded bytes, or the path of a YouTube download.
+
+    Args:
+        source (dict): Job source with a 'kind' of 'upload' (with 'audio' bytes) or
+            'youtube' (with 'url' and 'scratch_dir').
+
+    Returns:
+        Union[bytes, str]: The uploaded file contents, or the path to the downloaded audio.
+
+    Example:
+        audio_path = fetch_audio({"kind": "youtube", "url": url})
+    """
+
+    if source["kind"] == "youtube":
+        # each job downloads into its own scratch directory
+        download_name = os.path.join(source["scratch_dir"], "youtube")
+        youtube_get_audio(source["url"], download_name)
+        return download_name + ".mp3"
+    return source["audio"]
+
+
+def predict_job(audio_file_array) -> dict:
+    """
+    Run the model on a job's spectrogram.
+
+    Only the top genres are shown, so the prediction stops after a prefix of the
+    window when the model is confident (see genre_prediction.run_model_progressive).
+
+    Args:
+        audio_file_array (np.ndarray): Spectrogram from process_audio_file.
+
+    Returns:
+        dict: {"result_list": genre predictions, "cache_hit": False}
+    """
+
+    result_list = gp.predict_features(audio_file_array, confidence_threshold=CONFIDENCE_THRESHOLD)
+    return {"result_list": result_list, "cache_hit": False}
+
+
+def finish_job(source: dict, audio_path: str, job_result) -> None:
+    """
+    Cache a finished job's result and remove its scratch directory, if it has one.
+
+    The job queue calls this on success and on every failure path, so no
+    temporary audio is left behind.
+
+    Args:
+        source (dict): Job source, including its 'cache_key' and 'model_version'.
+        audio_path: Audio returned by fetch_audio, or None if fetching failed.
+        job_result (dict): Result of predict_job, or None if the job failed.
+
+    Returns:
+        None
+    """
+
+    if job_result is not None:
+        prediction_cache.put(source["cache_key"], job_result["result_list"], source["model_version"])
+    if "scratch_dir" in source:
+        shutil.rmtree(source["scratch_dir"], ignore_errors=True)
+
+
+# downloads on threads, featurization in worker processes, inference on one thread
+job_queue = JobQueue(fetch_audio, gp.process_audio_file, predict_job, finish_job)
+
 
 # function to determine the genre of the uploaded song or YouTube URL
 def determine_genre(input_path_or_url: str) -> list:
@@ -46,36 +127,36 @@ def index():
     return render_template('index.html')
 
 
-@app.route('/upload', methods=['POST'])
-def upload():
+def submit_job():
     """
-    Handle file upload or YouTube URL input and determine the genre.
+    Queue a prediction for the uploaded song or YouTube URL in the current request.
+
+    The prediction cache is checked first, by upload content digest or YouTube
+    video ID and the early-exit threshold, and a hit is recorded as an already
+    finished job.
 
     Returns:
-        str: Rendered HTML content with the result list.
+        tuple: (job ID, None) on success, or (None, (error message, HTTP status)).
 
     Example:
-        return upload()
+        job_id, error = submit_job()
     """
 
-    result_list = []
+    model_version = model_registry.model_version()
 
     if 'song' in request.files:
         # file upload
         song = request.files['song']
 
         if song.filename == '':
-            return render_template('error.html', error_message="No file selected for upload")
+            return None, ("No file selected for upload", 400)
 
-        # save uploaded file to temp location
-        upload_path = f"temp_{song.filename}"
-        song.save(upload_path)
-
-        # use the uploaded file path in the determine_genre function
-        result_list = determine_genre(upload_path)
-
-        # remove temp file
-        os.remove(upload_path)
+        # uploads are decoded from memory in the worker, never written to disk;
+        # repeat uploads of the same content are answered from the cache
+        audio_bytes = song.read()
+        source = {"kind": "upload", "audio": audio_bytes,
+                  "cache_key": prediction_cache_key(f"upload:{hashlib.sha256(audio_bytes).hexdigest()}",
+                                                    CONFIDENCE_THRESHOLD)}
 
     elif 'url' in request.form:
         # YouTube URL input
@@ -83,14 +164,160 @@ def upload():
 
         # make sure this isn't breaking the file upload and results in errors later
         if not url:
-            return render_template('error.html', error_message="No URL provided")
+            return None, ("No URL provided", 400)
+
+        # the same video is only downloaded once while its result is cached
+        source = {"kind": "youtube", "url": url,
+                  "cache_key": prediction_cache_key(f"youtube:{youtube_video_id(url)}", CONFIDENCE_THRESHOLD)}
+
+    else:
+        return None, ("No file or URL provided", 400)
+
+    result_list = prediction_cache.get(source["cache_key"], model_version)
+    if result_list is not None:
+        return job_queue.add_finished({"result_list": result_list, "cache_hit": True}), None
+
+    source["model_version"] = model_version
+    if source["kind"] == "youtube":
+        # private scratch space per download, so concurrent requests never share a file name
+        source["scratch_dir"] = tempfile.mkdtemp(prefix="genre_job_")
+    try:
+        return job_queue.submit(source), None
+    except QueueFullError:
+        if "scratch_dir" in source:
+            shutil.rmtree(source["scratch_dir"], ignore_errors=True)
+        return None, ("The server is busy, please try again shortly", 429)
+
+
+@app.route('/upload', methods=['POST'])
+def upload():
+    """
+    Handle file upload or YouTube URL input from the HTML forms.
+
+    The prediction is queued and the browser is redirected to the job's result
+    page, which refreshes itself until the job finishes. A full queue is
+    answered with 429 and a Retry-After header.
 
-        # use the process_youtube_url function
-        youtube_get_audio(url)
-        result_list = determine_genre("temp_file_youtube.mp3")
-        os.remove("temp_file_youtube.mp3")
+    Returns:
+        Response: Redirect to the result page, or the rendered error page.
+
+    Example:
+        return upload()
+    """
+
+    job_id, error = submit_job()
+    if error is not None:
+        error_message, status_code = error
+        response = app.make_response((render_template('error.html', error_message=error_message),
+                                      status_code))
+        if status_code == 429:
+            response.headers['Retry-After'] = str(QUEUE_FULL_RETRY_SECONDS)
+        return response
+    return redirect(url_for('job_result', job_id=job_id), code=303)
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Queue a prediction and return its job ID at once, as JSON.
+
+    Accepts the same 'song' file or 'url' form field as /upload.
+
+    Returns:
+        Response: 202 with {"job_id", "status"}, 400 for bad input, or 429 with a
+            Retry-After header when the queue is full.
+
+    Example:
+        curl -F song=@song.mp3 http://localhost:5000/jobs
+    """
+
+    job_id, error = submit_job()
+    if error is not None:
+        error_message, status_code = error
+        response = app.make_response((jsonify({"error": error_message}), status_code))
+        if status_code == 429:
+            response.headers['Retry-After'] = str(QUEUE_FULL_RETRY_SECONDS)
+        return response
+    return jsonify({"job_id": job_id, "status": job_queue.status(job_id)["status"]}), 202
+
+
+def job_response(job_id: str):
+    """
+    Look up a job and split its result into the JSON fields returned to clients.
+
+    Args:
+        job_id (str): ID returned by submit_job.
+
+    Returns:
+        Union[dict, None]: The job's public fields, or None if it is unknown or expired.
+    """
+
+    job = job_queue.status(job_id)
+    if job is None:
+        return None
+    job_fields = {"job_id": job_id, "status": job["status"], "stage_seconds": job["stage_seconds"]}
+    if job["status"] == "done":
+        job_fields.update(job["result"])
+    elif job["status"] == "failed":
+        job_fields["error"] = job["error"]
+    return job_fields
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id: str):
+    """
+    Return a job's status, and its result once it is done, as JSON.
+
+    Args:
+        job_id (str): ID returned by /jobs.
+
+    Returns:
+        Response: The job fields, or 404 for unknown or expired jobs.
+    """
+
+    job_fields = job_response(job_id)
+    if job_fields is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job_fields)
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id: str):
+    """
+    Render a job's result page, or a page that refreshes until the job is done.
+
+    Args:
+        job_id (str): ID returned by /upload or /jobs.
+
+    Returns:
+        Response: Rendered HTML content, with an X-Prediction-Cache header once done.
+    """
+
+    job_fields = job_response(job_id)
+    if job_fields is None:
+        return render_template('error.html', error_message="Unknown or expired job"), 404
+    if job_fields["status"] == "failed":
+        return render_template('error.html', error_message=f"Prediction failed: {job_fields['error']}"), 500
+    if job_fields["status"] != "done":
+        return render_template('job_status.html', job_id=job_id, status=job_fields["status"]), 202
+
+    response = app.make_response(render_template('results.html', result_list=job_fields["result_list"],
+                                                 cache_hit=job_fields["cache_hit"]))
+    response.headers['X-Prediction-Cache'] = 'hit' if job_fields["cache_hit"] else 'miss'
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Return job queue, prediction cache and model timing metrics as JSON.
+
+    Returns:
+        Response: {"job_queue": ..., "prediction_cache": ..., "model": ...}
+    """
 
-    return render_template('results.html', result_list=result_list)
+    return jsonify({"job_queue": job_queue.metrics(), "prediction_cache": prediction_cache.stats(),
+                    "model": model_registry.timing_stats()})
 
 
 if __name__ == '__main__':
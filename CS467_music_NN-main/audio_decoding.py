@@ -0,0 +1,560 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Decodes only the analysed window of an audio file, path, bytes or stream
+
+import io
+import os
+import json
+import subprocess
+import numpy as np
+import soundfile
+import librosa
+
+# sample rate the spectrograms are computed at, and the resampler used to get there;
+# soxr's medium quality mode is faster than librosa's default soxr_hq and only moves
+# the top two mel bands (see feature_extraction.benchmark_resamplers)
+DEFAULT_SAMPLE_RATE = 22050
+RESAMPLE_TYPE = "soxr_mq"
+
+# MPEG audio tables, indexed by the header's version field (3: MPEG-1, 2: MPEG-2, 0: MPEG-2.5)
+MPEG_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+MPEG1_LAYER3_KBPS = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+MPEG2_LAYER3_KBPS = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+# bytes searched for the first frame after any ID3v2 tag
+MP3_SYNC_SEARCH_BYTES = 64 * 1024
+# frames decoded before a window so the decoder's output has settled; the bit
+# reservoir also lets a frame use up to 511 bytes of the frames before it
+MP3_PREROLL_FRAMES = 12
+MP3_RESERVOIR_BYTES = 512
+# delay of the standard MP3 decoder's filterbank, in samples
+MP3_DECODER_DELAY = 529
+# encoder names of the LAME extension whose delay and padding gapless decoders apply
+MP3_GAPLESS_ENCODERS = (b"LAME", b"Lavf", b"Lavc")
+# window starts checked by mp3_window_parity, in seconds
+MP3_PARITY_OFFSETS = (0.0, 0.5, 1.0, 7.3, 30.0, 100.0)
+
+
+def audio_source(audio):
+    """
+    Normalise the accepted audio inputs to something soundfile can open.
+
+    Args:
+        audio: A file path, the encoded file as bytes, or a readable binary file-like object.
+
+    Returns:
+        Union[str, io.IOBase]: The path, or a seekable file-like object positioned at the start.
+
+    Example:
+        source = audio_source(request.files['song'].read())
+    """
+
+    if isinstance(audio, (str, os.PathLike)):
+        return os.fspath(audio)
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return io.BytesIO(audio)
+    if not audio.seekable():
+        # soundfile needs to seek, so buffer one-way streams in memory
+        return io.BytesIO(audio.read())
+    audio.seek(0)
+    return audio
+
+
+def window_start(song_length: float, window_offset) -> float:
+    """
+    Resolve a window offset, which may depend on the song length, to a start time.
+
+    Args:
+        song_length (float): Duration of the audio in seconds.
+        window_offset: Start time in seconds, or a function of song_length returning one.
+
+    Returns:
+        float: Start time of the window in seconds.
+    """
+
+    if callable(window_offset):
+        return float(window_offset(song_length))
+    return float(window_offset or 0.0)
+
+
+def decode_window(audio, duration: float = 30.0, window_offset=0.0, sr: int = DEFAULT_SAMPLE_RATE,
+                  res_type: str = RESAMPLE_TYPE) -> tuple:
+    """
+    Decode one window of an audio file to mono float32 samples at the given rate.
+
+    Each decoder reads the duration from metadata and seeks before decoding, so
+    only the window is decoded:
+        1. MP3 files use a frame index: the frame headers are scanned without
+           decoding, and only the frames covering the window (plus a short
+           pre-roll) are decoded. This is sample accurate, unlike libsndfile's
+           own MP3 seeking.
+        2. soundfile (WAV, FLAC, OGG, and MP3 with libsndfile 1.1 or newer).
+        3. For paths, ffprobe for the duration and ffmpeg input seeking (-ss),
+           which uses the container's index, e.g. for M4A/AAC.
+    Only when none of these apply is the whole file decoded: librosa.load for
+    paths, or an ffmpeg pipe for bytes and streams. Nothing is written to disk.
+
+    Args:
+        audio: A file path, the encoded file as bytes, or a readable binary file-like object.
+        duration (float): Length of the window in seconds.
+        window_offset: Start time in seconds, or a function of the song length returning one.
+        sr (int): Sample rate of the returned samples, or None to keep the file's
+            own rate (for paths, or formats the seekable decoders can read).
+        res_type (str): librosa resampler used when the file is at another rate.
+
+    Returns:
+        tuple: (samples as a 1-D float32 array, sample rate).
+
+    Example:
+        y, sr = decode_window(audio_bytes, 30.0, lambda length: length // 2 if length > 65.0 else 0)
+    """
+
+    source = audio_source(audio)
+    decoded = None
+    if starts_like_mp3(source):
+        decoded = mp3_decode_window(source, duration, window_offset)
+    if decoded is None:
+        decoded = soundfile_decode_window(source, duration, window_offset)
+    if decoded is None and isinstance(source, str):
+        decoded = ffmpeg_seek_decode_window(source, duration, window_offset)
+    if decoded is None:
+        # no seekable decoder could read it, so decode everything
+        if isinstance(source, str):
+            song_length = librosa.get_duration(path=source)
+            return librosa.load(source, sr=sr, offset=window_start(song_length, window_offset),
+                                duration=duration, res_type=res_type)
+        source.seek(0)
+        return ffmpeg_decode_window(source.read(), duration, window_offset, sr)
+
+    # files already at sr are never resampled
+    y, native_sr = decoded
+    if sr is None:
+        sr = native_sr
+    elif native_sr != sr:
+        y = librosa.resample(y, orig_sr=native_sr, target_sr=sr, res_type=res_type)
+    return y.astype(np.float32, copy=False), sr
+
+
+def soundfile_decode_window(source, duration: float, window_offset):
+    """
+    Decode a window with libsndfile, seeking straight to its first frame.
+
+    Args:
+        source: Path or seekable file-like object from audio_source.
+        duration (float): Length of the window in seconds.
+        window_offset: Start time in seconds, or a function of the song length returning one.
+
+    Returns:
+        Union[tuple, None]: (mono float32 samples, native sample rate), or None if
+            libsndfile cannot read the format.
+    """
+
+    try:
+        with soundfile.SoundFile(source) as sound_file:
+            native_sr = sound_file.samplerate
+            start_time = window_start(sound_file.frames / native_sr, window_offset)
+            sound_file.seek(min(int(start_time * native_sr), sound_file.frames))
+            samples = sound_file.read(int(duration * native_sr), dtype='float32', always_2d=True)
+    except RuntimeError:
+        # libsndfile cannot read this format
+        if not isinstance(source, str):
+            source.seek(0)
+        return None
+    # same down-mix as librosa.load
+    return samples.mean(axis=1), native_sr
+
+
+def mp3_frame_header(header: int):
+    """
+    Parse a 4-byte MPEG audio Layer III frame header.
+
+    Args:
+        header (int): The header as a big-endian integer.
+
+    Returns:
+        Union[tuple, None]: (frame length in bytes, sample rate, samples per frame),
+            or None if it is not a valid Layer III header.
+    """
+
+    if header >> 21 != 0x7FF:
+        return None
+    version = (header >> 19) & 3
+    layer = (header >> 17) & 3
+    bitrate_index = (header >> 12) & 15
+    rate_index = (header >> 10) & 3
+    padding = (header >> 9) & 1
+    # version 1 is reserved; layer 1 is Layer III; bitrate 0 is free format
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    sample_rate = MPEG_SAMPLE_RATES[version][rate_index]
+    if version == 3:
+        bitrate = MPEG1_LAYER3_KBPS[bitrate_index] * 1000
+        return 144 * bitrate // sample_rate + padding, sample_rate, 1152
+    bitrate = MPEG2_LAYER3_KBPS[bitrate_index] * 1000
+    return 72 * bitrate // sample_rate + padding, sample_rate, 576
+
+
+def starts_like_mp3(source) -> bool:
+    """
+    Check whether audio starts with an ID3v2 tag or an MPEG Layer III frame header.
+
+    Args:
+        source: Path or seekable file-like object from audio_source.
+
+    Returns:
+        bool: True if the audio looks like an MP3 file.
+    """
+
+    if isinstance(source, str):
+        with open(source, "rb") as input_file:
+            leading_bytes = input_file.read(4)
+    else:
+        leading_bytes = source.read(4)
+        source.seek(0)
+    if leading_bytes[:3] == b"ID3":
+        return True
+    return len(leading_bytes) == 4 and mp3_frame_header(int.from_bytes(leading_bytes, "big")) is not None
+
+
+def mp3_frame_index(data: bytes):
+    """
+    Index the audio frames of an MP3 file from their headers, without decoding.
+
+    A leading Xing/Info frame is kept apart from the audio frames, as decoders
+    do, and the LAME encoder delay and padding are read from it so positions
+    line up with a full gapless decode.
+
+    Args:
+        data (bytes): The encoded MP3 file.
+
+    Returns:
+        Union[dict, None]: 'frame_offsets' (byte offset of each audio frame followed
+            by the end offset), 'samples_per_frame', 'sample_rate', 'info_frame'
+            (the Xing/Info frame bytes, or b""), and 'skipped_samples' and
+            'padding_samples' that a gapless decoder drops at the start and end.
+            None if the data is not a constant sample rate Layer III stream.
+    """
+
+    position = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        # ID3v2 size is a 28-bit syncsafe integer, plus an optional 10 byte footer
+        tag_size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+        position = 10 + tag_size + (10 if data[5] & 0x10 else 0)
+
+    # find the first header whose following frame also starts with a valid header
+    search_end = min(len(data) - 4, position + MP3_SYNC_SEARCH_BYTES)
+    first_frame = None
+    position = data.find(b"\xff", position, search_end)
+    while position >= 0:
+        frame = mp3_frame_header(int.from_bytes(data[position:position + 4], "big"))
+        if frame is not None:
+            next_header = data[position + frame[0]:position + frame[0] + 4]
+            if len(next_header) == 4 and mp3_frame_header(int.from_bytes(next_header, "big")) is not None:
+                first_frame = frame
+                break
+        position = data.find(b"\xff", position + 1, search_end)
+    if first_frame is None:
+        return None
+
+    _, sample_rate, samples_per_frame = first_frame
+    frame_offsets = []
+    while position + 4 <= len(data):
+        frame = mp3_frame_header(int.from_bytes(data[position:position + 4], "big"))
+        if frame is None or frame[1] != sample_rate or frame[2] != samples_per_frame:
+            # trailing ID3v1/APE tags or garbage end the stream
+            break
+        frame_offsets.append(position)
+        position += frame[0]
+    frame_offsets.append(min(position, len(data)))
+
+    frame_index = {"samples_per_frame": samples_per_frame, "sample_rate": sample_rate, "info_frame": b"",
+                   "skipped_samples": 0, "padding_samples": 0}
+    first_frame_bytes = data[frame_offsets[0]:frame_offsets[1]]
+    for tag_name in (b"Xing", b"Info"):
+        tag_position = first_frame_bytes.find(tag_name)
+        if tag_position >= 0:
+            frame_index["info_frame"] = first_frame_bytes
+            frame_offsets = frame_offsets[1:]
+            # the LAME extension follows whichever of the frame count, byte count,
+            # seek table and quality fields the flags say are present
+            flags = int.from_bytes(first_frame_bytes[tag_position + 4:tag_position + 8], "big")
+            lame_position = (tag_position + 8 + (4 if flags & 0x1 else 0) + (4 if flags & 0x2 else 0)
+                             + (100 if flags & 0x4 else 0) + (4 if flags & 0x8 else 0))
+            # it stores the 12-bit encoder delay and padding 21 bytes after the encoder name
+            gapless_bytes = first_frame_bytes[lame_position + 21:lame_position + 24]
+            if first_frame_bytes[lame_position:lame_position + 4] in MP3_GAPLESS_ENCODERS and len(gapless_bytes) == 3:
+                frame_index["skipped_samples"] = (gapless_bytes[0] << 4 | gapless_bytes[1] >> 4) + MP3_DECODER_DELAY
+                frame_index["padding_samples"] = max(((gapless_bytes[1] & 0x0F) << 8 | gapless_bytes[2])
+                                                     - MP3_DECODER_DELAY, 0)
+            break
+    if len(frame_offsets) < 2:
+        return None
+    frame_index["frame_offsets"] = np.array(frame_offsets, dtype=np.int64)
+    return frame_index
+
+
+def mp3_info_frame_for_slice(info_frame: bytes, slice_bytes: int) -> bytes:
+    """
+    Copy a Xing/Info frame with its stream byte count set to that of a slice of frames.
+
+    The frame count is left as it is, so decoders still treat the slice as part
+    of a longer VBR stream, but they no longer warn that the sizes disagree.
+
+    Args:
+        info_frame (bytes): The Xing/Info frame from mp3_frame_index, or b"".
+        slice_bytes (int): Size of the frames that follow it.
+
+    Returns:
+        bytes: The patched frame.
+    """
+
+    for tag_name in (b"Xing", b"Info"):
+        tag_position = info_frame.find(tag_name)
+        if tag_position >= 0:
+            flags = int.from_bytes(info_frame[tag_position + 4:tag_position + 8], "big")
+            if flags & 0x2:
+                # the optional frame count comes first, then the byte count
+                bytes_position = tag_position + 8 + (4 if flags & 0x1 else 0)
+                return (info_frame[:bytes_position] + (len(info_frame) + slice_bytes).to_bytes(4, "big")
+                        + info_frame[bytes_position + 4:])
+    return info_frame
+
+
+def mp3_decode_window(source, duration: float, window_offset):
+    """
+    Decode a window of an MP3 file by decoding only the frames that cover it.
+
+    The frames are sliced out by byte offset from mp3_frame_index, starting a few
+    frames early so the bit reservoir and decoder filterbank are primed, behind
+    the file's Xing/Info frame so the decoder knows the stream is VBR. Decoders
+    may trim the encoder delay or drop pre-roll frames at the start of the slice,
+    so the window is located from the number of samples that actually came out.
+    If that number is not explained by whole dropped frames plus, at most, the
+    delay read from the LAME extension, the window cannot be placed exactly and
+    None is returned so decode_window falls back to soundfile's seek.
+
+    Args:
+        source: Path or seekable file-like object from audio_source.
+        duration (float): Length of the window in seconds.
+        window_offset: Start time in seconds, or a function of the song length returning one.
+
+    Returns:
+        Union[tuple, None]: (mono float32 samples, native sample rate), or None if
+            the source is not an MP3 stream, no decoder could read the slice, or the
+            samples trimmed by the decoder do not match the file's gapless header.
+    """
+
+    if isinstance(source, str):
+        with open(source, "rb") as input_file:
+            data = input_file.read()
+    else:
+        source.seek(0)
+        data = source.read()
+        source.seek(0)
+    frame_index = mp3_frame_index(data)
+    if frame_index is None:
+        return None
+    frame_offsets = frame_index["frame_offsets"]
+    samples_per_frame = frame_index["samples_per_frame"]
+    native_sr = frame_index["sample_rate"]
+    skipped_samples = frame_index["skipped_samples"]
+    frame_count = len(frame_offsets) - 1
+
+    # positions on the raw frame grid; a gapless decoder drops skipped_samples first
+    # and padding_samples last, so the song length is that of a full decode
+    song_length = (frame_count * samples_per_frame - skipped_samples - frame_index["padding_samples"]) / native_sr
+    window_first_sample = int(window_start(song_length, window_offset) * native_sr) + skipped_samples
+    window_samples = int(duration * native_sr)
+    first_frame = min(window_first_sample // samples_per_frame, frame_count)
+    # one spare frame at the end covers the decoder delay
+    end_frame = min(-(-(window_first_sample + window_samples) // samples_per_frame) + 1, frame_count)
+    preroll_frame = first_frame
+    while preroll_frame > 0 and (first_frame - preroll_frame < MP3_PREROLL_FRAMES or
+                                 frame_offsets[first_frame] - frame_offsets[preroll_frame] < MP3_RESERVOIR_BYTES):
+        preroll_frame -= 1
+
+    frame_slice = data[frame_offsets[preroll_frame]:frame_offsets[end_frame]]
+    frame_slice = mp3_info_frame_for_slice(frame_index["info_frame"], len(frame_slice)) + frame_slice
+    try:
+        samples, _ = soundfile.read(io.BytesIO(frame_slice), dtype='float32', always_2d=True)
+        samples = samples.mean(axis=1)
+    except RuntimeError:
+        try:
+            samples, _ = ffmpeg_decode_window(frame_slice, duration=None, sr=native_sr)
+        except (OSError, ValueError):
+            return None
+
+    # samples missing from the slice were trimmed (encoder delay) or dropped at its
+    # start, except that a decoder that ran from the first frame to the last also
+    # trims the gapless padding at the end
+    missing_samples = (end_frame - preroll_frame) * samples_per_frame - len(samples)
+    if end_frame == frame_count and missing_samples - frame_index["padding_samples"] == skipped_samples:
+        missing_samples = skipped_samples
+    # a decoder trims either nothing or the delay from the LAME extension, and
+    # whole frames it could not decode; anything else would misplace the window
+    if missing_samples < 0 or (missing_samples % samples_per_frame and
+                               (missing_samples - skipped_samples) % samples_per_frame):
+        return None
+    slice_first_sample = preroll_frame * samples_per_frame + missing_samples
+    start_in_slice = max(window_first_sample - slice_first_sample, 0)
+    # the window never runs into the encoder padding after the last real sample
+    stop_in_slice = min(start_in_slice + window_samples,
+                        frame_count * samples_per_frame - frame_index["padding_samples"] - slice_first_sample)
+    return samples[start_in_slice:stop_in_slice], native_sr
+
+
+def mp3_window_parity(audio_path: str, offsets: tuple = MP3_PARITY_OFFSETS, duration: float = 30.0) -> dict:
+    """
+    Compare windows from mp3_decode_window with the same slices of a full decode.
+
+    The full decode is soundfile.read of the whole file, which is what
+    librosa.load uses for MP3 and so what the training spectrograms come from.
+
+    Args:
+        audio_path (str): Path to an MP3 file.
+        offsets (tuple): Window start times in seconds.
+        duration (float): Length of each window in seconds.
+
+    Returns:
+        dict: Offset to the largest absolute sample difference, or None where
+            mp3_decode_window declined the window or returned a different length.
+
+    Example:
+        print(mp3_window_parity("sample_songs/disturbed_ten_thousand_fists.mp3"))
+    """
+
+    full_decode, native_sr = soundfile.read(audio_path, dtype='float32', always_2d=True)
+    full_decode = full_decode.mean(axis=1)
+    differences = {}
+    for offset in offsets:
+        decoded = mp3_decode_window(audio_path, duration, offset)
+        start_sample = int(offset * native_sr)
+        expected = full_decode[start_sample:start_sample + int(duration * native_sr)]
+        if decoded is None or decoded[1] != native_sr or len(decoded[0]) != len(expected):
+            differences[offset] = None
+        else:
+            differences[offset] = float(np.abs(decoded[0] - expected).max()) if len(expected) else 0.0
+    return differences
+
+
+def ffmpeg_seek_decode_window(audio_path: str, duration: float, window_offset):
+    """
+    Decode a window of a file with ffmpeg, seeking with the container's index.
+
+    Args:
+        audio_path (str): Path to the audio file.
+        duration (float): Length of the window in seconds.
+        window_offset: Start time in seconds, or a function of the song length returning one.
+
+    Returns:
+        Union[tuple, None]: (mono float32 samples, native sample rate), or None if
+            ffmpeg is not installed or cannot read the file.
+    """
+
+    probe_command = ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries",
+                     "stream=sample_rate:format=duration", "-of", "json", audio_path]
+    try:
+        probe = subprocess.run(probe_command, capture_output=True)
+        probe_fields = json.loads(probe.stdout or b"{}")
+        native_sr = int(probe_fields["streams"][0]["sample_rate"])
+        song_length = float(probe_fields["format"]["duration"])
+    except (OSError, ValueError, KeyError, IndexError):
+        return None
+
+    start_time = window_start(song_length, window_offset)
+    # -ss before -i seeks in the input instead of decoding up to the offset
+    decode_command = ["ffmpeg", "-v", "error", "-ss", str(start_time), "-t", str(duration), "-i", audio_path,
+                      "-f", "f32le", "-ac", "1", "pipe:1"]
+    try:
+        completed = subprocess.run(decode_command, capture_output=True)
+    except OSError:
+        return None
+    if completed.returncode != 0:
+        return None
+    return np.frombuffer(completed.stdout, dtype=np.float32), native_sr
+
+
+def wav_stream_samples(wav_bytes: bytes) -> tuple:
+    """
+    Read the samples and rate of a 32-bit float WAV stream written to a pipe.
+
+    ffmpeg cannot go back to fill in the chunk sizes when writing to a pipe, so
+    the data chunk is taken to run to the end of the stream.
+
+    Args:
+        wav_bytes (bytes): The WAV stream, mono float32 samples.
+
+    Returns:
+        tuple: (samples as a 1-D float32 array, sample rate).
+
+    Raises:
+        ValueError: If the stream has no fmt or data chunk.
+    """
+
+    sample_rate = None
+    position = 12
+    while position + 8 <= len(wav_bytes):
+        chunk_id = wav_bytes[position:position + 4]
+        chunk_size = int.from_bytes(wav_bytes[position + 4:position + 8], "little")
+        if chunk_id == b"fmt ":
+            sample_rate = int.from_bytes(wav_bytes[position + 12:position + 16], "little")
+        elif chunk_id == b"data":
+            if sample_rate is None:
+                break
+            data = wav_bytes[position + 8:]
+            return np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32), sample_rate
+        position += 8 + chunk_size + chunk_size % 2
+    raise ValueError("ffmpeg did not write a readable WAV stream")
+
+
+def ffmpeg_decode_window(audio_bytes: bytes, duration: float = 30.0, window_offset=0.0,
+                         sr: int = DEFAULT_SAMPLE_RATE) -> tuple:
+    """
+    Decode encoded audio held in memory through an ffmpeg pipe, then cut out the window.
+
+    Used for formats libsndfile cannot read. The whole stream is decoded, since
+    a pipe cannot seek, but nothing is written to disk.
+
+    Args:
+        audio_bytes (bytes): The encoded audio file.
+        duration (float): Length of the window in seconds, or None for the rest of the audio.
+        window_offset: Start time in seconds, or a function of the song length returning one.
+        sr (int): Sample rate of the returned samples, or None to keep the audio's own rate.
+
+    Returns:
+        tuple: (mono float32 samples of the window, sample rate).
+
+    Raises:
+        ValueError: If ffmpeg cannot decode the audio.
+    """
+
+    # without a target rate ffmpeg keeps the native one, which only a WAV header reports
+    if sr is None:
+        ffmpeg_command = ["ffmpeg", "-v", "error", "-i", "pipe:0", "-f", "wav", "-acodec", "pcm_f32le",
+                          "-ac", "1", "pipe:1"]
+    else:
+        ffmpeg_command = ["ffmpeg", "-v", "error", "-i", "pipe:0", "-f", "f32le", "-ac", "1",
+                          "-ar", str(sr), "pipe:1"]
+    completed = subprocess.run(ffmpeg_command, input=audio_bytes, capture_output=True)
+    if completed.returncode != 0:
+        raise ValueError(f"ffmpeg could not decode the audio: {completed.stderr.decode(errors='replace')}")
+    if sr is None:
+        y, sr = wav_stream_samples(completed.stdout)
+    else:
+        y = np.frombuffer(completed.stdout, dtype=np.float32)
+    start_sample = int(window_start(len(y) / sr, window_offset) * sr)
+    if duration is None:
+        return y[start_sample:], sr
+    return y[start_sample:start_sample + int(duration * sr)], sr
+
+
+if __name__ == "__main__":
+    # python audio_decoding.py <mp3 files>: check windows against a full decode
+    import sys
+
+    for mp3_path in sys.argv[1:]:
+        print(mp3_path)
+        for window_offset, difference in mp3_window_parity(mp3_path).items():
+            print(f"  {window_offset:6.1f} s: " + ("not decoded by the frame index" if difference is None
+                                                   else f"max sample difference {difference:.2e}"))
@@ -6,55 +6,475 @@
 
 import os
 import sys
-import ast
-import csv
+import json
+import time
+import hashlib
 import numpy as np
-import pandas as pd
 import genre_prediction as gp
+from feature_cache import file_digest
+from ann_index import IVFIndex, ANN_INDEX_FILE, ANN_EMBEDDING_INDEX_FILE, nearest_centroids
+
+# binary catalog layout written by save_catalog
+CATALOG_FORMAT_VERSION = 1
+CATALOG_HEADER_FILE = "catalog_header.json"
+CATALOG_VECTORS_FILE = "vectors.npy"
+CATALOG_TITLES_FILE = "titles.npy"
+CATALOG_EMBEDDINGS_FILE = "embeddings.npy"
+CATALOG_TRACKS_FILE = "tracks.json"
+CATALOG_JOURNAL_FILE = "build_journal.jsonl"
+# fingerprint of catalogs whose model is not known, e.g. migrated CSVs; it never
+# matches a loaded model, so build_recommender_db featurizes their tracks again
+UNKNOWN_MODEL_FINGERPRINT = "unknown"
+
+
+def save_catalog(catalog_dir: str, titles: list, vectors: np.ndarray, model_fingerprint: str,
+                 track_records: list = None, embeddings: np.ndarray = None) -> None:
+    """
+    Write a binary recommender catalog.
+
+    The catalog directory holds:
+        - vectors.npy: float32 (N, dimensions) genre prediction vectors.
+        - titles.npy: fixed-width unicode title of each row.
+        - embeddings.npy: optional float16 (N, 128) CNN embeddings from predict_genres.
+        - tracks.json: optional path, size, mtime and hash of each row's source file.
+        - catalog_header.json: format version, model fingerprint, row count, dimensions
+          and the SHA-256 digest of every other file's contents.
+
+    Each file is replaced on its own, with the header last. A reader can
+    therefore see a header and files from different writes, after a crash or
+    during a concurrent write. load_catalog, load_catalog_embeddings and
+    load_track_records reject any file whose row count or digest does not match
+    the header, so such a catalog is never used.
+
+    Args:
+        catalog_dir (str): Directory the catalog is written to.
+        titles (list): Title of each track.
+        vectors (np.ndarray): Prediction vector of each track.
+        model_fingerprint (str): Fingerprint of the model that produced the vectors.
+        track_records (list): Optional source file record of each row.
+        embeddings (np.ndarray): Optional embedding of each row.
+
+    Returns:
+        None
+
+    Example:
+        save_catalog("content_suggestion/recommender_catalog", titles, vectors, gp.model_registry.fingerprint())
+    """
+
+    os.makedirs(catalog_dir, exist_ok=True)
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(titles), -1)
+    header = {"format_version": CATALOG_FORMAT_VERSION, "model_fingerprint": model_fingerprint,
+              "count": len(titles), "dimensions": int(vectors.shape[1]), "embedding_dimensions": 0,
+              "digests": {}}
+
+    # write each file under a temporary name and move it into place
+    catalog_arrays = [(CATALOG_VECTORS_FILE, vectors), (CATALOG_TITLES_FILE, np.array(titles, dtype=str))]
+    if embeddings is not None:
+        embeddings = np.asarray(embeddings, dtype=np.float16).reshape(len(titles), -1)
+        header["embedding_dimensions"] = int(embeddings.shape[1])
+        catalog_arrays.append((CATALOG_EMBEDDINGS_FILE, embeddings))
+    elif os.path.exists(os.path.join(catalog_dir, CATALOG_EMBEDDINGS_FILE)):
+        os.remove(os.path.join(catalog_dir, CATALOG_EMBEDDINGS_FILE))
+    for catalog_file, catalog_array in catalog_arrays:
+        catalog_array = np.ascontiguousarray(catalog_array)
+        # arrays are digested as loaded, so readers can check the mapped data itself
+        header["digests"][catalog_file] = hashlib.sha256(catalog_array).hexdigest()
+        temp_path = os.path.join(catalog_dir, catalog_file + ".tmp")
+        with open(temp_path, "wb") as output_file:
+            np.save(output_file, catalog_array)
+        os.replace(temp_path, os.path.join(catalog_dir, catalog_file))
+    if track_records is not None:
+        tracks_bytes = json.dumps(track_records).encode()
+        header["digests"][CATALOG_TRACKS_FILE] = hashlib.sha256(tracks_bytes).hexdigest()
+        temp_path = os.path.join(catalog_dir, CATALOG_TRACKS_FILE + ".tmp")
+        with open(temp_path, "wb") as output_file:
+            output_file.write(tracks_bytes)
+        os.replace(temp_path, os.path.join(catalog_dir, CATALOG_TRACKS_FILE))
+    elif os.path.exists(os.path.join(catalog_dir, CATALOG_TRACKS_FILE)):
+        os.remove(os.path.join(catalog_dir, CATALOG_TRACKS_FILE))
+    temp_path = os.path.join(catalog_dir, CATALOG_HEADER_FILE + ".tmp")
+    with open(temp_path, "w") as output_file:
+        json.dump(header, output_file)
+    os.replace(temp_path, os.path.join(catalog_dir, CATALOG_HEADER_FILE))
+
+
+def load_catalog_header(catalog_dir: str) -> dict:
+    """
+    Read the header of a binary recommender catalog.
+
+    Args:
+        catalog_dir (str): Directory written by save_catalog.
+
+    Returns:
+        dict: The header written by save_catalog.
+
+    Raises:
+        ValueError: If the catalog format version is not supported.
+    """
+
+    with open(os.path.join(catalog_dir, CATALOG_HEADER_FILE)) as input_file:
+        header = json.load(input_file)
+    if header.get("format_version") != CATALOG_FORMAT_VERSION:
+        raise ValueError(f'Unsupported catalog format version: {header.get("format_version")}')
+    return header
 
 
-def build_recommender_db(audio_dir: str, file_name: str) -> None:
+def check_catalog_content(catalog_dir: str, header: dict, catalog_file: str, content, row_count: int) -> None:
     """
-    Build a database/csv file containing audio titles and genre predictions.
+    Check that a catalog file read from disk belongs to the same write as the header.
+
+    Catalogs written before digests were added only have their row counts checked.
 
     Args:
-        audio_dir (str): The directory containing audio files.
-        file_name (str): The name of the CSV file to be created.
+        catalog_dir (str): Directory written by save_catalog.
+        header (dict): Header the file is checked against.
+        catalog_file (str): Name of the file, e.g. 'vectors.npy'.
+        content: The loaded array, or the bytes of a JSON file.
+        row_count (int): Number of rows in the content.
 
     Returns:
         None
 
-    Note:
-        - The CSV file will have columns: 'title', 'genre_predictions'.
-        - Genre predictions are obtained using the predict_genre function.
+    Raises:
+        ValueError: If the row count or digest does not match the header.
+    """
+
+    expected_digest = header.get("digests", {}).get(catalog_file)
+    if row_count != header["count"] or (
+            expected_digest is not None and hashlib.sha256(content).hexdigest() != expected_digest):
+        raise ValueError(f"{os.path.join(catalog_dir, catalog_file)} does not match the catalog header; "
+                         "the catalog is being rewritten or its last write was interrupted")
+
+
+def load_catalog(catalog_dir: str) -> tuple[dict, np.ndarray, np.ndarray]:
+    """
+    Open a binary recommender catalog without reading its arrays into memory.
+
+    Args:
+        catalog_dir (str): Directory written by save_catalog.
+
+    Returns:
+        tuple[dict, np.ndarray, np.ndarray]: Header, memory-mapped titles and vectors.
+
+    Raises:
+        ValueError: If the catalog format version is not supported, or the arrays
+            do not match the header.
 
     Example:
-        build_recommender_db("path/to/audio/files", "audio_database.csv")
+        header, titles, vectors = load_catalog("content_suggestion/recommender_catalog")
     """
 
-    if not os.path.exists(audio_dir):
-        print(f'ERROR: {audio_dir} is not a valid directory path')
-        return
+    header = load_catalog_header(catalog_dir)
+    titles = np.load(os.path.join(catalog_dir, CATALOG_TITLES_FILE), mmap_mode='r')
+    vectors = np.load(os.path.join(catalog_dir, CATALOG_VECTORS_FILE), mmap_mode='r')
+    check_catalog_content(catalog_dir, header, CATALOG_TITLES_FILE, titles, len(titles))
+    check_catalog_content(catalog_dir, header, CATALOG_VECTORS_FILE, vectors, len(vectors))
+    return header, titles, vectors
 
-    file_types = ['.mp3', '.wav']
 
-    # create .csv file with column names
-    csv_file_path = f'./{file_name}'
-    column_names = ['title', 'genre_predictions']
+def load_catalog_embeddings(catalog_dir: str, header: dict = None):
+    """
+    Open the memory-mapped embeddings of a catalog, if it has any.
+
+    Args:
+        catalog_dir (str): Directory written by save_catalog.
+        header (dict): Header from load_catalog, so the embeddings are checked against
+            the same write as the vectors. Default reads the header again.
+
+    Returns:
+        Union[np.ndarray, None]: float16 (N, dimensions) embeddings, or None.
+
+    Raises:
+        ValueError: If the embeddings do not match the header.
+
+    Example:
+        embeddings = load_catalog_embeddings("content_suggestion/recommender_catalog", header)
+    """
+
+    if header is None:
+        header = load_catalog_header(catalog_dir)
+    embeddings_path = os.path.join(catalog_dir, CATALOG_EMBEDDINGS_FILE)
+    if not header.get("embedding_dimensions") or not os.path.exists(embeddings_path):
+        return None
+    embeddings = np.load(embeddings_path, mmap_mode='r')
+    check_catalog_content(catalog_dir, header, CATALOG_EMBEDDINGS_FILE, embeddings, len(embeddings))
+    return embeddings
+
+
+def read_csv_catalog(csv_path: str) -> tuple[list, np.ndarray]:
+    """
+    Read the titles and genre prediction vectors of a recommender_csv file.
+
+    Args:
+        csv_path (str): Path to a 'title', 'genre_predictions' CSV.
+
+    Returns:
+        tuple: (list of titles, float32 array of shape (tracks, genres)).
+
+    Example:
+        titles, vectors = read_csv_catalog("content_suggestion/recommender_csv")
+    """
+
+    import pandas as pd
+
+    # parse all '[a,b,...]' strings at once instead of literal_eval per row
+    df = pd.read_csv(csv_path)
+    prediction_text = df['genre_predictions'].str.strip('[]').str.split(',')
+    vectors = np.array(prediction_text.tolist(), dtype=np.float32).reshape(len(df), -1)
+    return df['title'].tolist(), vectors
+
+
+def convert_csv_catalog(csv_path: str, catalog_dir: str,
+                        model_fingerprint: str = UNKNOWN_MODEL_FINGERPRINT) -> int:
+    """
+    Migrate a recommender_csv file to the binary catalog format.
+
+    The CSV does not record which model produced its vectors, so by default the
+    catalog is stamped UNKNOWN_MODEL_FINGERPRINT and the next build_recommender_db
+    run featurizes every track again instead of trusting them.
+
+    Args:
+        csv_path (str): Path to the existing 'title', 'genre_predictions' CSV.
+        catalog_dir (str): Directory the binary catalog is written to.
+        model_fingerprint (str): Fingerprint of the model that produced the CSV; only
+            pass one when that model is known for certain.
+
+    Returns:
+        int: Number of tracks converted.
+
+    Example:
+        convert_csv_catalog("content_suggestion/recommender_csv", "content_suggestion/recommender_catalog")
+    """
+
+    titles, vectors = read_csv_catalog(csv_path)
+    save_catalog(catalog_dir, titles, vectors, model_fingerprint)
+    return len(titles)
+
+
+def load_track_records(catalog_dir: str, header: dict = None) -> list:
+    """
+    Load the per-row track records of a catalog built by build_recommender_db.
+
+    Args:
+        catalog_dir (str): Directory written by save_catalog.
+        header (dict): Header from load_catalog, so the records are checked against
+            the same write as the vectors. Default reads the header again.
+
+    Returns:
+        list: One dict per catalog row with 'path', 'size', 'mtime_ns' and 'sha256',
+            or an empty list if the catalog has no track records (e.g. a converted CSV).
+
+    Raises:
+        ValueError: If the records do not match the header.
+
+    Example:
+        track_records = load_track_records("content_suggestion/recommender_catalog", header)
+    """
+
+    if header is None:
+        header = load_catalog_header(catalog_dir)
+    try:
+        with open(os.path.join(catalog_dir, CATALOG_TRACKS_FILE), "rb") as input_file:
+            tracks_bytes = input_file.read()
+    except FileNotFoundError:
+        return []
+    track_records = json.loads(tracks_bytes)
+    check_catalog_content(catalog_dir, header, CATALOG_TRACKS_FILE, tracks_bytes, len(track_records))
+    return track_records
+
 
-    with open(csv_file_path, 'w', newline='') as csv_file:
-        csv_writer = csv.writer(csv_file)
-        csv_writer.writerow(column_names)
+def build_recommender_db(audio_dir: str, catalog_dir: str, batch_size: int = 32,
+                         with_embeddings: bool = False, window_count: int = 1) -> dict:
+    """
+    Incrementally build or update a binary catalog of audio titles and genre predictions.
+
+    Each catalog row records its track's relative path, size, modification time
+    and content hash. On a re-run only new or changed files are predicted, rows
+    of deleted files are dropped, and files that were only moved or touched reuse
+    their stored vector. Every prediction is appended to a build journal as soon
+    as its batch finishes, so an interrupted build resumes where it stopped.
+    Files that cannot be decoded are journaled as failed and left out of the
+    catalog; a resumed build skips them while they are unchanged, and they are
+    listed when the build finishes.
+    The whole catalog is rebuilt when it was made with a different model.
+    An existing ANN index is updated to match the new rows. With embeddings
+    requested, rows stored without an embedding are predicted again. Each row
+    records how many windows its prediction aggregated, and rows made with a
+    different window_count are predicted again too.
+
+    Args:
+        audio_dir (str): The directory containing audio files, searched recursively.
+        catalog_dir (str): The directory the catalog is written to.
+        batch_size (int): Number of tracks per predict_genres batch.
+        with_embeddings (bool): If True, also store CNN embeddings for embedding search.
+        window_count (int): Maximum number of 30 second windows aggregated per track;
+            offline builds can afford e.g. 8 for more accurate long tracks.
+
+    Returns:
+        dict: Counts of 'unchanged', 'predicted', 'removed' and 'failed' tracks.
+
+    Note:
+        - The catalog is written by save_catalog and stamped with the model fingerprint.
+        - Genre predictions are obtained in batches using the predict_genres function.
+
+    Example:
+        build_recommender_db("path/to/audio/files", "content_suggestion/recommender_catalog")
+    """
 
-        # iterate over audio files and store track name and prediction vector to .csv file
-        for root, sub_dirs, files in os.walk(audio_dir):
+    if not os.path.exists(audio_dir):
+        print(f'ERROR: {audio_dir} is not a valid directory path')
+        return {}
 
-            for track_name in files:
-                track_path = os.path.join(audio_dir, track_name)
-                _, file_extension = os.path.splitext(track_path)
-                if file_extension in file_types:
-                    track_prediction = gp.predict_genre(track_path, return_list=True)
-                    csv_writer.writerow([track_name, f'[{",".join(map(str, track_prediction))}]'])
+    file_types = ['.mp3', '.wav']
+    model_fingerprint = gp.model_registry.fingerprint()
+    journal_path = os.path.join(catalog_dir, CATALOG_JOURNAL_FILE)
+
+    # rows we already know, from the last catalog and from an interrupted build
+    known_tracks = {}
+    # files an interrupted build could not decode, by relative path
+    failed_tracks = {}
+    if os.path.exists(os.path.join(catalog_dir, CATALOG_HEADER_FILE)):
+        try:
+            header, _, vectors = load_catalog(catalog_dir)
+            embeddings = load_catalog_embeddings(catalog_dir, header)
+            previous_records = load_track_records(catalog_dir, header)
+        except ValueError as error:
+            # a catalog cut short by a crash is rebuilt, from the journal where possible
+            print(f'WARNING: {error}; predicting every track again')
+            header, previous_records = {}, []
+        # vectors of an unknown model are never trusted, even when the loaded model cannot be fingerprinted
+        if header.get("model_fingerprint") == model_fingerprint != UNKNOWN_MODEL_FINGERPRINT \
+                and (embeddings is not None or not with_embeddings):
+            for row, track_record in enumerate(previous_records):
+                if track_record.get("windows", 1) != window_count:
+                    continue
+                known_tracks[track_record["path"]] = (track_record, np.array(vectors[row]), row,
+                                                      None if embeddings is None else np.array(embeddings[row]))
+    if os.path.exists(journal_path):
+        with open(journal_path) as journal_file:
+            for journal_line in journal_file:
+                try:
+                    journal_entry = json.loads(journal_line)
+                except ValueError:
+                    # last line of a killed build may be cut short
+                    continue
+                if "error" in journal_entry:
+                    failed_tracks[journal_entry["record"]["path"]] = journal_entry
+                    known_tracks.pop(journal_entry["record"]["path"], None)
+                    continue
+                failed_tracks.pop(journal_entry["record"]["path"], None)
+                journal_embedding = journal_entry.get("embedding")
+                if journal_embedding is None and with_embeddings:
+                    continue
+                if journal_entry["model_fingerprint"] == model_fingerprint \
+                        and journal_entry["record"].get("windows", 1) == window_count:
+                    known_tracks[journal_entry["record"]["path"]] = (
+                        journal_entry["record"], np.array(journal_entry["vector"]), -1,
+                        None if journal_embedding is None else np.array(journal_embedding, dtype=np.float16))
+    tracks_by_hash = {known_track[0]["sha256"]: known_track for known_track in known_tracks.values()}
+
+    # walk the audio tree and decide which files need a prediction
+    track_records = []
+    track_vectors = []
+    track_embeddings = []
+    # row of each track in the previous catalog, -1 if it is new there
+    previous_rows = []
+    pending_tracks = {}
+    # (relative path, error message) of every file that could not be decoded
+    failures = []
+    for root, sub_dirs, files in os.walk(audio_dir):
+
+        for track_name in sorted(files):
+            track_path = os.path.join(root, track_name)
+            _, file_extension = os.path.splitext(track_path)
+            if file_extension.lower() not in file_types:
+                continue
+            track_stat = os.stat(track_path)
+            relative_path = os.path.relpath(track_path, audio_dir)
+            failed_track = failed_tracks.get(relative_path)
+            if failed_track is not None and failed_track["record"]["size"] == track_stat.st_size \
+                    and failed_track["record"]["mtime_ns"] == track_stat.st_mtime_ns:
+                failures.append((relative_path, failed_track["error"]))
+                continue
+            known_track = known_tracks.get(relative_path)
+            if known_track is not None and known_track[0]["size"] == track_stat.st_size \
+                    and known_track[0]["mtime_ns"] == track_stat.st_mtime_ns:
+                track_records.append(known_track[0])
+                track_vectors.append(known_track[1])
+                previous_rows.append(known_track[2])
+                track_embeddings.append(known_track[3])
+                continue
+
+            track_record = {"path": relative_path, "size": track_stat.st_size,
+                            "mtime_ns": track_stat.st_mtime_ns, "sha256": file_digest(track_path),
+                            "windows": window_count}
+            if track_record["sha256"] in tracks_by_hash:
+                track_records.append(track_record)
+                track_vectors.append(tracks_by_hash[track_record["sha256"]][1])
+                previous_rows.append(-1)
+                track_embeddings.append(tracks_by_hash[track_record["sha256"]][3])
+            else:
+                pending_tracks[track_path] = track_record
+
+    counts = {"unchanged": len(track_records), "predicted": 0,
+              "removed": len(set(known_tracks) - {record["path"] for record in track_records}
+                             - {record["path"] for record in pending_tracks.values()}
+                             - {failed_path for failed_path, _ in failures}),
+              "failed": 0}
+
+    # predict new and changed files, journaling each result for resumption
+    os.makedirs(catalog_dir, exist_ok=True)
+    prediction_failures = []
+    with open(journal_path, "a") as journal_file:
+
+        def journal_failures() -> None:
+            # journal files predict_genres skipped, so a resumed build skips them too
+            while prediction_failures:
+                failed_path, error_message = prediction_failures.pop(0)
+                failed_record = pending_tracks[failed_path]
+                failures.append((failed_record["path"], error_message))
+                journal_file.write(json.dumps({"model_fingerprint": model_fingerprint, "record": failed_record,
+                                               "error": error_message}) + "\n")
+                journal_file.flush()
+
+        for prediction_output in gp.predict_genres(list(pending_tracks), batch_size=batch_size,
+                                                   return_list=True, return_embeddings=with_embeddings,
+                                                   window_count=window_count, failures=prediction_failures):
+            journal_failures()
+            track_path, track_prediction = prediction_output[:2]
+            track_embedding = prediction_output[2] if with_embeddings else None
+            track_record = pending_tracks[track_path]
+            track_records.append(track_record)
+            track_vectors.append(np.array(track_prediction, dtype=np.float32))
+            previous_rows.append(-1)
+            track_embeddings.append(track_embedding)
+            journal_entry = {"model_fingerprint": model_fingerprint, "record": track_record,
+                             "vector": [float(value) for value in track_prediction]}
+            if with_embeddings:
+                journal_entry["embedding"] = [float(value) for value in track_embedding]
+            journal_file.write(json.dumps(journal_entry) + "\n")
+            counts["predicted"] += 1
+            if counts["predicted"] % batch_size == 0:
+                journal_file.flush()
+                print(f'Predicted {counts["predicted"]} of {len(pending_tracks)} tracks', end='\r')
+        journal_failures()
+    counts["failed"] = len(failures)
+
+    titles = [os.path.basename(track_record["path"]) for track_record in track_records]
+    vectors = np.array(track_vectors, dtype=np.float32).reshape(len(titles), -1)
+    embeddings = None
+    # keep stored embeddings as long as every row still has one
+    if with_embeddings or (track_embeddings and all(embedding is not None for embedding in track_embeddings)):
+        embeddings = np.array(track_embeddings, dtype=np.float16).reshape(len(titles), -1)
+    save_catalog(catalog_dir, titles, vectors, model_fingerprint, track_records, embeddings)
+    update_ann_index(catalog_dir, np.array(previous_rows, dtype=np.int64))
+    os.remove(journal_path)
+
+    print(f'Catalog has {len(titles)} tracks: {counts["predicted"]} predicted, '
+          f'{counts["unchanged"]} unchanged, {counts["removed"]} removed, {counts["failed"]} failed.')
+    for failed_path, error_message in failures:
+        print(f'  Could not decode {failed_path}: {error_message}')
+    return counts
 
 
 def calculate_absolute_difference(input_array: list, content_array: list) -> float:
@@ -77,14 +497,307 @@ def calculate_absolute_difference(input_array: list, content_array: list) -> flo
     return np.sum(abs_diff)
 
 
-def recommender(genre_prediction: list, content_db_dir: str, rec_num: int) -> None:
+class RecommenderEngine:
+    """
+    In-memory nearest-neighbour search over the genre prediction vectors of a catalog.
+
+    The catalog is parsed once into a contiguous (N, 10) float32 matrix. Each
+    query computes distances to every row in one vectorized pass and picks the
+    top k with argpartition, so only k rows are ever sorted. Supported metrics
+    are 'l1' (the original absolute difference), 'l2' and 'cosine'.
+
+    With an IVFIndex attached, queries only score the rows in the index cells
+    nearest to the query unless an exact search is requested.
+
+    Example:
+        engine = RecommenderEngine(titles, vectors)
+        results = engine.query(prediction_list, 5, metric="cosine")
+    """
+
+    # rows per block when the L1 distance needs a temporary array
+    block_rows = 262144
+
+    def __init__(self, titles: list, vectors: np.ndarray, ann_index: IVFIndex = None) -> None:
+        self.titles = titles
+        self.ann_index = ann_index
+        # memory-mapped float32 vectors are used in place without a copy
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        # terms for the L2 and cosine metrics, computed on first use
+        self._squared_norms = None
+        self._unit_vectors = None
+
+    def _prepare_metric(self, metric: str) -> None:
+        if metric in ("l2", "cosine") and self._squared_norms is None:
+            self._squared_norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        if metric == "cosine" and self._unit_vectors is None:
+            norms = np.sqrt(self._squared_norms)
+            self._unit_vectors = self.vectors / np.maximum(norms, np.finfo(np.float32).tiny)[:, np.newaxis]
+
+    def distances(self, query_vector, metric: str = "l1", rows: np.ndarray = None) -> np.ndarray:
+        """
+        Compute the distance from a query vector to every catalog row, or to selected rows.
+
+        Args:
+            query_vector (List[float]): Genre predictions for one audio file.
+            metric (str): 'l1', 'l2' or 'cosine'.
+            rows (np.ndarray): Optional row indices to score. Default is every row.
+
+        Returns:
+            np.ndarray: float32 distance of each scored row.
+
+        Raises:
+            ValueError: If the metric is not supported.
+        """
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        self._prepare_metric(metric)
+        scored_vectors = self.vectors if rows is None else self.vectors[rows]
+        if metric == "l1":
+            result = np.empty(len(scored_vectors), dtype=np.float32)
+            for block_start in range(0, len(scored_vectors), self.block_rows):
+                block = scored_vectors[block_start:block_start + self.block_rows]
+                result[block_start:block_start + len(block)] = np.abs(block - query).sum(axis=1)
+            return result
+        if metric == "l2":
+            squared_norms = self._squared_norms if rows is None else self._squared_norms[rows]
+            squared = squared_norms - 2.0 * (scored_vectors @ query) + np.dot(query, query)
+            return np.sqrt(np.maximum(squared, 0.0))
+        if metric == "cosine":
+            unit_vectors = self._unit_vectors if rows is None else self._unit_vectors[rows]
+            query_norm = max(float(np.linalg.norm(query)), np.finfo(np.float32).tiny)
+            return 1.0 - unit_vectors @ (query / query_norm)
+        raise ValueError(f'Unsupported metric: {metric}')
+
+    def query(self, query_vector, rec_num: int, metric: str = "l1", n_probe: int = None,
+              exact: bool = False) -> list:
+        """
+        Return the rec_num closest catalog entries to a query vector.
+
+        Args:
+            query_vector (List[float]): Genre predictions for one audio file.
+            rec_num (int): The number of content recommendations to return.
+            metric (str): 'l1', 'l2' or 'cosine'.
+            n_probe (int): Index cells scanned when an ANN index is attached.
+                Default is the index's own n_probe.
+            exact (bool): If True, scan every row even when an index is attached.
+
+        Returns:
+            List[tuple]: (title, distance) pairs sorted from closest to farthest.
+
+        Example:
+            engine.query([0.1, 0.2, 0.7], 5)
+        """
+
+        rows = None
+        if self.ann_index is not None and not exact:
+            rows = self.ann_index.candidate_rows(query_vector, n_probe)
+        all_distances = self.distances(query_vector, metric, rows)
+        rec_num = min(rec_num, len(all_distances))
+        if rec_num <= 0:
+            return []
+        nearest = np.argpartition(all_distances, rec_num - 1)[:rec_num]
+        nearest = nearest[np.argsort(all_distances[nearest], kind='stable')]
+        nearest_rows = nearest if rows is None else rows[nearest]
+        return [(str(self.titles[row]), float(distance))
+                for row, distance in zip(nearest_rows, all_distances[nearest])]
+
+
+# engines kept in memory across queries, keyed by catalog path and vector kind
+_loaded_engines = {}
+
+
+def load_recommender_engine(content_db_dir: str, use_embeddings: bool = False) -> RecommenderEngine:
+    """
+    Load a catalog into a RecommenderEngine, reusing it until the catalog changes.
+
+    A directory is opened as a binary catalog through load_catalog; a file is
+    parsed as a legacy recommender_csv.
+
+    Args:
+        content_db_dir (str): The path to the binary catalog directory or content CSV file.
+        use_embeddings (bool): If True, search the catalog's CNN embeddings instead of
+            its genre prediction vectors.
+
+    Returns:
+        RecommenderEngine: Engine over the catalog's prediction vectors.
+
+    Example:
+        engine = load_recommender_engine("./content_suggestion/recommender_catalog")
+    """
+
+    is_catalog_dir = os.path.isdir(content_db_dir)
+    changed_path = os.path.join(content_db_dir, CATALOG_HEADER_FILE) if is_catalog_dir else content_db_dir
+    catalog_mtime = os.stat(changed_path).st_mtime_ns
+    engine_key = (content_db_dir, use_embeddings)
+    cached_engine = _loaded_engines.get(engine_key)
+    if cached_engine is not None and cached_engine[0] == catalog_mtime:
+        return cached_engine[1]
+
+    ann_index = None
+    if is_catalog_dir:
+        header, titles, vectors = load_catalog(content_db_dir)
+        if header["model_fingerprint"] != gp.model_registry.fingerprint():
+            print(f'WARNING: {content_db_dir} was built with a different model; rebuild it for best results')
+        if use_embeddings:
+            vectors = load_catalog_embeddings(content_db_dir, header)
+            if vectors is None:
+                raise ValueError(f'{content_db_dir} has no embeddings; rebuild it with with_embeddings=True')
+        index_path = os.path.join(content_db_dir, ANN_EMBEDDING_INDEX_FILE if use_embeddings else ANN_INDEX_FILE)
+        if os.path.exists(index_path):
+            ann_index = IVFIndex.load(index_path)
+            if len(ann_index.assignments) != len(vectors) \
+                    or ann_index.model_fingerprint != header["model_fingerprint"]:
+                print(f'WARNING: {index_path} does not match the catalog; using exact search')
+                ann_index = None
+    else:
+        if use_embeddings:
+            raise ValueError(f'{content_db_dir} is a CSV catalog without embeddings')
+        titles, vectors = read_csv_catalog(content_db_dir)
+    engine = RecommenderEngine(titles, vectors, ann_index)
+    _loaded_engines[engine_key] = (catalog_mtime, engine)
+    return engine
+
+
+def build_ann_index(catalog_dir: str, n_lists: int = None, n_probe: int = 8,
+                    use_embeddings: bool = False) -> IVFIndex:
+    """
+    Build an IVF approximate nearest-neighbour index over a catalog and save it next to the catalog.
+
+    Args:
+        catalog_dir (str): Directory written by save_catalog.
+        n_lists (int): Number of index cells. Default is about sqrt(catalog size).
+        n_probe (int): Default number of cells scanned per query.
+        use_embeddings (bool): If True, index the catalog's embeddings instead of
+            its genre prediction vectors.
+
+    Returns:
+        IVFIndex: The built index.
+
+    Example:
+        build_ann_index("content_suggestion/recommender_catalog", n_lists=2048, n_probe=16)
+    """
+
+    header, _, vectors = load_catalog(catalog_dir)
+    if use_embeddings:
+        vectors = load_catalog_embeddings(catalog_dir, header)
+        index_path = os.path.join(catalog_dir, ANN_EMBEDDING_INDEX_FILE)
+    else:
+        index_path = os.path.join(catalog_dir, ANN_INDEX_FILE)
+    ann_index = IVFIndex.build(vectors, n_lists=n_lists, n_probe=n_probe,
+                               model_fingerprint=header["model_fingerprint"])
+    ann_index.save(index_path)
+    return ann_index
+
+
+def update_ann_index(catalog_dir: str, previous_rows: np.ndarray) -> None:
+    """
+    Carry the existing ANN indexes of a catalog over to its rebuilt rows.
+
+    Rows that existed before keep their cell, new rows are assigned to the
+    nearest existing centroid, and rows of deleted tracks are dropped. An index
+    whose centroids were trained on another model's vectors is rebuilt with
+    build_ann_index instead, keeping its cell count and n_probe. Indexes that
+    do not exist, or whose vectors the catalog no longer has, are skipped or
+    removed.
+
+    Args:
+        catalog_dir (str): Directory written by save_catalog.
+        previous_rows (np.ndarray): For each new catalog row, its row in the old
+            index, or -1 if the row is new.
+
+    Returns:
+        None
+    """
+
+    header, _, vectors = load_catalog(catalog_dir)
+    indexed_arrays = [(ANN_INDEX_FILE, vectors),
+                      (ANN_EMBEDDING_INDEX_FILE, load_catalog_embeddings(catalog_dir, header))]
+    previous_rows = np.asarray(previous_rows, dtype=np.int64)
+    for index_file, indexed_vectors in indexed_arrays:
+        index_path = os.path.join(catalog_dir, index_file)
+        if not os.path.exists(index_path):
+            continue
+        if indexed_vectors is None:
+            os.remove(index_path)
+            continue
+        ann_index = IVFIndex.load(index_path)
+        if ann_index.model_fingerprint != header["model_fingerprint"]:
+            # the catalog was predicted again by another model, so the cells no longer fit
+            build_ann_index(catalog_dir, len(ann_index.centroids), ann_index.n_probe,
+                            use_embeddings=index_file == ANN_EMBEDDING_INDEX_FILE)
+            continue
+        kept = (previous_rows >= 0) & (previous_rows < len(ann_index.assignments))
+        assignments = np.empty(len(previous_rows), dtype=np.int32)
+        assignments[kept] = ann_index.assignments[previous_rows[kept]]
+        new_rows = np.flatnonzero(~kept)
+        assignments[new_rows] = nearest_centroids(indexed_vectors[new_rows], ann_index.centroids)
+        IVFIndex(ann_index.centroids, assignments, ann_index.n_probe, ann_index.model_fingerprint).save(index_path)
+
+
+def benchmark_ann_index(catalog_size: int = 200000, query_count: int = 200, rec_num: int = 10,
+                        n_probes: tuple = (1, 2, 4, 8, 16, 32), metric: str = "l1", seed: int = 0) -> dict:
+    """
+    Report recall@k and latency of the ANN index against the exact scan on a synthetic catalog.
+
+    The catalog is made of random softmax-like genre vectors in percent, like
+    the output of predict_genre(return_list=True).
+
+    Args:
+        catalog_size (int): Number of catalog rows.
+        query_count (int): Number of queries timed.
+        rec_num (int): k of recall@k.
+        n_probes (tuple): n_probe values to measure.
+        metric (str): Distance metric used for the ranking.
+        seed (int): Seed for the synthetic data.
+
+    Returns:
+        dict: For 'exact' and each n_probe, mean query milliseconds and recall@k.
+
+    Example:
+        benchmark_ann_index(catalog_size=1000000)
+    """
+
+    rng = np.random.default_rng(seed)
+    vectors = (rng.dirichlet(np.full(10, 0.3), size=catalog_size) * 100).astype(np.float32)
+    queries = (rng.dirichlet(np.full(10, 0.3), size=query_count) * 100).astype(np.float32)
+    titles = np.arange(catalog_size).astype(str)
+
+    build_start = time.perf_counter()
+    engine = RecommenderEngine(titles, vectors, IVFIndex.build(vectors))
+    print(f'Index build: {time.perf_counter() - build_start:.2f} s, '
+          f'{len(engine.ann_index.centroids)} cells')
+
+    def timed_queries(**query_options):
+        query_start = time.perf_counter()
+        results = [{title for title, _ in engine.query(query, rec_num, metric, **query_options)}
+                   for query in queries]
+        return results, (time.perf_counter() - query_start) * 1000 / query_count
+
+    exact_results, exact_ms = timed_queries(exact=True)
+    report = {"exact": {"milliseconds": exact_ms, "recall": 1.0}}
+    print(f'exact: {exact_ms:.3f} ms/query')
+    for n_probe in n_probes:
+        ann_results, ann_ms = timed_queries(n_probe=n_probe)
+        recall = np.mean([len(ann & exact) / rec_num for ann, exact in zip(ann_results, exact_results)])
+        report[n_probe] = {"milliseconds": ann_ms, "recall": float(recall)}
+        print(f'n_probe={n_probe}: {ann_ms:.3f} ms/query, recall@{rec_num} = {recall:.3f}')
+    return report
+
+
+def recommender(genre_prediction: list, content_db_dir: str, rec_num: int, metric: str = "l1",
+                n_probe: int = None, query_embedding: np.ndarray = None) -> None:
     """
     Provide content recommendations based on genre predictions.
 
     Args:
         genre_prediction (List[float]): Genre predictions for one audio file.
-        content_db_dir (str): The path to the preprocessed content CSV file.
+        content_db_dir (str): The path to the binary catalog directory or content CSV file.
         rec_num (int): The number of content recommendations to return.
+        metric (str): Distance metric, 'l1', 'l2' or 'cosine'. Default is 'l1'.
+        n_probe (int): Index cells scanned when the catalog has an ANN index.
+        query_embedding (np.ndarray): Optional embedding of the audio file from
+            predict_genre(return_embedding=True). When given, the catalog's
+            embeddings are searched instead of its genre prediction vectors.
 
     Returns:
         None
@@ -92,25 +805,24 @@ def recommender(genre_prediction: list, content_db_dir: str, rec_num: int) -> No
     Note:
         - The content recommendations are determined by finding minimal
         differences in genre prediction values.
+        - The catalog is loaded once per process by load_recommender_engine.
+        - Catalogs with an ann_index.npz are searched approximately (see build_ann_index).
 
     Example:
         recommender([0.1, 0.2, 0.7], "path/to/content_database.csv", 5)
     """
 
-    # load preprocessed content .csv as pandas dataframe object
-    df = pd.read_csv(content_db_dir, converters={'genre_predictions': ast.literal_eval})
-    # convert lists in dataframe to numpy arrays before calculating differences
-    df['genre_predictions'] = df['genre_predictions'].apply(np.array)
-    # convert to numpy array
-    np_genre_prediction = np.array(genre_prediction)
-    # create new column in dataframe with difference values
-    df['absolute_difference'] = df['genre_predictions'].apply(
-        lambda row: calculate_absolute_difference(np_genre_prediction, row)
-    )
-    # sort dataframe by difference values
-    df = df.sort_values(by='absolute_difference', ascending=True)
-
-    result_df = df.head(rec_num)[['title', 'absolute_difference']]
+    if query_embedding is not None:
+        engine = load_recommender_engine(content_db_dir, use_embeddings=True)
+        recommendations = engine.query(query_embedding, rec_num, metric, n_probe)
+    else:
+        engine = load_recommender_engine(content_db_dir)
+        recommendations = engine.query(genre_prediction, rec_num, metric, n_probe)
+    # pandas is only needed to print the table, so it is not imported with the module
+    import pandas as pd
+
+    distance_column = 'absolute_difference' if metric == "l1" else f'{metric}_distance'
+    result_df = pd.DataFrame(recommendations, columns=['title', distance_column])
     result_df_str = result_df.to_string(index=False)
     print(result_df_str)
 
@@ -118,10 +830,16 @@ def recommender(genre_prediction: list, content_db_dir: str, rec_num: int) -> No
 if __name__ == "__main__":
 
     # navigate to git directory and run: python3 content_suggestion.py <path-to-audio-file>
-    RECOMMENDER_DB = './content_suggestion/recommender_csv'
+    RECOMMENDER_DB = './content_suggestion/recommender_catalog'
+    LEGACY_RECOMMENDER_CSV = './content_suggestion/recommender_csv'
     PATH_TO_AUDIO = './sample_songs'
     NUMBER_OF_RECOMMENDATIONS = 6
 
+    # run "python3 content_suggestion.py --benchmark-ann" to measure the ANN index
+    if len(sys.argv) == 2 and sys.argv[1] == "--benchmark-ann":
+        benchmark_ann_index()
+        sys.exit(0)
+
     # the following code extends the functionality of this program
     if len(sys.argv) != 2:
         print()
@@ -131,7 +849,18 @@ if __name__ == "__main__":
     TRACK_FOR_RECOMMENDER = sys.argv[1]
 
     if not os.path.exists(RECOMMENDER_DB):
-        build_recommender_db(PATH_TO_AUDIO, RECOMMENDER_DB)
-
-    prediction_list = gp.predict_genre(TRACK_FOR_RECOMMENDER, return_list=True)
-    recommender(prediction_list, RECOMMENDER_DB, NUMBER_OF_RECOMMENDATIONS)
+        if os.path.exists(LEGACY_RECOMMENDER_CSV):
+            # one-time migration of the old text catalog
+            convert_csv_catalog(LEGACY_RECOMMENDER_CSV, RECOMMENDER_DB)
+        else:
+            build_recommender_db(PATH_TO_AUDIO, RECOMMENDER_DB)
+
+    # search embeddings when the catalog has them, otherwise the genre vectors
+    if load_catalog_embeddings(RECOMMENDER_DB) is not None:
+        prediction_list, track_embedding = gp.predict_genre(TRACK_FOR_RECOMMENDER, return_list=True,
+                                                            return_embedding=True)
+        recommender(prediction_list, RECOMMENDER_DB, NUMBER_OF_RECOMMENDATIONS, metric="cosine",
+                    query_embedding=track_embedding)
+    else:
+        prediction_list = gp.predict_genre(TRACK_FOR_RECOMMENDER, return_list=True)
+        recommender(prediction_list, RECOMMENDER_DB, NUMBER_OF_RECOMMENDATIONS)
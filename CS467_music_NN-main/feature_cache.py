@@ -0,0 +1,231 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: On-disk spectrogram cache keyed by audio content hash
+
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+
+# default cache location and size limit
+FEATURE_CACHE_DIRECTORY = "feature_cache"
+FEATURE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+def file_digest(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Compute the SHA-256 digest of a file's contents.
+
+    Args:
+        file_path (str): Path to the file.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: Hex digest of the file contents.
+
+    Example:
+        digest = file_digest("path/to/audio/file.mp3")
+    """
+
+    content_hash = hashlib.sha256()
+    with open(file_path, "rb") as input_file:
+        for chunk in iter(lambda: input_file.read(chunk_size), b""):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def audio_digest(audio) -> str:
+    """
+    Compute the SHA-256 digest of audio given as a path, bytes or a file-like object.
+
+    File-like objects are rewound after hashing so they can still be decoded.
+
+    Args:
+        audio: A file path, the encoded file as bytes, or a readable, seekable binary file-like object.
+
+    Returns:
+        str: Hex digest of the contents.
+
+    Example:
+        digest = audio_digest(request.files['song'].read())
+    """
+
+    if isinstance(audio, (str, os.PathLike)):
+        return file_digest(audio)
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(audio).hexdigest()
+    content_hash = hashlib.sha256()
+    audio.seek(0)
+    for chunk in iter(lambda: audio.read(1024 * 1024), b""):
+        content_hash.update(chunk)
+    audio.seek(0)
+    return content_hash.hexdigest()
+
+
+class FeatureCache:
+    """
+    Content-addressed cache of spectrograms stored as .npy files.
+
+    Entries are keyed by the hash of the audio file contents plus the extraction
+    parameters, so renamed or copied files still hit and a change of parameters
+    never returns stale features. Entries are returned memory-mapped. The total
+    size of the cache directory is bounded, and the least recently used entries
+    are evicted first; recency is kept in the file modification times so it is
+    shared between processes.
+
+    Example:
+        cache = FeatureCache("feature_cache")
+        spectrogram = cache.get_or_compute("file.mp3", {"sr": 22050}, compute_spectrogram)
+    """
+
+    def __init__(self, cache_directory: str = FEATURE_CACHE_DIRECTORY,
+                 max_bytes: int = FEATURE_CACHE_MAX_BYTES) -> None:
+        self.cache_directory = cache_directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def cache_key(self, audio_file_path, parameters: dict) -> str:
+        """
+        Build the cache key for an audio file and a set of extraction parameters.
+
+        Args:
+            audio_file_path: Path to the audio file, or its contents as bytes or a file-like object.
+            parameters (dict): Extraction parameters such as sr, n_fft, hop and window offset.
+
+        Returns:
+            str: Hex key combining the content digest and the parameters.
+        """
+
+        parameter_text = json.dumps(parameters, sort_keys=True)
+        key_hash = hashlib.sha256(audio_digest(audio_file_path).encode())
+        key_hash.update(parameter_text.encode())
+        return key_hash.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_directory, key + ".npy")
+
+    def get(self, key: str):
+        """
+        Return a memory-mapped cached spectrogram, or None on a miss.
+
+        Args:
+            key (str): Key from cache_key.
+
+        Returns:
+            Union[np.ndarray, None]: The cached spectrogram, or None.
+        """
+
+        entry_path = self._entry_path(key)
+        try:
+            spectrogram = np.load(entry_path, mmap_mode='r')
+            # mark as most recently used
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        with self._lock:
+            self._stats["hits"] += 1
+        return spectrogram
+
+    def put(self, key: str, spectrogram: np.ndarray) -> None:
+        """
+        Store a spectrogram and evict old entries if the cache is over its size limit.
+
+        Args:
+            key (str): Key from cache_key.
+            spectrogram (np.ndarray): Spectrogram to store.
+
+        Returns:
+            None
+        """
+
+        os.makedirs(self.cache_directory, exist_ok=True)
+        entry_path = self._entry_path(key)
+        # write to a temporary name first so readers never see a partial file
+        temp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as output_file:
+            np.save(output_file, np.ascontiguousarray(spectrogram, dtype=np.float32))
+        os.replace(temp_path, entry_path)
+        self.evict()
+
+    def get_or_compute(self, audio_file_path, parameters: dict, compute_spectrogram) -> np.ndarray:
+        """
+        Return the cached spectrogram of a file, computing and storing it on a miss.
+
+        Args:
+            audio_file_path: Path to the audio file, or its contents as bytes or a file-like object.
+            parameters (dict): Extraction parameters that are part of the key.
+            compute_spectrogram: Function called with audio_file_path on a miss.
+
+        Returns:
+            np.ndarray: The spectrogram.
+        """
+
+        key = self.cache_key(audio_file_path, parameters)
+        spectrogram = self.get(key)
+        if spectrogram is None:
+            spectrogram = compute_spectrogram(audio_file_path)
+            self.put(key, spectrogram)
+        return spectrogram
+
+    def evict(self) -> None:
+        """
+        Remove least recently used entries until the cache fits in max_bytes.
+
+        Other processes share the directory, so an entry that disappears while
+        it is being scanned or removed is skipped.
+
+        Returns:
+            None
+        """
+
+        entries = []
+        total_bytes = 0
+        with os.scandir(self.cache_directory) as directory_entries:
+            for directory_entry in directory_entries:
+                if directory_entry.name.endswith(".npy"):
+                    try:
+                        entry_stat = directory_entry.stat()
+                    except OSError:
+                        # evicted or replaced by another process since the scan
+                        continue
+                    entries.append((entry_stat.st_mtime_ns, entry_stat.st_size, directory_entry.path))
+                    total_bytes += entry_stat.st_size
+
+        entries.sort()
+        for _, entry_size, entry_path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                # another process already evicted it, so its space is free
+                total_bytes -= entry_size
+                continue
+            except OSError:
+                continue
+            total_bytes -= entry_size
+            with self._lock:
+                self._stats["evictions"] += 1
+
+    def stats(self) -> dict:
+        """
+        Return hit, miss and eviction counts plus the hit rate.
+
+        Returns:
+            dict: Cache statistics for this process.
+
+        Example:
+            print(cache.stats()["hit_rate"])
+        """
+
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,456 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Mel-spectrogram extraction shared by training and inference
+
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+import librosa
+from audio_decoding import decode_window, RESAMPLE_TYPE
+
+# settings every model input is computed with
+SAMPLE_RATE = 22050
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+WINDOW_DURATION = 30.0
+# tracks longer than this are analysed from their middle, in training and inference
+LONG_TRACK_LENGTH = 65.0
+# power_to_db defaults: floor of the power and range kept below each window's peak
+AMIN = 1e-10
+TOP_DB = 80.0
+# resampler of the original features, which parity is measured against
+REFERENCE_RESAMPLE_TYPE = "soxr_hq"
+# bins quieter than this, relative to each spectrogram's peak, are left out of parity
+PARITY_FLOOR_DB = -60.0
+# scratch buffer sets each thread keeps, one per batch shape, e.g. full batches and
+# the last partial one; about 17 MB each for one 30 second window
+WORKSPACE_CACHE_SIZE = 2
+
+
+def middle_window_offset(song_length: float) -> float:
+    """
+    Start time of the main window: the middle of songs longer than 65 seconds,
+    otherwise the beginning.
+
+    Args:
+        song_length (float): Duration of the audio in seconds.
+
+    Returns:
+        float: Start time of the 30 second window in seconds.
+    """
+
+    if song_length > LONG_TRACK_LENGTH:
+        return song_length // 2
+    return 0
+
+
+def window_offsets(song_length: float, window_count: int = 1, window_stride: float = WINDOW_DURATION,
+                   window_duration: float = WINDOW_DURATION) -> list:
+    """
+    Start times of up to window_count windows around the main window.
+
+    The windows are spaced about window_stride seconds apart, or closer when the
+    track is too short to fit them all, start on whole seconds, and never run
+    past either end of the track.
+    Tracks up to 65 seconds only get the main window. The main window comes
+    first and the others follow by distance from it, so taking the first n
+    offsets always gives the n most central windows.
+
+    Args:
+        song_length (float): Duration of the audio in seconds.
+        window_count (int): Maximum number of windows.
+        window_stride (float): Seconds between the starts of neighbouring windows.
+        window_duration (float): Length of each window in seconds.
+
+    Returns:
+        list: Start times in seconds, main window first.
+
+    Example:
+        window_offsets(240.0, window_count=8)
+    """
+
+    main_offset = middle_window_offset(song_length)
+    if window_count <= 1 or song_length <= LONG_TRACK_LENGTH:
+        return [main_offset]
+
+    # whole seconds, so windows cut from one decode line up with separately decoded ones
+    last_start = float(int(song_length - window_duration))
+    window_stride = min(window_stride, last_start / (window_count - 1))
+    offsets = []
+    for window_index in range(window_count):
+        offset = float(round(main_offset + (window_index - window_count // 2) * window_stride))
+        offset = min(max(offset, 0.0), last_start)
+        if offset not in offsets:
+            offsets.append(offset)
+    return sorted(offsets, key=lambda offset: abs(offset - main_offset))
+
+
+class MelSpectrogramExtractor:
+    """
+    Computes mel-spectrograms in dB for batches of equal-length windows.
+
+    The output matches librosa.feature.melspectrogram (centred, zero padded,
+    Hann window) followed by power_to_db(ref=np.max) on every window. The Hann
+    window and mel filterbank are built once, the frames of all windows are
+    taken as a strided view of one padded buffer, and a single FFT call covers
+    the whole batch. The filters are built on first use, so creating an
+    extractor is free. Scratch buffers are kept per thread for the
+    WORKSPACE_CACHE_SIZE most recently used batch shapes, and results are
+    written into a float32 buffer the caller may provide, so repeated calls of
+    the same shape allocate nothing but the FFT output, and a long-running
+    server holds a bounded amount of scratch memory whatever lengths it sees.
+
+    Example:
+        extractor = MelSpectrogramExtractor()
+        spectrograms = extractor.output_buffer(len(windows))
+        extractor.extract(windows, out=spectrograms)
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, n_fft: int = N_FFT, hop_length: int = HOP_LENGTH,
+                 n_mels: int = N_MELS, window_duration: float = WINDOW_DURATION) -> None:
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+        self.window_samples = int(round(window_duration * sample_rate))
+        self.fft_window = None
+        self.mel_basis_t = None
+        self._filter_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _build_filters(self) -> None:
+        # librosa's filter module pulls in scipy.signal and numba, so wait until needed
+        with self._filter_lock:
+            if self.mel_basis_t is not None:
+                return
+            self.fft_window = librosa.filters.get_window("hann", self.n_fft, fftbins=True).astype(np.float32)
+            # transposed so (frames, bins) @ mel_basis_t gives (frames, mels)
+            self.mel_basis_t = np.ascontiguousarray(
+                librosa.filters.mel(sr=self.sample_rate, n_fft=self.n_fft, n_mels=self.n_mels).T)
+
+    def frame_count(self, samples: int = None) -> int:
+        """
+        Return the number of spectrogram frames of a window.
+
+        Args:
+            samples (int): Length of the window in samples. Default is window_duration.
+
+        Returns:
+            int: Number of frames, 1292 for 30 seconds at the default settings.
+        """
+
+        if samples is None:
+            samples = self.window_samples
+        return 1 + samples // self.hop_length
+
+    def output_buffer(self, batch_size: int, samples: int = None) -> np.ndarray:
+        """
+        Allocate an output buffer for extract.
+
+        Args:
+            batch_size (int): Number of windows.
+            samples (int): Length of each window in samples. Default is window_duration.
+
+        Returns:
+            np.ndarray: Uninitialised float32 array of shape (batch_size, n_mels, frames).
+        """
+
+        return np.empty((batch_size, self.n_mels, self.frame_count(samples)), dtype=np.float32)
+
+    def _workspace(self, batch_size: int, samples: int) -> dict:
+        # one set of scratch buffers per thread and recently used batch shape
+        workspaces = getattr(self._local, "workspaces", None)
+        if workspaces is None:
+            workspaces = self._local.workspaces = OrderedDict()
+        workspace = workspaces.get((batch_size, samples))
+        if workspace is not None:
+            workspaces.move_to_end((batch_size, samples))
+        else:
+            frames = self.frame_count(samples)
+            padding = self.n_fft // 2
+            # the padding stays zero; only the middle is overwritten by each call
+            padded = np.zeros((batch_size, samples + 2 * padding), dtype=np.float32)
+            workspace = {
+                "padded": padded,
+                "frame_view": np.lib.stride_tricks.sliding_window_view(
+                    padded, self.n_fft, axis=-1)[:, ::self.hop_length][:, :frames],
+                "frames": np.empty((batch_size, frames, self.n_fft), dtype=np.float32),
+                "power": np.empty((batch_size, frames, self.n_fft // 2 + 1), dtype=np.float32),
+                "mel": np.empty((batch_size, frames, self.n_mels), dtype=np.float32),
+            }
+            workspaces[(batch_size, samples)] = workspace
+            while len(workspaces) > WORKSPACE_CACHE_SIZE:
+                # drop the least recently used shape
+                workspaces.popitem(last=False)
+        return workspace
+
+    def extract(self, windows: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """
+        Compute the mel-spectrogram in dB of every window in one vectorized pass.
+
+        Args:
+            windows (np.ndarray): (batch, samples) audio at sample_rate, or a
+                single 1-D window.
+            out (np.ndarray): Optional float32 buffer of shape (batch, n_mels, frames),
+                e.g. from output_buffer, to write the result into.
+
+        Returns:
+            np.ndarray: out, or a new (batch, n_mels, frames) array, each window
+                scaled against its own peak. A 1-D input gives (n_mels, frames).
+
+        Example:
+            audio_spec_db = extractor.extract(y)
+        """
+
+        import scipy.fft
+
+        if self.mel_basis_t is None:
+            self._build_filters()
+        single_window = np.ndim(windows) == 1
+        windows = np.atleast_2d(windows)
+        batch_size, samples = windows.shape
+        if out is None:
+            out = self.output_buffer(batch_size, samples)
+        workspace = self._workspace(batch_size, samples)
+
+        padding = self.n_fft // 2
+        workspace["padded"][:, padding:padding + samples] = windows
+        frames = workspace["frames"]
+        np.multiply(workspace["frame_view"], self.fft_window, out=frames)
+        spectrum = scipy.fft.rfft(frames, axis=-1, overwrite_x=True, workers=-1)
+
+        # power spectrum, mel filterbank, then power_to_db(ref=np.max) per window
+        power = workspace["power"]
+        np.abs(spectrum, out=power)
+        np.square(power, out=power)
+        mel = workspace["mel"]
+        np.matmul(power, self.mel_basis_t, out=mel)
+        np.maximum(mel, AMIN, out=mel)
+        np.log10(mel, out=mel)
+        mel *= 10.0
+        mel -= mel.max(axis=(1, 2), keepdims=True)
+        np.maximum(mel, -TOP_DB, out=mel)
+        np.copyto(out, mel.transpose(0, 2, 1))
+        return out[0] if single_window else out
+
+
+# shared by compute_spectrogram and the training conversion
+mel_extractor = MelSpectrogramExtractor()
+
+
+def mel_spectrogram_db(y: np.ndarray, sample_rate: int = SAMPLE_RATE, out: np.ndarray = None) -> np.ndarray:
+    """
+    Compute the model's mel-spectrogram in dB with the shared extractor.
+
+    Every window is scaled against its own peak, as with power_to_db(ref=np.max)
+    on each one.
+
+    Args:
+        y (np.ndarray): Samples of one window, or (windows, samples) for several.
+        sample_rate (int): Sample rate of y, which must be 22050 Hz.
+        out (np.ndarray): Optional float32 buffer to write the result into.
+
+    Returns:
+        np.ndarray: (128, frames) in dB, or (windows, 128, frames).
+
+    Raises:
+        ValueError: If y is not at 22050 Hz.
+
+    Example:
+        audio_spec_db = mel_spectrogram_db(y)
+    """
+
+    if sample_rate != SAMPLE_RATE:
+        raise ValueError(f"Expected audio at {SAMPLE_RATE} Hz, got {sample_rate} Hz")
+    return mel_extractor.extract(y, out=out)
+
+
+def librosa_mel_spectrogram_db(y: np.ndarray, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Compute the mel-spectrogram in dB with librosa, the reference for the extractor.
+
+    Args:
+        y (np.ndarray): Samples of one window, or (windows, samples) for several.
+        sample_rate (int): Sample rate of y.
+
+    Returns:
+        np.ndarray: (128, frames) in dB, or (windows, 128, frames).
+    """
+
+    audio_spec = librosa.feature.melspectrogram(y=y, sr=sample_rate, n_fft=N_FFT, hop_length=HOP_LENGTH,
+                                                n_mels=N_MELS)
+    if audio_spec.ndim == 2:
+        return librosa.power_to_db(audio_spec, ref=np.max)
+    return np.stack([librosa.power_to_db(window_spec, ref=np.max) for window_spec in audio_spec])
+
+
+def benchmark_extractor(batch_size: int = 8, repeats: int = 5, seed: int = 0) -> dict:
+    """
+    Compare the extractor with librosa on random 30 second windows.
+
+    Args:
+        batch_size (int): Number of windows per call.
+        repeats (int): Timed runs of each implementation.
+        seed (int): Seed of the random audio.
+
+    Returns:
+        dict: 'librosa_ms' and 'extractor_ms' per window, and 'max_abs_db', the
+            largest difference between the two outputs.
+
+    Example:
+        print(benchmark_extractor(batch_size=4))
+    """
+
+    rng = np.random.default_rng(seed)
+    windows = (0.1 * rng.standard_normal((batch_size, mel_extractor.window_samples))).astype(np.float32)
+    spectrograms = mel_extractor.output_buffer(batch_size)
+
+    librosa_start = time.perf_counter()
+    for _ in range(repeats):
+        reference = librosa_mel_spectrogram_db(windows)
+    librosa_ms = (time.perf_counter() - librosa_start) / (repeats * batch_size) * 1000
+
+    mel_extractor.extract(windows, out=spectrograms)
+    extractor_start = time.perf_counter()
+    for _ in range(repeats):
+        mel_extractor.extract(windows, out=spectrograms)
+    extractor_ms = (time.perf_counter() - extractor_start) / (repeats * batch_size) * 1000
+
+    return {"librosa_ms": librosa_ms, "extractor_ms": extractor_ms,
+            "max_abs_db": float(np.abs(reference - spectrograms).max())}
+
+
+def spectrogram_difference(reference: np.ndarray, candidate: np.ndarray,
+                           floor_db: float = PARITY_FLOOR_DB) -> dict:
+    """
+    Summarise how far a spectrogram is from a reference one.
+
+    Args:
+        reference (np.ndarray): (128, frames) reference spectrogram in dB.
+        candidate (np.ndarray): (128, frames) spectrogram to compare.
+        floor_db (float): Bins quieter than this in the reference are left out.
+
+    Returns:
+        dict: 'max_abs_db' and 'mean_abs_db' over the compared bins, and
+            'bands_over_1db', the number of mel bands that move by more than 1 dB.
+    """
+
+    frames = min(reference.shape[1], candidate.shape[1])
+    reference = reference[:, :frames]
+    difference = np.abs(reference - candidate[:, :frames])
+    difference[reference <= floor_db] = 0.0
+    return {"max_abs_db": float(difference.max()), "mean_abs_db": float(difference.mean()),
+            "bands_over_1db": int(np.count_nonzero(difference.max(axis=1) > 1.0))}
+
+
+def window_spectrogram(audio_file_path: str, offset: float = 0.0, res_type: str = RESAMPLE_TYPE) -> np.ndarray:
+    """
+    Decode one 30 second window with a given resampler and compute its spectrogram.
+
+    Args:
+        audio_file_path (str): Path to the audio file.
+        offset (float): Start of the window in seconds.
+        res_type (str): librosa resampler.
+
+    Returns:
+        np.ndarray: (128, frames) in dB.
+    """
+
+    y, sample_rate = decode_window(audio_file_path, WINDOW_DURATION, offset, res_type=res_type)
+    return mel_spectrogram_db(y, sample_rate)
+
+
+def benchmark_resamplers(audio_file_paths: list, res_types: tuple = ("soxr_hq", "soxr_mq", "soxr_qq", "polyphase"),
+                         offset: float = 0.0, repeats: int = 3) -> dict:
+    """
+    Time each resampler on decoded windows and measure its spectrogram parity with soxr_hq.
+
+    Args:
+        audio_file_paths (list): Audio files to test; files already at 22050 Hz
+            are never resampled, so use files at 44100 or 48000 Hz.
+        res_types (tuple): librosa resamplers to compare.
+        offset (float): Start of the window in seconds.
+        repeats (int): Timed runs per file and resampler.
+
+    Returns:
+        dict: For each resampler, 'resample_ms' per window and the worst
+            'max_abs_db', 'mean_abs_db' and 'bands_over_1db' against soxr_hq.
+
+    Example:
+        print(benchmark_resamplers(["song_44k.wav"]))
+    """
+
+    report = {res_type: {"resample_ms": 0.0, "max_abs_db": 0.0, "mean_abs_db": 0.0, "bands_over_1db": 0}
+              for res_type in res_types}
+    for audio_file_path in audio_file_paths:
+        y, native_sr = decode_window(audio_file_path, WINDOW_DURATION, offset, sr=None)
+        reference = mel_spectrogram_db(librosa.resample(y, orig_sr=native_sr, target_sr=SAMPLE_RATE,
+                                                        res_type=REFERENCE_RESAMPLE_TYPE))
+        for res_type in res_types:
+            resample_start = time.perf_counter()
+            for _ in range(repeats):
+                resampled = librosa.resample(y, orig_sr=native_sr, target_sr=SAMPLE_RATE, res_type=res_type)
+            resample_ms = (time.perf_counter() - resample_start) / repeats * 1000
+            difference = spectrogram_difference(reference, mel_spectrogram_db(resampled))
+            res_report = report[res_type]
+            res_report["resample_ms"] += resample_ms / len(audio_file_paths)
+            res_report["max_abs_db"] = max(res_report["max_abs_db"], difference["max_abs_db"])
+            res_report["mean_abs_db"] = max(res_report["mean_abs_db"], difference["mean_abs_db"])
+            res_report["bands_over_1db"] = max(res_report["bands_over_1db"], difference["bands_over_1db"])
+    return report
+
+
+def prediction_parity(audio_file_paths: list, offset: float = 0.0) -> dict:
+    """
+    Check that the configured resampler gives the same genre predictions as soxr_hq.
+
+    Args:
+        audio_file_paths (list): Audio files to compare.
+        offset (float): Start of the window in seconds.
+
+    Returns:
+        dict: 'files' and 'top_genre_matches' counts, and the largest absolute
+            difference of any genre probability.
+    """
+
+    import genre_prediction as gp
+
+    trained_model, _ = gp.model_registry.get()
+    top_genre_matches = 0
+    max_probability_difference = 0.0
+    for audio_file_path in audio_file_paths:
+        probabilities = []
+        for res_type in (REFERENCE_RESAMPLE_TYPE, RESAMPLE_TYPE):
+            audio_spec_db = window_spectrogram(audio_file_path, offset, res_type)
+            model_input = gp.fit_spectrogram_frames(audio_spec_db[np.newaxis, :, :, np.newaxis])
+            probabilities.append(np.asarray(trained_model.serve(model_input))[0])
+        top_genre_matches += int(np.argmax(probabilities[0]) == np.argmax(probabilities[1]))
+        max_probability_difference = max(max_probability_difference,
+                                         float(np.abs(probabilities[0] - probabilities[1]).max()))
+    return {"files": len(audio_file_paths), "top_genre_matches": top_genre_matches,
+            "max_probability_difference": max_probability_difference}
+
+
+if __name__ == "__main__":
+    # extractor and resampler speed and parity, e.g.
+    # python feature_extraction.py sample_songs
+    extractor_report = benchmark_extractor()
+    print(f"Extractor: {extractor_report['extractor_ms']:.1f} ms per window, librosa "
+          f"{extractor_report['librosa_ms']:.1f} ms, max difference {extractor_report['max_abs_db']:.4f} dB")
+    parity_directory = sys.argv[1] if len(sys.argv) > 1 else "sample_songs"
+    parity_files = [os.path.join(parity_directory, file_name) for file_name in sorted(os.listdir(parity_directory))
+                    if file_name.lower().endswith((".mp3", ".wav", ".flac", ".ogg", ".au"))]
+    resampler_report = benchmark_resamplers(parity_files)
+    for res_type, res_report in resampler_report.items():
+        print(f"{res_type}: {res_report['resample_ms']:.1f} ms per window, max {res_report['max_abs_db']:.2f} dB, "
+              f"mean {res_report['mean_abs_db']:.4f} dB, {res_report['bands_over_1db']} bands over 1 dB")
+    prediction_report = prediction_parity(parity_files)
+    print(f"Predictions with {RESAMPLE_TYPE}: top genre unchanged for {prediction_report['top_genre_matches']} of "
+          f"{prediction_report['files']} files, max probability difference "
+          f"{prediction_report['max_probability_difference']:.4f}")
@@ -6,10 +6,325 @@
 
 # imports
 import os
+import sys
 import json
+import time
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import tensorflow as tf
-import librosa
+from feature_cache import FeatureCache
+from audio_decoding import decode_window, RESAMPLE_TYPE
+from feature_extraction import mel_spectrogram_db, middle_window_offset, window_offsets, WINDOW_DURATION
+from numpy_inference import NumpyGenreModel, NUMPY_MODEL_FILE
+
+# default locations of the trained model and its label map
+MODEL_DIRECTORY = "model_saved"
+GENRE_LABELS_FILE = "genre_labels.json"
+# quantized models written by model_creation/model_quantization.py
+TFLITE_MODEL_FILE = os.path.join("model_tflite", "genre_model_int8.tflite")
+
+# inference backend of the shared registry, 'saved_model', 'tflite' or 'numpy', and the model it loads
+MODEL_BACKEND = os.environ.get("GENRE_MODEL_BACKEND", "saved_model")
+MODEL_PATH = os.environ.get("GENRE_MODEL_PATH", {"tflite": TFLITE_MODEL_FILE, "numpy": NUMPY_MODEL_FILE}.get(
+    MODEL_BACKEND, MODEL_DIRECTORY))
+
+# spectrogram shape expected by the model input (mel bands, frames)
+NUMBER_OF_MELS = 128
+NUMBER_OF_FRAMES = 1292
+
+# size and seed of the random projection applied to penultimate-layer activations
+EMBEDDING_DIMENSIONS = 128
+EMBEDDING_SEED = 467
+
+# early-exit prediction: frames of the prefix scored first (about 10 seconds) and
+# the top-1 probability at which the prefix result is returned
+PROGRESSIVE_PREFIX_FRAMES = 431
+EARLY_EXIT_CONFIDENCE = 0.9
+# shortest input the CNN's five conv and pooling stages accept
+MIN_MODEL_FRAMES = 63
+
+# ways predict_genre_windows can combine the probabilities of several windows
+AGGREGATIONS = ("mean", "log_mean")
+# weight of the newest measurement in the per-window cost estimates
+WINDOW_COST_SMOOTHING = 0.2
+
+# extraction settings of compute_spectrogram, part of every feature cache key
+FEATURE_PARAMETERS = {"sr": 22050, "n_fft": 2048, "hop_length": 512, "n_mels": 128,
+                      "duration": 30.0, "window_offset": "middle_if_over_65s", "decoder": "window_seek",
+                      "resampler": RESAMPLE_TYPE}
+
+
+class TFLiteModel:
+    """
+    Runs a TensorFlow Lite genre model behind the same serve(batch) call as the SavedModel.
+
+    The interpreter comes from the small tflite_runtime package when it is
+    installed, otherwise from TensorFlow. Inputs and outputs stay float32; int8
+    models quantize and dequantize inside the graph, or here when the model was
+    exported with integer input or output. Calls are serialised, since one
+    interpreter cannot run two batches at once.
+
+    Example:
+        trained_model = TFLiteModel("model_tflite/genre_model_int8.tflite")
+        probabilities = trained_model.serve(model_input)
+    """
+
+    def __init__(self, model_path: str, num_threads: int = None) -> None:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.model_path = model_path
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input_details = self.interpreter.get_input_details()[0]
+        self._output_details = self.interpreter.get_output_details()[0]
+        # -1 in the shape signature marks an axis that may change between calls
+        self.variable_frames = int(self._input_details["shape_signature"][2]) == -1
+        self._lock = threading.Lock()
+
+    def serve(self, model_input: np.ndarray) -> np.ndarray:
+        """
+        Run one batch through the model.
+
+        Args:
+            model_input (np.ndarray): Spectrograms of shape (tracks, 128, frames, 1).
+
+        Returns:
+            np.ndarray: float32 softmax output of shape (tracks, genres).
+        """
+
+        model_input = np.asarray(model_input, dtype=np.float32)
+        input_index = self._input_details["index"]
+        with self._lock:
+            if tuple(self.interpreter.get_input_details()[0]["shape"]) != model_input.shape:
+                self.interpreter.resize_tensor_input(input_index, model_input.shape, strict=False)
+                self.interpreter.allocate_tensors()
+            input_scale, input_zero_point = self._input_details["quantization"]
+            if self._input_details["dtype"] != np.float32:
+                model_input = np.round(model_input / input_scale + input_zero_point)
+                model_input = model_input.astype(self._input_details["dtype"])
+            self.interpreter.set_tensor(input_index, model_input)
+            self.interpreter.invoke()
+            results = self.interpreter.get_tensor(self._output_details["index"]).copy()
+        if self._output_details["dtype"] != np.float32:
+            output_scale, output_zero_point = self._output_details["quantization"]
+            results = (results.astype(np.float32) - output_zero_point) * output_scale
+        return results
+
+
+def load_saved_model(model_path: str):
+    """
+    Load a SavedModel exported by model_build_training.export_inference_model.
+
+    Args:
+        model_path (str): SavedModel directory.
+
+    Returns:
+        The loaded SavedModel, with 'serve' and usually 'serve_with_embedding' endpoints.
+    """
+
+    # TensorFlow is only imported by this backend, so serving a TFLite or NumPy model never loads it
+    import tensorflow as tf
+
+    return tf.saved_model.load(model_path)
+
+
+# loaders of the inference backends ModelRegistry can use, by name; each returns
+# an object whose serve(batch) gives the softmax output
+INFERENCE_BACKENDS = {"saved_model": load_saved_model, "tflite": TFLiteModel, "numpy": NumpyGenreModel}
+
+
+class ModelRegistry:
+    """
+    Process-wide holder for the trained model and the genre label map.
+
+    The model and labels are loaded lazily on first use and kept warm for every
+    later prediction. On each access the modification times of the SavedModel
+    and label files are compared to the ones seen at load time, and the pair is
+    reloaded when either changed on disk. The backend names one of
+    INFERENCE_BACKENDS: 'saved_model' loads a SavedModel directory, 'tflite' a
+    quantized .tflite file and 'numpy' a .npz file of weights for NumpyGenreModel.
+
+    Timing counters are kept for model loads and for each prediction request so
+    that steady-state latency can be checked separately from load time.
+
+    Example:
+        registry = ModelRegistry("model_saved", "genre_labels.json")
+        trained_model, genre_labels = registry.get()
+    """
+
+    def __init__(self, model_directory: str = MODEL_DIRECTORY,
+                 labels_file: str = GENRE_LABELS_FILE, backend: str = "saved_model") -> None:
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"backend must be one of {tuple(INFERENCE_BACKENDS)}, not {backend!r}")
+        self.model_directory = model_directory
+        self.labels_file = labels_file
+        self.backend = backend
+        self._model = None
+        self._labels = None
+        self._signature = None
+        self._lock = threading.Lock()
+        self._stats = {"model_loads": 0, "load_seconds": 0.0, "requests": 0,
+                       "featurize_seconds": 0.0, "inference_seconds": 0.0,
+                       "last_request": {}}
+
+    def _file_signature(self) -> tuple:
+        """
+        Build a signature from the modification times of the files backing the model.
+
+        Returns:
+            tuple: (path, mtime) pairs; missing files have an mtime of None.
+        """
+
+        if self.backend in ("tflite", "numpy"):
+            watched_files = [self.model_directory, self.labels_file]
+        else:
+            watched_files = [
+                os.path.join(self.model_directory, "saved_model.pb"),
+                os.path.join(self.model_directory, "variables", "variables.index"),
+                self.labels_file
+            ]
+        signature = []
+        for watched_file in watched_files:
+            try:
+                signature.append((watched_file, os.stat(watched_file).st_mtime_ns))
+            except OSError:
+                signature.append((watched_file, None))
+        return tuple(signature)
+
+    def _load(self, signature: tuple) -> None:
+        """
+        Load the model with the registry's backend and the label map, and remember their signature.
+
+        Args:
+            signature (tuple): File signature taken before loading.
+
+        Returns:
+            None
+        """
+
+        load_start = time.perf_counter()
+        trained_model = INFERENCE_BACKENDS[self.backend](self.model_directory)
+        with open(self.labels_file) as input_file:
+            loaded_json_genres = json.load(input_file)
+        self._model = trained_model
+        self._labels = loaded_json_genres
+        self._signature = signature
+        self._stats["model_loads"] += 1
+        self._stats["load_seconds"] += time.perf_counter() - load_start
+
+    def get(self) -> tuple:
+        """
+        Return the warm model and label map, loading or hot-reloading them if needed.
+
+        Returns:
+            tuple: (trained_model, genre_labels) where genre_labels maps genre name to index.
+
+        Example:
+            trained_model, genre_labels = registry.get()
+        """
+
+        signature = self._file_signature()
+        with self._lock:
+            if self._model is None or signature != self._signature:
+                self._load(signature)
+            return self._model, self._labels
+
+    def reload(self) -> None:
+        """
+        Force the model and label map to be reloaded from disk.
+
+        Returns:
+            None
+        """
+
+        with self._lock:
+            self._load(self._file_signature())
+
+    def model_version(self) -> str:
+        """
+        Return a short version string of the model files currently on disk.
+
+        Returns:
+            str: Hash of the model and label file modification times.
+
+        Example:
+            cache_version = registry.model_version()
+        """
+
+        return hashlib.sha256(repr(self._file_signature()).encode()).hexdigest()[:16]
+
+    def fingerprint(self) -> str:
+        """
+        Return a fingerprint of the model contents, for stamping derived data.
+
+        The SavedModel's fingerprint.pb is hashed when present, otherwise saved_model.pb;
+        a .tflite or .npz model is hashed as a whole.
+
+        Returns:
+            str: Hex digest identifying the model.
+
+        Example:
+            catalog_fingerprint = registry.fingerprint()
+        """
+
+        fingerprint_paths = [os.path.join(self.model_directory, fingerprint_file)
+                             for fingerprint_file in ("fingerprint.pb", "saved_model.pb")]
+        if self.backend in ("tflite", "numpy"):
+            fingerprint_paths = [self.model_directory]
+        for fingerprint_path in fingerprint_paths:
+            if os.path.exists(fingerprint_path):
+                with open(fingerprint_path, "rb") as input_file:
+                    return hashlib.sha256(input_file.read()).hexdigest()
+        return "unknown"
+
+    def record_request(self, featurize_seconds: float, inference_seconds: float) -> None:
+        """
+        Add the stage timings of one prediction request to the counters.
+
+        Args:
+            featurize_seconds (float): Time spent decoding and building the spectrogram.
+            inference_seconds (float): Time spent in the model forward pass.
+
+        Returns:
+            None
+        """
+
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["featurize_seconds"] += featurize_seconds
+            self._stats["inference_seconds"] += inference_seconds
+            self._stats["last_request"] = {"featurize_seconds": featurize_seconds,
+                                           "inference_seconds": inference_seconds}
+
+    def timing_stats(self) -> dict:
+        """
+        Return a snapshot of the load and per-request timing counters.
+
+        Returns:
+            dict: Counters plus mean featurize/inference seconds per request.
+
+        Example:
+            print(registry.timing_stats()["mean_inference_seconds"])
+        """
+
+        with self._lock:
+            stats = dict(self._stats)
+        request_count = max(stats["requests"], 1)
+        stats["mean_featurize_seconds"] = stats["featurize_seconds"] / request_count
+        stats["mean_inference_seconds"] = stats["inference_seconds"] / request_count
+        return stats
+
+
+# shared registry used by every prediction in this process
+model_registry = ModelRegistry(MODEL_PATH, backend=MODEL_BACKEND)
+
+# shared spectrogram cache used by process_audio_file
+feature_cache = FeatureCache()
 
 
 def save_json_genre_labels() -> None:
@@ -47,69 +362,555 @@ def save_json_genre_labels() -> None:
         json.dump(dict_genre_labels, output_file)
 
 
-def process_audio_file(audio_file_to_process: str) -> np.ndarray:
+def compute_spectrogram(audio_file_to_process) -> np.ndarray:
     """
-    Load an audio file with Librosa, limiting the duration to the first 30 seconds.
+    Decode a 30 second window of an audio file and compute its mel-spectrogram.
     If the audio file has a duration greater than 65 second then the beginning of the
     30 second sample starts at the middle of the audio files duration.
 
+    Only the window is decoded, and bytes or file-like objects are decoded in
+    memory without being written to disk. Audio at other rates than 22050 Hz is
+    resampled with the faster soxr_mq resampler.
+
     Args:
-        audio_file_to_process (str): The path to the audio file.
+        audio_file_to_process: The path to the audio file, its contents as bytes,
+            or a binary file-like object.
 
     Returns:
-        np.ndarray: Processed audio spectrogram as a NumPy array.
+        np.ndarray: Mel-spectrogram in dB with shape (128, frames).
 
     Example:
-        processed_audio = process_audio_file("path/to/audio/file.mp3")
+        audio_spec_db = compute_spectrogram("path/to/audio/file.mp3")
+    """
+
+    # decode only the 30 second window the spectrogram is computed from
+    y, sr = decode_window(audio_file_to_process, duration=30.0, window_offset=middle_window_offset)
+    return mel_spectrogram_db(y, sr)
+
+
+def process_audio_file(audio_file_to_process, use_cache: bool = True) -> np.ndarray:
     """
+    Build the model input for an audio file, reusing a cached spectrogram when possible.
 
-    # load audio file with Librosa, limiting the duration to first 30 seconds
-    song_length = librosa.get_duration(path=audio_file_to_process)
-    start_time = 0
-    if song_length > 65.0:
-        start_time = song_length // 2
+    The spectrogram from compute_spectrogram is stored in the content-addressed
+    feature cache, so a file that was seen before is not decoded again.
 
-    y, sr = librosa.load(audio_file_to_process, offset=start_time, duration=30.0)
+    Args:
+        audio_file_to_process: The path to the audio file, its contents as bytes,
+            or a binary file-like object.
+        use_cache (bool): If False, always decode and compute the spectrogram.
 
-    frame_size = 2048
-    hop_size = 512
+    Returns:
+        np.ndarray: Processed audio spectrogram as a NumPy array.
 
-    # extract Short-Time Fourier Transform
-    audio_spec = librosa.feature.melspectrogram(y=y, sr=sr,  n_fft=frame_size, hop_length=hop_size)
+    Example:
+        processed_audio = process_audio_file("path/to/audio/file.mp3")
+    """
 
-    audio_spec_db = librosa.power_to_db(audio_spec, ref=np.max)
+    if use_cache:
+        audio_spec_db = feature_cache.get_or_compute(audio_file_to_process, FEATURE_PARAMETERS,
+                                                     compute_spectrogram)
+    else:
+        audio_spec_db = compute_spectrogram(audio_file_to_process)
 
     audio_spec_db = audio_spec_db[:, :, np.newaxis]
     audio_spec_db = np.expand_dims(audio_spec_db, axis=0)
     return audio_spec_db
 
 
-def predict_genre(audio_file_dir: str, return_list=False) -> list:
+def decode_windows(audio_file_to_process, window_count: int = 1,
+                   window_stride: float = WINDOW_DURATION) -> tuple[np.ndarray, list]:
+    """
+    Decode the span covering up to window_count windows once and cut the windows out of it.
+
+    Window placement comes from feature_extraction.window_offsets, so the first
+    window is always the one compute_spectrogram analyses.
+
+    Args:
+        audio_file_to_process: The path to the audio file, its contents as bytes,
+            or a binary file-like object.
+        window_count (int): Maximum number of 30 second windows.
+        window_stride (float): Seconds between the starts of neighbouring windows.
+
+    Returns:
+        tuple[np.ndarray, list]: float32 samples of shape (windows, samples), main
+            window first, and the start time of each window in seconds. A track
+            shorter than 30 seconds gives one shorter window.
+
+    Example:
+        windows, offsets = decode_windows("path/to/audio/file.mp3", window_count=8)
+    """
+
+    layout = {}
+
+    def span_start(song_length: float) -> float:
+        layout["offsets"] = window_offsets(song_length, window_count, window_stride)
+        return min(layout["offsets"])
+
+    # windows are never further apart than window_stride, so this span covers them all
+    span_duration = (window_count - 1) * window_stride + WINDOW_DURATION
+    y, sr = decode_window(audio_file_to_process, duration=span_duration, window_offset=span_start)
+    offsets = layout["offsets"]
+    window_samples = int(round(WINDOW_DURATION * sr))
+    if len(offsets) == 1:
+        return y[np.newaxis, :window_samples], offsets
+
+    span_offset = min(offsets)
+    windows = np.zeros((len(offsets), window_samples), dtype=np.float32)
+    for window_index, offset in enumerate(offsets):
+        first_sample = int(round((offset - span_offset) * sr))
+        window_data = y[first_sample:first_sample + window_samples]
+        windows[window_index, :len(window_data)] = window_data
+    return windows, offsets
+
+
+def process_audio_windows(audio_file_to_process, window_count: int = 1, window_stride: float = WINDOW_DURATION,
+                          use_cache: bool = True) -> np.ndarray:
+    """
+    Build the model input for up to window_count windows of an audio file from one decode.
+
+    With a single window this is process_audio_file. Several windows are
+    cached under their own key, which includes the window count and stride.
+
+    Args:
+        audio_file_to_process: The path to the audio file, its contents as bytes,
+            or a binary file-like object.
+        window_count (int): Maximum number of 30 second windows.
+        window_stride (float): Seconds between the starts of neighbouring windows.
+        use_cache (bool): If False, always decode and compute the spectrograms.
+
+    Returns:
+        np.ndarray: Spectrograms of shape (windows, 128, NUMBER_OF_FRAMES, 1), main window first.
+
+    Example:
+        model_input = process_audio_windows("path/to/audio/file.mp3", window_count=8)
+    """
+
+    if window_count <= 1:
+        return fit_spectrogram_frames(process_audio_file(audio_file_to_process, use_cache))
+
+    def compute_window_spectrograms(audio) -> np.ndarray:
+        windows, _ = decode_windows(audio, window_count, window_stride)
+        return mel_spectrogram_db(windows)
+
+    if use_cache:
+        window_parameters = dict(FEATURE_PARAMETERS, window_count=window_count, window_stride=window_stride)
+        audio_specs_db = feature_cache.get_or_compute(audio_file_to_process, window_parameters,
+                                                      compute_window_spectrograms)
+    else:
+        audio_specs_db = compute_window_spectrograms(audio_file_to_process)
+    return fit_spectrogram_frames(audio_specs_db[:, :, :, np.newaxis])
+
+
+def aggregate_probabilities(window_probabilities: np.ndarray, aggregation: str = "mean") -> np.ndarray:
+    """
+    Combine the softmax outputs of several windows of one track.
+
+    Args:
+        window_probabilities (np.ndarray): (windows, genres) model outputs.
+        aggregation (str): 'mean' averages the probabilities; 'log_mean' averages
+            their logarithms (a normalised geometric mean), which favours genres
+            every window agrees on.
+
+    Returns:
+        np.ndarray: (genres,) probabilities summing to one.
+
+    Raises:
+        ValueError: If aggregation is not one of AGGREGATIONS.
+
+    Example:
+        track_probabilities = aggregate_probabilities(results, "log_mean")
+    """
+
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"aggregation must be one of {AGGREGATIONS}, not {aggregation!r}")
+    if len(window_probabilities) == 1:
+        return window_probabilities[0]
+    if aggregation == "mean":
+        return window_probabilities.mean(axis=0)
+    log_probabilities = np.log(np.clip(window_probabilities, 1e-7, 1.0)).mean(axis=0)
+    track_probabilities = np.exp(log_probabilities - log_probabilities.max())
+    return track_probabilities / track_probabilities.sum()
+
+
+def aggregate_embeddings(window_embeddings: np.ndarray) -> np.ndarray:
+    """
+    Average the embeddings of several windows of one track into one unit-length embedding.
+
+    Args:
+        window_embeddings (np.ndarray): (windows, EMBEDDING_DIMENSIONS) embeddings.
+
+    Returns:
+        np.ndarray: float16 embedding of shape (EMBEDDING_DIMENSIONS,).
+    """
+
+    if len(window_embeddings) == 1:
+        return window_embeddings[0]
+    mean_embedding = np.asarray(window_embeddings, dtype=np.float32).mean(axis=0)
+    norm = max(float(np.linalg.norm(mean_embedding)), float(np.finfo(np.float32).tiny))
+    return (mean_embedding / norm).astype(np.float16)
+
+
+def windows_within_budget(remaining_seconds: float, window_total: int) -> int:
+    """
+    Choose how many windows can be featurized and scored in the remaining time.
+
+    The cost of a window is estimated from earlier predict_genre_windows calls in
+    this process. Before any call has been measured only the main window is used.
+
+    Args:
+        remaining_seconds (float): Time left in the budget.
+        window_total (int): Number of windows that were decoded.
+
+    Returns:
+        int: Number of windows to use, at least 1.
+    """
+
+    with _window_cost_lock:
+        featurize_seconds = _window_seconds["featurize"]
+        inference_seconds = _window_seconds["inference"]
+    if featurize_seconds is None or inference_seconds is None:
+        return 1
+    return max(1, min(window_total, int(remaining_seconds // max(featurize_seconds + inference_seconds, 1e-6))))
+
+
+def record_window_costs(featurize_seconds: float, inference_seconds: float, window_count: int) -> None:
+    """
+    Fold the measured per-window costs of one call into the running estimates.
+
+    Args:
+        featurize_seconds (float): Time spent computing the spectrograms.
+        inference_seconds (float): Time spent in the model forward pass.
+        window_count (int): Number of windows processed.
+
+    Returns:
+        None
+    """
+
+    with _window_cost_lock:
+        for stage, stage_seconds in (("featurize", featurize_seconds), ("inference", inference_seconds)):
+            per_window = stage_seconds / window_count
+            if _window_seconds[stage] is None:
+                _window_seconds[stage] = per_window
+            else:
+                _window_seconds[stage] += WINDOW_COST_SMOOTHING * (per_window - _window_seconds[stage])
+
+
+# running per-window cost estimates used by windows_within_budget
+_window_seconds = {"featurize": None, "inference": None}
+_window_cost_lock = threading.Lock()
+
+
+def predict_genre_windows(audio_file_to_process, window_count: int = 4, window_stride: float = WINDOW_DURATION,
+                          aggregation: str = "mean", time_budget: float = None, return_list=False,
+                          timings: dict = None):
+    """
+    Predict genre(s) from several windows of an audio file with one decode and one model call.
+
+    Up to window_count windows are decoded together, their spectrograms are
+    computed as one batch and run through the model in a single call, and the
+    per-window probabilities are combined with aggregate_probabilities. With a
+    time_budget in seconds, only as many windows as are expected to fit in it
+    are featurized and scored, the most central first; at least the main window
+    is always used. window_count=1 scores the same window as predict_genre.
+
+    Args:
+        audio_file_to_process: The path to the audio file, its contents as bytes,
+            or a binary file-like object.
+        window_count (int): Maximum number of 30 second windows, e.g. 1 for the
+            web app and 8 for offline catalog builds.
+        window_stride (float): Seconds between the starts of neighbouring windows.
+        aggregation (str): 'mean' or 'log_mean'.
+        time_budget (float): Optional time limit in seconds.
+        return_list (bool): If True, return a list of percentages only.
+        timings (dict): Optional dict filled with 'decode_seconds', 'featurize_seconds',
+            'inference_seconds', 'aggregate_seconds', 'total_seconds',
+            'windows_decoded' and 'windows_used'.
+
+    Returns:
+        Union[List[float], List[tuple]]: List of genre predictions with percentages.
+
+    Raises:
+        ValueError: If aggregation is not one of AGGREGATIONS.
+
+    Example:
+        predict_genre_windows("path/to/audio/file.mp3", window_count=8, time_budget=2.0)
+    """
+
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"aggregation must be one of {AGGREGATIONS}, not {aggregation!r}")
+    if timings is None:
+        timings = {}
+
+    trained_model, loaded_json_genres = model_registry.get()
+    start_time = time.perf_counter()
+    windows, _ = decode_windows(audio_file_to_process, window_count, window_stride)
+    decode_end = time.perf_counter()
+
+    windows_used = len(windows)
+    if time_budget is not None:
+        windows_used = windows_within_budget(time_budget - (decode_end - start_time), len(windows))
+    audio_specs_db = mel_spectrogram_db(windows[:windows_used])
+    model_input = fit_spectrogram_frames(audio_specs_db[:, :, :, np.newaxis])
+    featurize_end = time.perf_counter()
+
+    window_probabilities, _ = run_model(trained_model, model_input)
+    inference_end = time.perf_counter()
+
+    results = aggregate_probabilities(window_probabilities, aggregation)
+    predictions = format_prediction(results.tolist(), loaded_json_genres, return_list)
+    end_time = time.perf_counter()
+
+    record_window_costs(featurize_end - decode_end, inference_end - featurize_end, windows_used)
+    model_registry.record_request(featurize_end - start_time, inference_end - featurize_end)
+    timings.update({"decode_seconds": decode_end - start_time, "featurize_seconds": featurize_end - decode_end,
+                    "inference_seconds": inference_end - featurize_end, "aggregate_seconds": end_time - inference_end,
+                    "total_seconds": end_time - start_time, "windows_decoded": len(windows),
+                    "windows_used": windows_used})
+    return predictions
+
+
+def projection_matrix(input_dimensions: int, output_dimensions: int = EMBEDDING_DIMENSIONS,
+                      seed: int = EMBEDDING_SEED) -> np.ndarray:
+    """
+    Return the fixed Gaussian random projection used to compress CNN activations.
+
+    The matrix depends only on its shape and seed, so catalogs and queries that
+    use the same settings always share the same embedding space. It is built
+    once per process and reused.
+
+    Args:
+        input_dimensions (int): Size of the flattened activations.
+        output_dimensions (int): Size of the embedding.
+        seed (int): Seed of the projection.
+
+    Returns:
+        np.ndarray: float32 matrix of shape (input_dimensions, output_dimensions).
+    """
+
+    matrix_key = (input_dimensions, output_dimensions, seed)
+    if matrix_key not in _projection_matrices:
+        rng = np.random.default_rng(seed)
+        matrix = rng.standard_normal((input_dimensions, output_dimensions), dtype=np.float32)
+        _projection_matrices[matrix_key] = matrix / np.float32(np.sqrt(output_dimensions))
+    return _projection_matrices[matrix_key]
+
+
+# projection matrices built so far, keyed by (input size, output size, seed)
+_projection_matrices = {}
+
+
+def project_embeddings(activations: np.ndarray) -> np.ndarray:
+    """
+    Reduce Flatten-layer activations to compact, unit-length float16 embeddings.
+
+    Args:
+        activations (np.ndarray): (tracks, features) activations feeding the Dense layer.
+
+    Returns:
+        np.ndarray: float16 array of shape (tracks, EMBEDDING_DIMENSIONS).
+
+    Example:
+        embeddings = project_embeddings(np.asarray(outputs["embedding"]))
+    """
+
+    activations = np.asarray(activations, dtype=np.float32).reshape(len(activations), -1)
+    projected = activations @ projection_matrix(activations.shape[1])
+    norms = np.linalg.norm(projected, axis=1, keepdims=True)
+    return (projected / np.maximum(norms, np.finfo(np.float32).tiny)).astype(np.float16)
+
+
+def run_model(trained_model, model_input: np.ndarray, return_embeddings=False) -> tuple:
+    """
+    Run one batch through the model, optionally returning embeddings from the same pass.
+
+    Embeddings need a model exported with model_build_training.export_inference_model,
+    which adds a 'serve_with_embedding' endpoint returning both the softmax output
+    and the Flatten activations.
+
+    Args:
+        trained_model: Loaded SavedModel.
+        model_input (np.ndarray): Batch of spectrograms, shape (tracks, 128, 1292, 1).
+        return_embeddings (bool): If True, also return projected embeddings.
+
+    Returns:
+        tuple: (probabilities array, embeddings array or None).
+
+    Raises:
+        ValueError: If embeddings are requested but the model has no embedding endpoint.
+    """
+
+    if not return_embeddings:
+        return np.asarray(trained_model.serve(model_input)), None
+    if not hasattr(trained_model, "serve_with_embedding"):
+        raise ValueError("The loaded model has no 'serve_with_embedding' endpoint; "
+                         "re-export it with model_build_training.export_inference_model")
+    outputs = trained_model.serve_with_embedding(model_input)
+    return np.asarray(outputs["predictions"]), project_embeddings(np.asarray(outputs["embedding"]))
+
+
+def accepts_variable_frames(trained_model) -> bool:
+    """
+    Check whether a model's serve endpoint accepts any number of frames.
+
+    Models from build_model(variable_length=True) average over time and are
+    exported with a variable frame axis; the original Flatten model is not.
+    TFLiteModel reports this from the converted model's shape signature.
+
+    Args:
+        trained_model: Loaded SavedModel.
+
+    Returns:
+        bool: True if the frame axis of the serve input is unknown.
+    """
+
+    if hasattr(trained_model, "variable_frames"):
+        return trained_model.variable_frames
+    serve_signature = getattr(trained_model.serve, "input_signature", None)
+    if not serve_signature:
+        concrete_functions = getattr(trained_model.serve, "concrete_functions", None)
+        if not concrete_functions:
+            return False
+        serve_signature = concrete_functions[0].structured_input_signature[0]
+    return serve_signature[0].shape[2] is None
+
+
+def prefix_spectrogram(audio_file_array: np.ndarray, prefix_frames: int = PROGRESSIVE_PREFIX_FRAMES) -> np.ndarray:
+    """
+    Take the first frames of a spectrogram, rescaled as if only the prefix had been analysed.
+
+    The prefix is shifted so its loudest bin is 0 dB and floored at -80 dB, which
+    is what power_to_db(ref=np.max) gives for that much audio, and what
+    model_build_training.random_prefix_crop trains on.
+
+    Args:
+        audio_file_array (np.ndarray): Spectrograms of shape (tracks, 128, frames, 1).
+        prefix_frames (int): Number of frames to keep.
+
+    Returns:
+        np.ndarray: Spectrograms of shape (tracks, 128, prefix_frames, 1).
+    """
+
+    prefix = audio_file_array[:, :, :prefix_frames, :]
+    prefix = prefix - prefix.max(axis=(1, 2, 3), keepdims=True)
+    return np.maximum(prefix, -80.0)
+
+
+def run_model_progressive(trained_model, audio_file_array: np.ndarray,
+                          confidence_threshold: float = EARLY_EXIT_CONFIDENCE,
+                          prefix_frames: int = PROGRESSIVE_PREFIX_FRAMES) -> tuple:
+    """
+    Score a short prefix of one spectrogram first and only run the full window if unsure.
+
+    If the highest genre probability of the prefix reaches confidence_threshold,
+    that result is returned at once. Otherwise the whole window is scored. Models
+    that only accept the full 1292 frames always score the whole window.
+
+    Args:
+        trained_model: Loaded SavedModel.
+        audio_file_array (np.ndarray): Spectrogram of shape (1, 128, frames, 1).
+        confidence_threshold (float): Top-1 probability needed to stop after the prefix.
+        prefix_frames (int): Number of frames scored first.
+
+    Returns:
+        tuple: (probabilities array of shape (1, genres), number of frames of the
+            result: prefix_frames after an early exit, else NUMBER_OF_FRAMES).
+    """
+
+    full_input = fit_spectrogram_frames(audio_file_array)
+    prefix_frames = max(prefix_frames, MIN_MODEL_FRAMES)
+    if prefix_frames < full_input.shape[2] and accepts_variable_frames(trained_model):
+        prefix_results = np.asarray(trained_model.serve(prefix_spectrogram(full_input, prefix_frames)))
+        if prefix_results.max() >= confidence_threshold:
+            return prefix_results, prefix_frames
+    return np.asarray(trained_model.serve(full_input)), full_input.shape[2]
+
+
+def predict_genre(audio_file_dir: str, return_list=False, return_embedding=False,
+                  confidence_threshold: float = None):
     """
     Predict genre(s) for an audio file and return the results.
 
     Args:
         audio_file_dir (str): The path to the audio file.
         return_list (bool): If True, return a list of percentages only.
+        return_embedding (bool): If True, also return the track embedding from the
+            same forward pass.
+        confidence_threshold (float): If set, predict progressively with
+            run_model_progressive and stop after the prefix at this top-1 probability.
 
     Returns:
-        Union[List[float], List[tuple]]: List of genre predictions with percentages.
+        Union[List[float], List[tuple]]: List of genre predictions with percentages,
+            or a (predictions, embedding) tuple when return_embedding is set.
 
     Example:
         predict_genre("path/to/audio/file.mp3", "my_trained_model", return_list=True)
     """
 
-    # Load the saved model and use it to predict the genre
+    featurize_start = time.perf_counter()
     audio_file_array = process_audio_file(audio_file_dir)
-    trained_model = tf.saved_model.load("model_saved")
-    results = trained_model.serve(audio_file_array)
+    return predict_features(audio_file_array, return_list, return_embedding,
+                            featurize_seconds=time.perf_counter() - featurize_start,
+                            confidence_threshold=confidence_threshold)
+
+
+def predict_features(audio_file_array: np.ndarray, return_list=False, return_embedding=False,
+                     featurize_seconds: float = 0.0, confidence_threshold: float = None):
+    """
+    Predict genre(s) for a spectrogram that has already been computed.
+
+    This is the model half of predict_genre, for callers such as the web app's
+    job queue that featurize audio somewhere else.
+
+    Args:
+        audio_file_array (np.ndarray): Spectrogram from process_audio_file, shape (1, 128, frames, 1).
+        return_list (bool): If True, return a list of percentages only.
+        return_embedding (bool): If True, also return the track embedding.
+        featurize_seconds (float): Time spent computing the spectrogram, for timing stats.
+        confidence_threshold (float): If set, predict progressively with
+            run_model_progressive. Ignored when an embedding is requested, since
+            embeddings always come from the full window.
+
+    Returns:
+        Union[List[float], List[tuple]]: List of genre predictions with percentages,
+            or a (predictions, embedding) tuple when return_embedding is set.
+
+    Example:
+        predict_features(process_audio_file("path/to/audio/file.mp3"))
+    """
+
+    # Use the warm model from the registry to predict the genre
+    trained_model, loaded_json_genres = model_registry.get()
+    inference_start = time.perf_counter()
+    if confidence_threshold is None or return_embedding:
+        results, embeddings = run_model(trained_model, audio_file_array, return_embedding)
+    else:
+        results, _ = run_model_progressive(trained_model, audio_file_array, confidence_threshold)
     # Change results to a readable format
-    results = results.numpy()
     results = results.flatten()
     results = results.tolist()
+    model_registry.record_request(featurize_seconds, time.perf_counter() - inference_start)
+
+    if return_embedding:
+        return format_prediction(results, loaded_json_genres, return_list), embeddings[0]
+    return format_prediction(results, loaded_json_genres, return_list)
 
-    with open("genre_labels.json") as input_file:
-        loaded_json_genres = json.load(input_file)
+
+def format_prediction(results: list, loaded_json_genres: dict, return_list=False) -> list:
+    """
+    Pair one row of model output with the genre labels.
+
+    Args:
+        results (list): Softmax output of the model for one track.
+        loaded_json_genres (dict): Mapping of genre name to output index.
+        return_list (bool): If True, return a list of percentages only.
+
+    Returns:
+        Union[List[float], List[tuple]]: List of genre predictions with percentages.
+
+    Example:
+        format_prediction([0.1, 0.9], {"blues": 0, "rock": 1})
+    """
 
     results_dictionary = {}
     for each_key in loaded_json_genres.keys():
@@ -124,15 +925,263 @@ def predict_genre(audio_file_dir: str, return_list=False) -> list:
     return sorted_results
 
 
+def fit_spectrogram_frames(audio_spec_db: np.ndarray) -> np.ndarray:
+    """
+    Trim or pad a (1, 128, frames, 1) spectrogram to the model's fixed frame count.
+
+    Clips shorter than 30 seconds are padded with the spectrogram's quietest value
+    so that every track in a batch can be stacked into one array.
+
+    Args:
+        audio_spec_db (np.ndarray): Spectrogram returned by process_audio_file.
+
+    Returns:
+        np.ndarray: Spectrogram with exactly NUMBER_OF_FRAMES frames.
+
+    Example:
+        fixed_spec = fit_spectrogram_frames(process_audio_file("path/to/short.wav"))
+    """
+
+    frame_count = audio_spec_db.shape[2]
+    if frame_count >= NUMBER_OF_FRAMES:
+        return audio_spec_db[:, :, :NUMBER_OF_FRAMES, :]
+    padding = ((0, 0), (0, 0), (0, NUMBER_OF_FRAMES - frame_count), (0, 0))
+    return np.pad(audio_spec_db, padding, constant_values=audio_spec_db.min())
+
+
+def predict_genres(audio_file_dirs: list, batch_size: int = 8, workers: int = 4,
+                   return_list=False, stats: dict = None, return_embeddings=False,
+                   window_count: int = 1, window_stride: float = WINDOW_DURATION, aggregation: str = "mean",
+                   failures: list = None):
+    """
+    Predict genres for many audio files, running the model once per batch.
+
+    Files are decoded and turned into spectrograms on a thread pool while earlier
+    batches run through the model. At most two batches of spectrograms, each up
+    to batch_size * window_count windows, are held in memory at a time: the one
+    running through the model and the next one being featurized. Results are
+    yielded in the same order as the input paths.
+    With window_count above 1, every window of every track in a batch goes
+    through the same model call and each track's windows are aggregated as in
+    predict_genre_windows.
+
+    By default an error decoding any file is raised and ends the generator. When
+    a failures list is given, a file that cannot be decoded is recorded there and
+    skipped instead, so one corrupt file does not stop a long backfill.
+
+    Args:
+        audio_file_dirs (list): Paths to the audio files.
+        batch_size (int): Number of spectrograms stacked into one model call.
+        workers (int): Number of threads used for decoding and featurization.
+        return_list (bool): If True, yield lists of percentages only.
+        stats (dict): Optional dict that is filled with 'tracks', 'seconds' and
+            'tracks_per_second' as results are produced.
+        return_embeddings (bool): If True, also yield each track's embedding,
+            computed in the same batched forward pass.
+        window_count (int): Maximum number of 30 second windows per track.
+        window_stride (float): Seconds between the starts of neighbouring windows.
+        aggregation (str): 'mean' or 'log_mean', used when a track has several windows.
+        failures (list): Optional list that (audio_file_dir, error message) is appended
+            to for every file that could not be decoded, instead of raising.
+
+    Yields:
+        tuple: (audio_file_dir, predictions) with predictions formatted as in predict_genre,
+            or (audio_file_dir, predictions, embedding) when return_embeddings is set.
+
+    Example:
+        for track_path, track_prediction in predict_genres(track_paths, batch_size=16):
+            print(track_path, track_prediction[0])
+    """
+
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"aggregation must be one of {AGGREGATIONS}, not {aggregation!r}")
+    if stats is None:
+        stats = {}
+
+    trained_model, loaded_json_genres = model_registry.get()
+    pending_paths = iter(audio_file_dirs)
+    in_flight = deque()
+    # one batch is prefetched while the previous one runs through the model
+    max_in_flight = batch_size
+    tracks_done = 0
+    start_time = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def fill_queue() -> None:
+            # keep a bounded number of featurization jobs queued
+            while len(in_flight) < max_in_flight:
+                next_path = next(pending_paths, None)
+                if next_path is None:
+                    return
+                in_flight.append((next_path, executor.submit(process_audio_windows, next_path,
+                                                             window_count, window_stride)))
+
+        fill_queue()
+        while in_flight:
+            batch_paths = []
+            batch_arrays = []
+            featurize_start = time.perf_counter()
+            while in_flight and len(batch_paths) < batch_size:
+                track_path, future = in_flight.popleft()
+                try:
+                    track_array = future.result()
+                except Exception as error:
+                    if failures is None:
+                        raise
+                    failures.append((track_path, f"{type(error).__name__}: {error}"))
+                    continue
+                batch_paths.append(track_path)
+                batch_arrays.append(track_array)
+            fill_queue()
+            if not batch_arrays:
+                continue
+
+            # rows of each track's windows in the batch output
+            track_ends = np.cumsum([len(track_array) for track_array in batch_arrays])
+            track_starts = np.concatenate(([0], track_ends[:-1]))
+            batch_input = np.concatenate(batch_arrays, axis=0)
+            # the per-track arrays are not needed once stacked
+            del batch_arrays
+
+            inference_start = time.perf_counter()
+            batch_results, batch_embeddings = run_model(trained_model, batch_input, return_embeddings)
+            del batch_input
+            inference_end = time.perf_counter()
+            model_registry.record_request(inference_start - featurize_start,
+                                          inference_end - inference_start)
+
+            tracks_done += len(batch_paths)
+            elapsed = inference_end - start_time
+            stats["tracks"] = tracks_done
+            stats["seconds"] = elapsed
+            stats["tracks_per_second"] = tracks_done / elapsed if elapsed > 0 else 0.0
+
+            for track_path, track_start, track_end in zip(batch_paths, track_starts, track_ends):
+                results = aggregate_probabilities(batch_results[track_start:track_end], aggregation)
+                predictions = format_prediction(results.tolist(), loaded_json_genres, return_list)
+                if return_embeddings:
+                    yield track_path, predictions, aggregate_embeddings(batch_embeddings[track_start:track_end])
+                else:
+                    yield track_path, predictions
+
+
+def benchmark_early_exit(audio_file_paths: list, thresholds: tuple = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99),
+                         prefix_frames: int = PROGRESSIVE_PREFIX_FRAMES) -> list:
+    """
+    Measure the latency/accuracy trade-off of early-exit prediction over confidence thresholds.
+
+    Every file's prefix and full window are scored once and timed; each threshold
+    is then evaluated on those results, so all thresholds see the same runs.
+    Accuracy is measured against the file's genre when its parent directory is a
+    genre label (as in genres_original/<genre>/), and agreement against the
+    full-window prediction.
+
+    Args:
+        audio_file_paths (list): Audio files to score.
+        thresholds (tuple): Confidence thresholds to evaluate.
+        prefix_frames (int): Number of frames scored first.
+
+    Returns:
+        list: One dict per threshold, plus a final one for the full window only
+            (threshold None), with 'threshold', 'exit_rate', 'mean_latency_ms',
+            'agreement' and 'accuracy' (None when no file is labelled).
+
+    Raises:
+        ValueError: If the model does not accept variable-length input.
+
+    Example:
+        for row in benchmark_early_exit(glob.glob("genres_original/*/*.wav")):
+            print(row)
+    """
+
+    trained_model, loaded_json_genres = model_registry.get()
+    if not accepts_variable_frames(trained_model):
+        raise ValueError("The loaded model only accepts full windows; train it with "
+                         "model_build_training.train_model(..., variable_length=True)")
+
+    runs = []
+    for audio_file_path in audio_file_paths:
+        full_input = fit_spectrogram_frames(process_audio_file(audio_file_path))
+        prefix_input = prefix_spectrogram(full_input, prefix_frames)
+        if not runs:
+            # warm up both input shapes before timing
+            trained_model.serve(prefix_input)
+            trained_model.serve(full_input)
+        prefix_start = time.perf_counter()
+        prefix_results = np.asarray(trained_model.serve(prefix_input))[0]
+        prefix_end = time.perf_counter()
+        full_results = np.asarray(trained_model.serve(full_input))[0]
+        full_end = time.perf_counter()
+        genre_name = os.path.basename(os.path.dirname(audio_file_path))
+        runs.append({"prefix_seconds": prefix_end - prefix_start, "full_seconds": full_end - prefix_end,
+                     "prefix_confidence": float(prefix_results.max()),
+                     "prefix_top": int(prefix_results.argmax()), "full_top": int(full_results.argmax()),
+                     "label": loaded_json_genres.get(genre_name)})
+
+    report = []
+    labelled_runs = [run for run in runs if run["label"] is not None]
+    for threshold in tuple(thresholds) + (None,):
+        latencies = []
+        top_genres = []
+        exits = 0
+        for run in runs:
+            if threshold is not None and run["prefix_confidence"] >= threshold:
+                exits += 1
+                latencies.append(run["prefix_seconds"])
+                top_genres.append(run["prefix_top"])
+            else:
+                prefix_cost = run["prefix_seconds"] if threshold is not None else 0.0
+                latencies.append(prefix_cost + run["full_seconds"])
+                top_genres.append(run["full_top"])
+        correct = [top_genre == run["label"] for top_genre, run in zip(top_genres, runs) if run["label"] is not None]
+        report.append({"threshold": threshold, "exit_rate": exits / max(len(runs), 1),
+                       "mean_latency_ms": 1000 * sum(latencies) / max(len(latencies), 1),
+                       "agreement": sum(top_genre == run["full_top"] for top_genre, run in zip(top_genres, runs))
+                       / max(len(runs), 1),
+                       "accuracy": sum(correct) / len(labelled_runs) if labelled_runs else None})
+    return report
+
+
 if __name__ == "__main__":
+    # run "python genre_prediction.py --benchmark-early-exit <audio-directory>" with a
+    # variable-length model to see the latency/accuracy curve of early-exit prediction
+    if len(sys.argv) == 3 and sys.argv[1] == "--benchmark-early-exit":
+        benchmark_files = [os.path.join(root, file) for root, dirs, files in os.walk(sys.argv[2])
+                           for file in files if file.lower().endswith(('.wav', '.mp3', '.au'))]
+        for benchmark_row in benchmark_early_exit(benchmark_files):
+            accuracy = "n/a" if benchmark_row["accuracy"] is None else f"{benchmark_row['accuracy']:.3f}"
+            threshold = "full" if benchmark_row["threshold"] is None else f"{benchmark_row['threshold']:.2f}"
+            print(f"threshold {threshold}: {benchmark_row['mean_latency_ms']:.1f} ms, "
+                  f"early exits {benchmark_row['exit_rate']:.2f}, agreement {benchmark_row['agreement']:.3f}, "
+                  f"accuracy {accuracy}")
+        sys.exit(0)
+
     # Predict each song in sample_songs
+    sample_files = []
     for root, dirs, files in os.walk("sample_songs"):
         for file in files:
             if file.lower().endswith(('.wav', '.mp3', '.au')):
-                audio_file = os.path.join(root, file)
-                predict_results = predict_genre(audio_file)
-                print(audio_file)
-                for each_tuple in predict_results:
-                    if each_tuple[1] * 100 > 1:
-                        print(
-                            f"{each_tuple[0]} : {(each_tuple[1] * 100):.4f} %")
+                sample_files.append(os.path.join(root, file))
+
+    throughput_stats = {}
+    for audio_file, predict_results in predict_genres(sample_files, stats=throughput_stats):
+        print(audio_file)
+        for each_tuple in predict_results:
+            if each_tuple[1] * 100 > 1:
+                print(
+                    f"{each_tuple[0]} : {(each_tuple[1] * 100):.4f} %")
+
+    if throughput_stats:
+        print(f"Predicted {throughput_stats['tracks']} tracks at "
+              f"{throughput_stats['tracks_per_second']:.2f} tracks/second")
+
+    # Show that model loading happened once and is not part of per-request latency
+    timing_stats = model_registry.timing_stats()
+    print(f"Model loads: {timing_stats['model_loads']} ({timing_stats['load_seconds']:.2f} s total)")
+    print(f"Mean featurize time: {timing_stats['mean_featurize_seconds']:.3f} s, "
+          f"mean inference time: {timing_stats['mean_inference_seconds']:.3f} s")
+    cache_stats = feature_cache.stats()
+    print(f"Feature cache hits: {cache_stats['hits']}, misses: {cache_stats['misses']}")
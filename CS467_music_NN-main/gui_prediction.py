@@ -6,9 +6,10 @@
 
 import tkinter as tk
 from tkinter import filedialog
-from genre_prediction import predict_genre
+from genre_prediction import predict_genre, EARLY_EXIT_CONFIDENCE
 from music_file_conversion import youtube_get_audio
 import os
+import tempfile
 
 
 def open_music_file() -> None:
@@ -34,7 +35,7 @@ def open_music_file() -> None:
     # Get the prediction from the user selected file
     window.filename = filedialog.askopenfilename(filetypes=((".wav", "*.wav"), (".mp3", "*.mp3")))
     list_of_labels[0]['text'] = f"Results for file: {os.path.basename(window.filename)}"
-    result_list = predict_genre(window.filename)
+    result_list = predict_genre(window.filename, confidence_threshold=EARLY_EXIT_CONFIDENCE)
     display_genre_number = number_of_genres.get()
     for each_index in range(display_genre_number):
         list_of_labels[each_index + 1]['text'] = \
@@ -63,10 +64,12 @@ def open_url() -> None:
         each_current_label['text'] = ""
     url_to_use = url_input.get()
     list_of_labels[0]['text'] = f"Results for URL: {url_to_use}"
-    # Get the prediction from the URL
-    youtube_get_audio(url_to_use)
-    result_list = predict_genre("temp_file_youtube.mp3")
-    os.remove("temp_file_youtube.mp3")
+    # Get the prediction from the URL, downloading into a private directory
+    # that is removed even if the download or prediction fails
+    with tempfile.TemporaryDirectory(prefix="genre_gui_") as scratch_dir:
+        download_name = os.path.join(scratch_dir, "youtube")
+        youtube_get_audio(url_to_use, download_name)
+        result_list = predict_genre(download_name + ".mp3", confidence_threshold=EARLY_EXIT_CONFIDENCE)
     display_genre_number = number_of_genres.get()
     for each_index in range(display_genre_number):
         list_of_labels[each_index + 1]['text'] = \
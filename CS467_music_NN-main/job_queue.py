@@ -0,0 +1,380 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Bounded background job queue that runs genre predictions off the request thread
+
+import time
+import uuid
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# default limits of the web app's queue
+JOB_QUEUE_MAX_PENDING = 16
+JOB_QUEUE_FETCH_WORKERS = 4
+JOB_QUEUE_FEATURIZE_WORKERS = 2
+JOB_RESULT_TTL_SECONDS = 10 * 60
+# number of finished jobs kept for the wait and service time metrics
+JOB_TIMING_WINDOW = 1000
+# stages every job passes through, each with its own queue
+JOB_STAGES = ("fetch", "featurize", "infer")
+# times a job is resubmitted after the featurize worker running it died
+FEATURIZE_RETRIES = 1
+
+
+class QueueFullError(Exception):
+    """
+    Raised by JobQueue.submit when max_pending jobs are already waiting or running.
+    """
+
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    Return a percentile of a list of numbers by the nearest-rank method.
+
+    Args:
+        values (list): Numbers to summarise.
+        fraction (float): Percentile as a fraction, e.g. 0.95.
+
+    Returns:
+        float: The percentile, or 0.0 for an empty list.
+
+    Example:
+        p95 = percentile([0.1, 0.4, 0.2], 0.95)
+    """
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def timed_call(function, argument) -> tuple:
+    """
+    Call a function and report when it started and finished, for timing pool stages.
+
+    Run in the featurize worker process, so the time a job waited for a free
+    worker can be told apart from the time the worker spent on it.
+
+    Args:
+        function: Picklable function to call.
+        argument: Its single argument.
+
+    Returns:
+        tuple: (start time, result, end time), times from time.time().
+    """
+
+    call_start = time.time()
+    result = function(argument)
+    return call_start, result, time.time()
+
+
+class JobQueue:
+    """
+    Runs prediction jobs through three bounded pools so request handlers return at once.
+
+    Every job passes through the same stages:
+        1. fetch(source) -> audio, on a thread pool, since downloads are I/O bound. The
+           audio may be a path or the encoded file as bytes.
+        2. featurize(audio) -> features, on a process pool, since decoding and the
+           mel spectrogram are CPU bound. The function must be importable (picklable).
+        3. infer(features) -> result, on a single thread that owns the model.
+    finish(source, audio, result) is always called last, with result None when
+    a stage failed, so callers can clean up files and store results.
+
+    At most max_pending jobs may be queued or running; submit raises QueueFullError
+    beyond that so the web app can answer 429 instead of piling up requests. Finished
+    jobs are kept for result_ttl_seconds so clients can poll for them.
+
+    The time each job waits in front of every stage is recorded separately from
+    the time the stage runs, so the metrics show which pool is saturated. If a
+    featurize worker dies, e.g. killed for running out of memory, the process
+    pool is replaced and the jobs it was running are resubmitted once.
+
+    Example:
+        queue = JobQueue(fetch_audio, gp.process_audio_file, gp.predict_features, finish_job)
+        job_id = queue.submit({"kind": "youtube", "url": url})
+        print(queue.status(job_id))
+    """
+
+    def __init__(self, fetch, featurize, infer, finish=None,
+                 max_pending: int = JOB_QUEUE_MAX_PENDING,
+                 fetch_workers: int = JOB_QUEUE_FETCH_WORKERS,
+                 featurize_workers: int = JOB_QUEUE_FEATURIZE_WORKERS,
+                 result_ttl_seconds: float = JOB_RESULT_TTL_SECONDS) -> None:
+        self.fetch = fetch
+        self.featurize = featurize
+        self.infer = infer
+        self.finish = finish
+        self.max_pending = max_pending
+        self.fetch_workers = fetch_workers
+        self.featurize_workers = featurize_workers
+        self.result_ttl_seconds = result_ttl_seconds
+        self._lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        self._jobs = {}
+        self._pending = 0
+        self._counts = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0,
+                        "featurize_pool_restarts": 0}
+        self._wait_seconds = deque(maxlen=JOB_TIMING_WINDOW)
+        self._service_seconds = deque(maxlen=JOB_TIMING_WINDOW)
+        self._stage_wait_seconds = {stage: deque(maxlen=JOB_TIMING_WINDOW) for stage in JOB_STAGES}
+        self._fetch_pool = None
+        self._featurize_pool = None
+        self._infer_pool = None
+
+    def _pools(self) -> tuple:
+        # pools are started on first use so importing the web app stays cheap
+        with self._pool_lock:
+            if self._fetch_pool is None:
+                # spawn, not fork: forking a process that has TensorFlow loaded can deadlock
+                self._featurize_pool = self._new_featurize_pool()
+                self._infer_pool = ThreadPoolExecutor(1, thread_name_prefix="job-infer")
+                self._fetch_pool = ThreadPoolExecutor(self.fetch_workers, thread_name_prefix="job-fetch")
+        return self._fetch_pool, self._featurize_pool, self._infer_pool
+
+    def _new_featurize_pool(self) -> ProcessPoolExecutor:
+        # spawn, not fork: forking a process that has TensorFlow loaded can deadlock
+        return ProcessPoolExecutor(self.featurize_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_featurize_pool(self, broken_pool: ProcessPoolExecutor) -> None:
+        # every job that was on the broken pool lands here; only the first replaces it
+        with self._pool_lock:
+            if self._featurize_pool is not broken_pool:
+                return
+            self._featurize_pool = self._new_featurize_pool()
+        broken_pool.shutdown(wait=False)
+        with self._lock:
+            self._counts["featurize_pool_restarts"] += 1
+
+    def submit(self, source: dict) -> str:
+        """
+        Queue a job and return its ID without waiting for it to run.
+
+        Args:
+            source (dict): Description of the audio passed to fetch, e.g.
+                {"kind": "youtube", "url": url} or {"kind": "upload", "audio": audio_bytes},
+                as built by app.submit_job; uploads are passed as the file's bytes.
+
+        Returns:
+            str: The job ID.
+
+        Raises:
+            QueueFullError: If max_pending jobs are already queued or running.
+        """
+
+        with self._lock:
+            self._purge_expired()
+            if self._pending >= self.max_pending:
+                self._counts["rejected"] += 1
+                raise QueueFullError(f"{self._pending} jobs are already pending")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {"status": "queued", "submitted": time.time(), "started": None,
+                                  "finished": None, "stage_seconds": {}, "stage_wait_seconds": {},
+                                  "result": None, "error": None}
+            self._pending += 1
+            self._counts["submitted"] += 1
+
+        fetch_pool, _, _ = self._pools()
+        fetch_pool.submit(self._run_fetch, job_id, source)
+        return job_id
+
+    def add_finished(self, result) -> str:
+        """
+        Record a job that is already complete, such as a prediction cache hit.
+
+        Such jobs never occupy a queue slot, but can be polled like any other.
+
+        Args:
+            result: The job result.
+
+        Returns:
+            str: The job ID.
+        """
+
+        now = time.time()
+        with self._lock:
+            self._purge_expired()
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {"status": "done", "submitted": now, "started": now, "finished": now,
+                                  "stage_seconds": {}, "stage_wait_seconds": {}, "result": result,
+                                  "error": None}
+        return job_id
+
+    def _run_fetch(self, job_id: str, source: dict) -> None:
+        fetch_start = time.time()
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = "running"
+            job["started"] = fetch_start
+            job["stage_wait_seconds"]["fetch"] = fetch_start - job["submitted"]
+        audio_path = None
+        try:
+            audio_path = self.fetch(source)
+            self._record_stage(job_id, "fetch", fetch_start)
+        except Exception as error:
+            self._complete(job_id, source, audio_path, None, error)
+            return
+        self._submit_featurize(job_id, source, audio_path, FEATURIZE_RETRIES)
+
+    def _submit_featurize(self, job_id: str, source: dict, audio_path: str, retries_left: int) -> None:
+        try:
+            _, featurize_pool, _ = self._pools()
+            featurize_submitted = time.time()
+            featurize_future = featurize_pool.submit(timed_call, self.featurize, audio_path)
+        except BrokenProcessPool as error:
+            # a worker died since the last job, so the pool refuses new work
+            if not retries_left:
+                self._complete(job_id, source, audio_path, None, error)
+                return
+            self._replace_featurize_pool(featurize_pool)
+            self._submit_featurize(job_id, source, audio_path, retries_left - 1)
+            return
+        except Exception as error:
+            self._complete(job_id, source, audio_path, None, error)
+            return
+        featurize_future.add_done_callback(
+            lambda future: self._after_featurize(job_id, source, audio_path, featurize_submitted, future,
+                                                 featurize_pool, retries_left))
+
+    def _after_featurize(self, job_id: str, source: dict, audio_path: str, featurize_submitted: float,
+                         featurize_future, featurize_pool: ProcessPoolExecutor, retries_left: int) -> None:
+        try:
+            worker_start, features, worker_end = featurize_future.result()
+            with self._lock:
+                job = self._jobs[job_id]
+                job["stage_wait_seconds"]["featurize"] = worker_start - featurize_submitted
+                job["stage_seconds"]["featurize"] = worker_end - worker_start
+            _, _, infer_pool = self._pools()
+            infer_pool.submit(self._run_infer, job_id, source, audio_path, features, time.time())
+        except BrokenProcessPool as error:
+            if not retries_left:
+                self._complete(job_id, source, audio_path, None, error)
+                return
+            # replace the pool and resubmit from a fetch thread, not the dying pool's own thread
+            self._replace_featurize_pool(featurize_pool)
+            fetch_pool, _, _ = self._pools()
+            fetch_pool.submit(self._submit_featurize, job_id, source, audio_path, retries_left - 1)
+        except Exception as error:
+            self._complete(job_id, source, audio_path, None, error)
+
+    def _run_infer(self, job_id: str, source: dict, audio_path: str, features, infer_submitted: float) -> None:
+        infer_start = time.time()
+        with self._lock:
+            self._jobs[job_id]["stage_wait_seconds"]["infer"] = infer_start - infer_submitted
+        try:
+            result = self.infer(features)
+            self._record_stage(job_id, "infer", infer_start)
+            self._complete(job_id, source, audio_path, result, None)
+        except Exception as error:
+            self._complete(job_id, source, audio_path, None, error)
+
+    def _record_stage(self, job_id: str, stage: str, stage_start: float) -> None:
+        with self._lock:
+            self._jobs[job_id]["stage_seconds"][stage] = time.time() - stage_start
+
+    def _complete(self, job_id: str, source: dict, audio_path: str, result, error) -> None:
+        if self.finish is not None:
+            try:
+                self.finish(source, audio_path, result)
+            except Exception as finish_error:
+                if error is None:
+                    error = finish_error
+        finished = time.time()
+        with self._lock:
+            job = self._jobs[job_id]
+            job["finished"] = finished
+            if error is None:
+                job["status"] = "done"
+                job["result"] = result
+                self._counts["completed"] += 1
+            else:
+                job["status"] = "failed"
+                job["error"] = str(error) or type(error).__name__
+                self._counts["failed"] += 1
+            # time spent queued in front of any stage is wait, the rest is service
+            wait_seconds = sum(job["stage_wait_seconds"].values())
+            self._wait_seconds.append(wait_seconds)
+            self._service_seconds.append(finished - job["submitted"] - wait_seconds)
+            for stage, stage_wait in job["stage_wait_seconds"].items():
+                self._stage_wait_seconds[stage].append(stage_wait)
+            self._pending -= 1
+
+    def _purge_expired(self) -> None:
+        # caller holds the lock
+        oldest_kept = time.time() - self.result_ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["finished"] is not None and job["finished"] < oldest_kept]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def status(self, job_id: str):
+        """
+        Return a copy of a job's state, or None if the ID is unknown or expired.
+
+        Args:
+            job_id (str): ID returned by submit or add_finished.
+
+        Returns:
+            Union[dict, None]: Job fields 'status' ('queued', 'running', 'done' or
+                'failed'), timestamps, 'stage_seconds', 'stage_wait_seconds' (time
+                queued in front of each stage), 'result' and 'error'.
+        """
+
+        with self._lock:
+            self._purge_expired()
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job_state = dict(job)
+            job_state["stage_seconds"] = dict(job["stage_seconds"])
+            job_state["stage_wait_seconds"] = dict(job["stage_wait_seconds"])
+        return job_state
+
+    def metrics(self) -> dict:
+        """
+        Return queue depth, job counts, and wait and service time summaries.
+
+        Wait time is the time a job spent queued in front of the fetch, featurize
+        and infer stages together, and fetch_wait_seconds, featurize_wait_seconds
+        and infer_wait_seconds split it by stage, so a growing wait shows which
+        pool is saturated. Service time is the rest of the time from submission
+        to completion. All cover the last JOB_TIMING_WINDOW finished jobs.
+
+        Returns:
+            dict: Queue metrics for this process.
+
+        Example:
+            print(queue.metrics()["queue_depth"])
+        """
+
+        with self._lock:
+            metrics = dict(self._counts)
+            metrics["queue_depth"] = self._pending
+            metrics["running"] = sum(1 for job in self._jobs.values() if job["status"] == "running")
+            metrics["max_pending"] = self.max_pending
+            timings = [("wait_seconds", list(self._wait_seconds)), ("service_seconds", list(self._service_seconds))]
+            timings += [(f"{stage}_wait_seconds", list(stage_waits))
+                        for stage, stage_waits in self._stage_wait_seconds.items()]
+        for name, values in timings:
+            metrics[f"{name}_mean"] = sum(values) / len(values) if values else 0.0
+            metrics[f"{name}_p95"] = percentile(values, 0.95)
+        return metrics
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop the worker pools.
+
+        Args:
+            wait (bool): If True, wait for running jobs to finish.
+
+        Returns:
+            None
+        """
+
+        for pool in (self._fetch_pool, self._featurize_pool, self._infer_pool):
+            if pool is not None:
+                pool.shutdown(wait=wait)
@@ -5,17 +5,37 @@
 # Description: Data pre-processing program for creating training and validation dataset
 
 import os
+import sys
 import json
+import time
+import re
+from collections import Counter
 import numpy as np
 import tensorflow as tf
 
+# file names inside a streamed dataset directory
+DATASET_SPECTROGRAMS_FILE = "spectrograms.npy"
+DATASET_LABELS_FILE = "labels.npy"
+DATASET_ORDER_FILE = "shuffle_order.npy"
+DATASET_SAMPLES_FILE = "samples.txt"
+DATASET_TRAIN_FILE = "train_indices.npy"
+DATASET_VALIDATION_FILE = "validation_indices.npy"
 
-def pre_process(data_directory: str) -> tuple[np.ndarray, np.ndarray]:
+# window suffix and file ending added by librosa_conversion, e.g. 'song_30bef_mel_spectrogram.txt.npy'
+WINDOW_SUFFIX_PATTERN = re.compile(r'(_\d+(\.\d+)?(bef|aft))?_mel_spectrogram(\.txt)?\.npy$')
+
+
+def pre_process(data_directory: str, labels_file: str = "../genre_labels.json") -> tuple[np.ndarray, np.ndarray]:
     """
     Concatenate .npy files into a NumPy array and build a list of training labels.
 
+    Note:
+        The whole corpus is held in memory several times over while it is built
+        and shuffled. Use build_spectrogram_dataset for large corpora.
+
     Args:
         data_directory (str): Directory path containing .npy files.
+        labels_file (str): Path the genre label JSON is written to.
 
     Returns:
         tuple[np.ndarray, np.ndarray]: NumPy arrays representing data and labels.
@@ -54,7 +74,7 @@ def pre_process(data_directory: str) -> tuple[np.ndarray, np.ndarray]:
                 file_count += 1
                 print(f'Processed file: {file_count}', end='\r')
 
-    with open("../genre_labels.json", "w") as output_file:
+    with open(labels_file, "w") as output_file:
         json.dump(dict_genre_labels, output_file)
 
     print(f'{file_count} files were added to the dataset!')
@@ -72,6 +92,337 @@ def pre_process(data_directory: str) -> tuple[np.ndarray, np.ndarray]:
     return data, labels
 
 
+def source_track_key(sample_file: str) -> str:
+    """
+    Strip the window suffix from a spectrogram path so all windows of one track share a key.
+
+    Args:
+        sample_file (str): Path of a spectrogram .npy file.
+
+    Returns:
+        str: Path identifying the source track.
+
+    Example:
+        source_track_key("genres_original/rock/rock1_30bef_mel_spectrogram.txt.npy")
+    """
+
+    return WINDOW_SUFFIX_PATTERN.sub('', sample_file)
+
+
+def split_train_validation(sample_files: list, labels: list, validation_fraction: float = 0.2,
+                           seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Split samples into training and validation indices, stratified by genre and grouped by track.
+
+    All windows cut from one source track go to the same side of the split, and
+    each genre contributes about validation_fraction of its tracks to validation.
+    Tracks and their windows are sorted by name before the seeded shuffle, so the
+    split depends only on the file names and the seed, not on the order a
+    filesystem lists them in.
+
+    Args:
+        sample_files (list): Source .npy path of each sample.
+        labels (list): Genre label of each sample.
+        validation_fraction (float): Share of each genre's tracks used for validation.
+        seed (int): Seed for choosing the validation tracks.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Shuffled training indices and sorted validation indices.
+
+    Example:
+        train_indices, validation_indices = split_train_validation(files, labels, 0.2)
+    """
+
+    rng = np.random.default_rng(seed)
+    tracks_by_label = {}
+    samples_by_track = {}
+    for sample_index, (sample_file, label) in enumerate(zip(sample_files, labels)):
+        track_key = source_track_key(sample_file)
+        if track_key not in samples_by_track:
+            samples_by_track[track_key] = []
+            tracks_by_label.setdefault(label, []).append(track_key)
+        samples_by_track[track_key].append(sample_index)
+    for track_samples in samples_by_track.values():
+        track_samples.sort(key=lambda sample_index: sample_files[sample_index])
+
+    train_indices = []
+    validation_indices = []
+    for label in sorted(tracks_by_label):
+        label_tracks = sorted(tracks_by_label[label])
+        rng.shuffle(label_tracks)
+        validation_count = int(round(len(label_tracks) * validation_fraction))
+        if validation_fraction > 0 and len(label_tracks) > 1:
+            validation_count = min(max(validation_count, 1), len(label_tracks) - 1)
+        for track_position, track_key in enumerate(label_tracks):
+            if track_position < validation_count:
+                validation_indices.extend(samples_by_track[track_key])
+            else:
+                train_indices.extend(samples_by_track[track_key])
+
+    train_indices = rng.permutation(np.array(train_indices, dtype=np.int64))
+    validation_indices = np.sort(np.array(validation_indices, dtype=np.int64))
+    return train_indices, validation_indices
+
+
+def build_spectrogram_dataset(data_directory: str, dataset_directory: str,
+                              labels_file: str = "../genre_labels.json", seed: int = None,
+                              validation_fraction: float = 0.2, split_seed: int = 0) -> int:
+    """
+    Stream .npy spectrograms into a preallocated memory-mapped dataset on disk.
+
+    A first pass reads only the .npy headers to count samples, check shapes and
+    assign labels. A memory-mapped array is then allocated and filled one file at
+    a time, so peak memory is about one spectrogram regardless of corpus size.
+    Shuffling is stored as an index permutation instead of reordering the data.
+
+    The dataset directory holds:
+        - spectrograms.npy: float32 array of shape (samples, rows, columns, 1).
+        - labels.npy: int64 genre label of each sample.
+        - shuffle_order.npy: random permutation of the sample indices.
+        - samples.txt: source .npy path of each sample, one per line.
+        - train_indices.npy, validation_indices.npy: the split from split_train_validation.
+
+    Args:
+        data_directory (str): Directory path containing genre subfolders of .npy files.
+        dataset_directory (str): Directory the dataset files are written to.
+        labels_file (str): Path the genre label JSON is written to.
+        seed (int): Optional seed for the shuffle permutation.
+        validation_fraction (float): Share of each genre's tracks held out for validation.
+        split_seed (int): Seed for the train/validation split.
+
+    Returns:
+        int: Number of samples written.
+
+    Raises:
+        FileNotFoundError: If 'data_directory' does not exist or is not accessible.
+        ValueError: If no .npy files are found.
+
+    Example:
+        sample_count = build_spectrogram_dataset("genres_original", "dataset_arrays")
+    """
+
+    if not os.path.isdir(data_directory):
+        raise FileNotFoundError(f'{data_directory} does not exist or is not accessible.')
+
+    found_files = []
+
+    # first pass: headers only, to size the output array; walked in name order so
+    # labels, sample order and the split are the same on every filesystem
+    for root, sub_dirs, files in os.walk(data_directory):
+        sub_dirs.sort()
+        subfolder_name = os.path.basename(root)
+
+        for file in sorted(files):
+            if file.endswith(".npy"):
+                file_path = os.path.join(root, file)
+                file_shape = np.load(file_path, mmap_mode='r').shape
+                found_files.append((file_path, subfolder_name, file_shape))
+
+    # every sample must match the most common spectrogram shape
+    shape_counts = Counter(file_shape for _, _, file_shape in found_files)
+    sample_shape = shape_counts.most_common(1)[0][0] if shape_counts else None
+    skipped_count = 0
+    sample_files = []
+    labels = []
+    dict_genre_labels = {}
+    last_unused_label = 0
+
+    for file_path, subfolder_name, file_shape in found_files:
+        if file_shape != sample_shape:
+            skipped_count += 1
+            continue
+        # build lists of files and labels
+        if subfolder_name not in dict_genre_labels:
+            dict_genre_labels[subfolder_name] = last_unused_label
+            last_unused_label += 1
+        sample_files.append(file_path)
+        labels.append(dict_genre_labels[subfolder_name])
+
+    if not sample_files:
+        raise ValueError(f'No .npy files were found in {data_directory}.')
+
+    with open(labels_file, "w") as output_file:
+        json.dump(dict_genre_labels, output_file)
+
+    # second pass: copy each spectrogram straight into the memory-mapped array
+    os.makedirs(dataset_directory, exist_ok=True)
+    data = np.lib.format.open_memmap(os.path.join(dataset_directory, DATASET_SPECTROGRAMS_FILE),
+                                     mode='w+', dtype=np.float32,
+                                     shape=(len(sample_files),) + tuple(sample_shape) + (1,))
+    for file_count, file_path in enumerate(sample_files, start=1):
+        data[file_count - 1, :, :, 0] = np.load(file_path)
+        print(f'Processed file: {file_count}', end='\r')
+    data.flush()
+    del data
+
+    np.save(os.path.join(dataset_directory, DATASET_LABELS_FILE), np.array(labels, dtype=np.int64))
+    shuffle_order = np.random.default_rng(seed).permutation(len(sample_files))
+    np.save(os.path.join(dataset_directory, DATASET_ORDER_FILE), shuffle_order)
+    with open(os.path.join(dataset_directory, DATASET_SAMPLES_FILE), "w") as output_file:
+        output_file.write("\n".join(sample_files) + "\n")
+
+    train_indices, validation_indices = split_train_validation(sample_files, labels,
+                                                               validation_fraction, split_seed)
+    np.save(os.path.join(dataset_directory, DATASET_TRAIN_FILE), train_indices)
+    np.save(os.path.join(dataset_directory, DATASET_VALIDATION_FILE), validation_indices)
+
+    print(f'{len(sample_files)} files were added to the dataset!')
+    print(f'{len(train_indices)} training and {len(validation_indices)} validation samples.')
+    if skipped_count:
+        print(f'{skipped_count} files were skipped because their shape was not {sample_shape}.')
+
+    return len(sample_files)
+
+
+def load_spectrogram_dataset(dataset_directory: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Open a dataset written by build_spectrogram_dataset without reading it into memory.
+
+    Args:
+        dataset_directory (str): Directory containing the dataset files.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: Memory-mapped data, labels and shuffle order.
+
+    Example:
+        data, labels, shuffle_order = load_spectrogram_dataset("dataset_arrays")
+    """
+
+    data = np.load(os.path.join(dataset_directory, DATASET_SPECTROGRAMS_FILE), mmap_mode='r')
+    labels = np.load(os.path.join(dataset_directory, DATASET_LABELS_FILE))
+    shuffle_order = np.load(os.path.join(dataset_directory, DATASET_ORDER_FILE))
+    return data, labels, shuffle_order
+
+
+def load_dataset_split(dataset_directory: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Load the training and validation indices saved by build_spectrogram_dataset.
+
+    Args:
+        dataset_directory (str): Directory containing the dataset files.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Training indices and validation indices.
+
+    Example:
+        train_indices, validation_indices = load_dataset_split("dataset_arrays")
+    """
+
+    train_indices = np.load(os.path.join(dataset_directory, DATASET_TRAIN_FILE))
+    validation_indices = np.load(os.path.join(dataset_directory, DATASET_VALIDATION_FILE))
+    return train_indices, validation_indices
+
+
+def create_tensorflow_dataset_from_directory(dataset_directory: str, batch_size: int = 32,
+                                             shuffle_buffer: int = 256, cache=None,
+                                             sample_indices: np.ndarray = None, shuffle: bool = True,
+                                             seed: int = None):
+    """
+    Build a batched, prefetching TensorFlow input pipeline over a memory-mapped dataset.
+
+    Samples are read from the spectrograms.npy memmap by a parallel map instead
+    of being embedded in the graph as constants. Without a cache the cheap index
+    list is fully shuffled before any data is read. With a cache the loaded
+    samples are cached once and a shuffle buffer of decoded samples is used.
+
+    Args:
+        dataset_directory (str): Directory written by build_spectrogram_dataset.
+        batch_size (int): Number of samples per training batch.
+        shuffle_buffer (int): Samples held in the shuffle buffer when caching.
+        cache: None for no cache, "memory" for an in-memory cache, or a file path
+            prefix for an on-disk cache.
+        sample_indices (np.ndarray): Optional subset of sample indices to use.
+            Default is the stored shuffle order of every sample.
+        shuffle (bool): If True, reshuffle the samples on every epoch.
+        seed (int): Optional seed for the shuffle.
+
+    Returns:
+        tf.data.Dataset: TensorFlow dataset of (spectrogram batch, label batch).
+
+    Example:
+        dataset = create_tensorflow_dataset_from_directory("dataset_arrays", batch_size=32, cache="memory")
+    """
+
+    data, labels, shuffle_order = load_spectrogram_dataset(dataset_directory)
+    if sample_indices is None:
+        sample_indices = shuffle_order
+    sample_shape = data.shape[1:]
+    labels_tensor = tf.constant(labels, dtype=tf.int64)
+
+    def read_sample(sample_index):
+        return data[sample_index]
+
+    def load_sample(sample_index):
+        spectrogram = tf.numpy_function(read_sample, [sample_index], tf.float32)
+        spectrogram.set_shape(sample_shape)
+        return spectrogram, tf.gather(labels_tensor, sample_index)
+
+    dataset = tf.data.Dataset.from_tensor_slices(np.asarray(sample_indices, dtype=np.int64))
+    if shuffle and cache is None:
+        dataset = dataset.shuffle(len(sample_indices), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.map(load_sample, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+    if cache == "memory":
+        dataset = dataset.cache()
+    elif cache is not None:
+        dataset = dataset.cache(cache)
+    if shuffle and cache is not None:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def benchmark_input_pipelines(dir_name: str = "benchmark_corpus", num_files: int = 32,
+                              batch_size: int = 32, epochs: int = 2) -> dict:
+    """
+    Compare epoch throughput of the in-graph batch(1) dataset and the file-based pipeline.
+
+    A synthetic corpus of 128x1292 matrices is generated with create_numpy_arrays,
+    converted into both dataset forms, and each dataset is iterated for a few
+    epochs. The first epoch includes warm-up and cache fill.
+
+    Args:
+        dir_name (str): Directory the synthetic corpus is created in. Must not exist.
+            The file-based dataset is written to dir_name + '_arrays'.
+        num_files (int): Number of matrices per genre subfolder.
+        batch_size (int): Batch size of the file-based pipeline.
+        epochs (int): Number of epochs timed for each pipeline.
+
+    Returns:
+        dict: Samples per second of each epoch, keyed by pipeline name.
+
+    Example:
+        benchmark_input_pipelines("benchmark_corpus", num_files=64)
+    """
+
+    subfolder_names = [f'genre{genre_index}' for genre_index in range(10)]
+    create_directories(dir_name, subfolder_names)
+    create_numpy_arrays(dir_name, subfolder_names, 128, 1292, num_files)
+    labels_file = os.path.join(dir_name, "genre_labels.json")
+    # kept outside dir_name so pre_process does not pick up the dataset files
+    dataset_directory = dir_name + "_arrays"
+    sample_count = build_spectrogram_dataset(dir_name, dataset_directory, labels_file=labels_file)
+
+    data, labels = pre_process(dir_name, labels_file=labels_file)
+    pipelines = {
+        "in_graph_batch_1": create_tensorflow_dataset(data, labels),
+        "file_based": create_tensorflow_dataset_from_directory(dataset_directory, batch_size=batch_size),
+        "file_based_cached": create_tensorflow_dataset_from_directory(dataset_directory, batch_size=batch_size,
+                                                                      cache="memory"),
+    }
+
+    throughput = {}
+    for pipeline_name, dataset in pipelines.items():
+        throughput[pipeline_name] = []
+        for epoch in range(epochs):
+            epoch_start = time.perf_counter()
+            for _ in dataset:
+                pass
+            epoch_seconds = time.perf_counter() - epoch_start
+            throughput[pipeline_name].append(sample_count / epoch_seconds)
+            print(f'{pipeline_name} epoch {epoch + 1}: {sample_count / epoch_seconds:.1f} samples/second')
+
+    return throughput
+
+
 def create_tensorflow_dataset(data_np_arr, labels_np_arr):
     """
     Convert NumPy arrays to a TensorFlow dataset.
@@ -142,14 +493,17 @@ def create_numpy_arrays(dir_name: str, subfolder_names: list, array_rows: int,
 
 if __name__ == "__main__":
 
+    # run "python data_pipeline.py benchmark" to compare input pipelines on a synthetic corpus
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        benchmark_input_pipelines()
+        sys.exit(0)
+
     # preprocess and then create a dataset
     print()
-    tf_data, tf_labels = pre_process("genres_original")
+    build_spectrogram_dataset("genres_original", "dataset_arrays")
     print()
 
-    tf_dataset = create_tensorflow_dataset(tf_data, tf_labels)
-
-    tf_dataset.save("dataset_file")
+    tf_dataset = create_tensorflow_dataset_from_directory("dataset_arrays")
 
     # shows the tensor shape
     print()
@@ -5,10 +5,25 @@
 # Description: Librosa conversion of audio files into mel-spectrograms
 
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import librosa
 import matplotlib.pyplot as plt
 import numpy as np
 
+# training features come from the same decoder and extractor as the app's predictions;
+# the scripts run from model_creation, so the shared modules one directory up are added
+# to the path before they are imported
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from audio_decoding import decode_window, RESAMPLE_TYPE  # noqa: E402 (needs the path above)
+from feature_extraction import (mel_extractor, middle_window_offset, SAMPLE_RATE, HOP_LENGTH,  # noqa: E402
+                                WINDOW_DURATION, LONG_TRACK_LENGTH)
+
+# list of files too short to convert, kept in the audio directory so resumed runs skip them
+SHORT_FILES_LIST = "short_audio_files.txt"
+# outcomes of converting one file
+PROCESSED, TOO_SHORT, FAILED = "processed", "too_short", "failed"
+
 
 def plot_spectrogram(y: np.ndarray, sr: float, hop_length: int, y_axis: str = "linear") -> None:
     """
@@ -36,13 +51,130 @@ def plot_spectrogram(y: np.ndarray, sr: float, hop_length: int, y_axis: str = "l
     plt.colorbar(format="%+2.f")
 
 
-def process_audio_file(audio_file_path: str, plot=False) -> bool:
+def spectrogram_output_path(audio_file_path: str, suffix: str = "") -> str:
+    """
+    Build the .npy path a spectrogram of an audio file is saved to.
+
+    Args:
+        audio_file_path (str): Path to the audio file.
+        suffix (str): Window suffix such as '_30bef'. Default is the main window.
+
+    Returns:
+        str: Path of the saved .npy file.
+
+    Example:
+        spectrogram_output_path("path/to/audio/file.mp3", "_30aft")
+    """
+
+    # the '.txt' in the name is kept from the files np.save wrote before this helper existed
+    return os.path.splitext(audio_file_path)[0] + suffix + '_mel_spectrogram.txt.npy'
+
+
+def window_layout(song_length: float, window_count: int = 4, window_stride: float = 30.0,
+                  window_duration: float = WINDOW_DURATION, long_track_length: float = LONG_TRACK_LENGTH) -> list:
+    """
+    Place the 30 second windows that are extracted from one track.
+
+    Tracks up to long_track_length seconds get a single window at the start.
+    Longer tracks get a main window starting at the middle of the track, the
+    same window genre_prediction analyses, plus
+    window_count - 1 extra windows spaced window_stride seconds apart, half of
+    them before the main window and the rest after it. Windows that would run
+    past either end of the track are dropped. The defaults reproduce the
+    original '_60bef', '_30bef', main and '_30aft' windows.
+
+    Args:
+        song_length (float): Duration of the track in seconds.
+        window_count (int): Number of windows for long tracks.
+        window_stride (float): Seconds between the starts of neighbouring windows.
+        window_duration (float): Length of each window in seconds.
+        long_track_length (float): Tracks longer than this get multiple windows.
+
+    Returns:
+        list: (suffix, offset) pairs; the main window has an empty suffix.
+
+    Example:
+        window_layout(200.0, window_count=8, window_stride=15.0)
+    """
+
+    if song_length <= long_track_length:
+        return [("", 0.0)]
+
+    start_time = middle_window_offset(song_length)
+    windows_before = window_count // 2
+    layout = []
+    for window_index in range(window_count):
+        relative_offset = (window_index - windows_before) * window_stride
+        offset = start_time + relative_offset
+        if offset < 0 or offset + window_duration > song_length:
+            continue
+        if relative_offset < 0:
+            suffix = f"_{-relative_offset:g}bef"
+        elif relative_offset > 0:
+            suffix = f"_{relative_offset:g}aft"
+        else:
+            suffix = ""
+        layout.append((suffix, offset))
+    return layout
+
+
+def extract_window_spectrograms(audio_file_path: str, offsets: list, window_duration: float = WINDOW_DURATION,
+                                out: np.ndarray = None) -> tuple[np.ndarray, float]:
+    """
+    Decode the span covering all windows once and build every window's mel-spectrogram.
+
+    Only the span is decoded, seeking past the start of the file, and it is
+    resampled a single time by audio_decoding.decode_window, the decoder the app
+    uses, so training and prediction see the same samples. Each window is sliced
+    out of that buffer, and the windows are stacked so the shared mel extractor
+    computes the STFT of all of them in one call.
+
+    Args:
+        audio_file_path (str): Path to the audio file.
+        offsets (list): Start time in seconds of each window.
+        window_duration (float): Length of each window in seconds.
+        out (np.ndarray): Optional float32 buffer of shape (windows, 128, frames)
+            to write the spectrograms into.
+
+    Returns:
+        tuple[np.ndarray, float]: Array of shape (windows, 128, frames) in dB and the sample rate.
+
+    Example:
+        spectrograms, sample_rate = extract_window_spectrograms("file.mp3", [0.0, 30.0])
+    """
+
+    span_start = min(offsets)
+    span_end = max(offsets) + window_duration
+    audio_data, sample_rate = decode_window(audio_file_path, duration=span_end - span_start,
+                                            window_offset=span_start, sr=SAMPLE_RATE, res_type=RESAMPLE_TYPE)
+
+    window_samples = int(round(window_duration * sample_rate))
+    windows = np.zeros((len(offsets), window_samples), dtype=np.float32)
+    for window_index, offset in enumerate(offsets):
+        first_sample = int(round((offset - span_start) * sample_rate))
+        window_data = audio_data[first_sample:first_sample + window_samples]
+        windows[window_index, :len(window_data)] = window_data
+
+    # each window is scaled against its own peak, as with separate loads
+    audio_specs_db = mel_extractor.extract(windows, out=out)
+    return audio_specs_db, sample_rate
+
+
+def process_audio_file(audio_file_path: str, plot=False, quiet=False,
+                       window_count: int = 4, window_stride: float = 30.0) -> bool:
     """
-    Convert an audio file to a mel-spectrogram and save as a .npy file.
+    Convert an audio file to mel-spectrograms and save each window as a .npy file.
+
+    Window placement comes from window_layout, and all windows are extracted from
+    one decode by extract_window_spectrograms. The main window is saved last, so
+    an existing main output means every window of the file has been written.
 
     Args:
         audio_file_path (str): Path to the audio file.
         plot (bool): If True, plot the mel-spectrogram. Default is False.
+        quiet (bool): If True, do not print messages for skipped or failed files.
+        window_count (int): Number of windows extracted from long tracks.
+        window_stride (float): Seconds between neighbouring windows of long tracks.
 
     Returns:
         bool: True if the processing is successful, False otherwise.
@@ -51,103 +183,164 @@ def process_audio_file(audio_file_path: str, plot=False) -> bool:
         process_audio_file("path/to/audio/file.mp3", plot=True)
     """
 
-    # load audio file with Librosa, limiting the duration to first 30 seconds
+    return convert_audio_file(audio_file_path, plot, quiet, window_count, window_stride) == PROCESSED
+
+
+def convert_audio_file(audio_file_path: str, plot=False, quiet=False,
+                       window_count: int = 4, window_stride: float = 30.0) -> str:
+    """
+    Convert an audio file as process_audio_file does and report why it was not converted.
+
+    Args:
+        audio_file_path (str): Path to the audio file.
+        plot (bool): If True, plot the mel-spectrogram. Default is False.
+        quiet (bool): If True, do not print messages for skipped or failed files.
+        window_count (int): Number of windows extracted from long tracks.
+        window_stride (float): Seconds between neighbouring windows of long tracks.
+
+    Returns:
+        str: PROCESSED, TOO_SHORT for files under 30 seconds, or FAILED.
+
+    Example:
+        if convert_audio_file("path/to/audio/file.mp3") == TOO_SHORT:
+            print("not enough audio for a window")
+    """
+
     try:
         song_length = librosa.get_duration(path=audio_file_path)  # returns a float
 
         # do not process files with a duration of less than 30 seconds
         if song_length < 30.0:
-            print(f"The following audio clip is less than 30 seconds: {audio_file_path}")
-            return False
-
-        start_time = 0
-        if song_length > 130.0:
-            start_time = song_length // 2
-
-        audio_data, sample_rate = librosa.load(audio_file_path, offset=start_time, duration=30.0)
-
-        frame_size = 2048
-        hop_size = 512
-
-        # extract Short-Time Fourier Transform
-        audio_spec = librosa.feature.melspectrogram(
-            y=audio_data,
-            sr=sample_rate,
-            n_fft=frame_size,
-            hop_length=hop_size
-        )
-
-        audio_spec_db = librosa.power_to_db(audio_spec, ref=np.max)
-
-        spectrogram_file = os.path.splitext(audio_file_path)[0] + '_mel_spectrogram.txt'
-        np.save(spectrogram_file, audio_spec_db)
-
-        if song_length > 130.0:
-            y, sr = librosa.load(audio_file_path, offset=start_time - 30.0, duration=30.0)
-            frame_size = 2048
-            hop_size = 512
-            audio_spec = librosa.feature.melspectrogram(y=y, sr=sr,  n_fft=frame_size, hop_length=hop_size)
-            audio_spec_db = librosa.power_to_db(audio_spec, ref=np.max)
-            spectrogram_file = os.path.splitext(audio_file_path)[0] + '_30bef_mel_spectrogram.txt'
-            np.save(spectrogram_file, audio_spec_db)
-
-        if song_length > 130.0:
-            y, sr = librosa.load(audio_file_path, offset=start_time - 60.0, duration=30.0)
-            frame_size = 2048
-            hop_size = 512
-            audio_spec = librosa.feature.melspectrogram(y=y, sr=sr,  n_fft=frame_size, hop_length=hop_size)
-            audio_spec_db = librosa.power_to_db(audio_spec, ref=np.max)
-            spectrogram_file = os.path.splitext(audio_file_path)[0] + '_60bef_mel_spectrogram.txt'
-            np.save(spectrogram_file, audio_spec_db)
-
-        if song_length > 130.0:
-            y, sr = librosa.load(audio_file_path, offset=start_time + 30.0, duration=30.0)
-            frame_size = 2048
-            hop_size = 512
-            audio_spec = librosa.feature.melspectrogram(y=y, sr=sr,  n_fft=frame_size, hop_length=hop_size)
-            audio_spec_db = librosa.power_to_db(audio_spec, ref=np.max)
-            spectrogram_file = os.path.splitext(audio_file_path)[0] + '_30aft_mel_spectrogram.txt'
-            np.save(spectrogram_file, audio_spec_db)
+            if not quiet:
+                print(f"The following audio clip is less than 30 seconds: {audio_file_path}")
+            return TOO_SHORT
+
+        layout = window_layout(song_length, window_count, window_stride)
+        # save the main window last
+        layout.sort(key=lambda window: window[0] == "")
+        audio_specs_db, sample_rate = extract_window_spectrograms(
+            audio_file_path, [offset for _, offset in layout])
+
+        for (suffix, _), audio_spec_db in zip(layout, audio_specs_db):
+            np.save(spectrogram_output_path(audio_file_path, suffix), audio_spec_db)
 
         # plot spectrograms
         if plot:
-            plot_spectrogram(audio_spec_db, sample_rate, hop_size)
+            plot_spectrogram(audio_specs_db[-1], sample_rate, HOP_LENGTH)
             plt.title(f'Mel-Spectrogram for {os.path.basename(audio_file_path)} (30 seconds)')
 
-        return True
+        return PROCESSED
 
     except Exception as e:
-        print(e)
-        print(f"Error loading: {audio_file_path}")
-        return False
+        if not quiet:
+            print(e)
+            print(f"Error loading: {audio_file_path}")
+        return FAILED
 
 
-def process_audio_database(audio_directory: str) -> None:
+def _process_audio_file_quietly(audio_file_path: str, window_count: int = 4,
+                                window_stride: float = 30.0) -> str:
+    """
+    Process one audio file without printing, for use in worker processes.
+
+    Args:
+        audio_file_path (str): Path to the audio file.
+        window_count (int): Number of windows extracted from long tracks.
+        window_stride (float): Seconds between neighbouring windows of long tracks.
+
+    Returns:
+        str: Outcome from convert_audio_file.
+    """
+
+    return convert_audio_file(audio_file_path, quiet=True,
+                              window_count=window_count, window_stride=window_stride)
+
+
+def process_audio_database(audio_directory: str, workers: int = 1, resume: bool = False,
+                           window_count: int = 4, window_stride: float = 30.0) -> dict:
     """
     Convert audio files in a directory to mel-spectrograms using process_audio_file.
 
+    With workers greater than 1 the files are spread over a process pool. At most
+    two jobs per worker are queued at once, so memory stays bounded on large
+    corpora. With resume set, files whose main spectrogram already exists are
+    skipped, which lets an interrupted run continue where it stopped. Files too
+    short for a window are listed in SHORT_FILES_LIST in audio_directory, so a
+    resumed run skips them too, and they are counted apart from failures.
+
     Args:
         audio_directory (str): Directory containing audio files.
+        workers (int): Number of worker processes. Default is 1 (serial).
+        resume (bool): If True, skip files that already have a saved spectrogram.
+        window_count (int): Number of windows extracted from long tracks.
+        window_stride (float): Seconds between neighbouring windows of long tracks.
 
     Returns:
-        None
+        dict: Counts of 'processed', 'skipped', 'too_short' and 'failed' files,
+            plus the list of 'failed_files'. Files skipped because an earlier run
+            found them too short count as 'skipped'.
 
     Example:
-        process_audio_database("path/to/audio/directory")
+        process_audio_database("path/to/audio/directory", workers=8, resume=True)
     """
 
     # process all audio files in the folder
     # edit to individual if individual file processing desired
-    file_count = 0
-    for root, dirs, files in os.walk(audio_directory):
-        for file in files:
-            if file.lower().endswith(('.wav', '.mp3', '.au')):
-                audio_file = os.path.join(root, file)
-                if process_audio_file(audio_file):
-                    file_count += 1
-                    print(f"Processed file {file_count}", end="\r")
-
-    print(f"Processed {file_count} files!")
+    counts = {"processed": 0, "skipped": 0, "too_short": 0, "failed": 0, "failed_files": []}
+    short_files_path = os.path.join(audio_directory, SHORT_FILES_LIST)
+    short_files = set()
+    if resume and os.path.exists(short_files_path):
+        with open(short_files_path) as short_files_list:
+            short_files = {line.rstrip("\n") for line in short_files_list if line.strip()}
+
+    def record_result(audio_file: str, outcome: str) -> None:
+        if outcome == PROCESSED:
+            counts["processed"] += 1
+        elif outcome == TOO_SHORT:
+            counts["too_short"] += 1
+            with open(short_files_path, "a") as short_files_list:
+                short_files_list.write(os.path.relpath(audio_file, audio_directory) + "\n")
+        else:
+            counts["failed"] += 1
+            counts["failed_files"].append(audio_file)
+        print(f"Processed {counts['processed']} files, skipped {counts['skipped']}, "
+              f"too short {counts['too_short']}, failed {counts['failed']}", end="\r")
+
+    def audio_files_to_process():
+        for root, dirs, files in os.walk(audio_directory):
+            for file in files:
+                if file.lower().endswith(('.wav', '.mp3', '.au')):
+                    audio_file = os.path.join(root, file)
+                    if resume and (os.path.exists(spectrogram_output_path(audio_file))
+                                   or os.path.relpath(audio_file, audio_directory) in short_files):
+                        counts["skipped"] += 1
+                        continue
+                    yield audio_file
+
+    if workers <= 1:
+        for audio_file in audio_files_to_process():
+            record_result(audio_file, _process_audio_file_quietly(audio_file, window_count, window_stride))
+    else:
+        max_in_flight = 2 * workers
+        in_flight = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for audio_file in audio_files_to_process():
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record_result(in_flight.pop(future), future.result())
+                future = executor.submit(_process_audio_file_quietly, audio_file,
+                                         window_count, window_stride)
+                in_flight[future] = audio_file
+            for future in wait(in_flight).done:
+                record_result(in_flight.pop(future), future.result())
+
+    print()
+    print(f"Processed {counts['processed']} files, skipped {counts['skipped']} existing, "
+          f"{counts['too_short']} too short, {counts['failed']} failed!")
+    for failed_file in counts["failed_files"]:
+        print(f"Failed: {failed_file}")
+    return counts
 
 # show the spectrograms
 # plt.show()
@@ -155,4 +348,5 @@ def process_audio_database(audio_directory: str) -> None:
 
 if __name__ == "__main__":
     DIRECTORY = 'genres_original'
-    process_audio_database(DIRECTORY)
+    WORKERS = os.cpu_count() or 1
+    process_audio_database(DIRECTORY, workers=WORKERS, resume=True)
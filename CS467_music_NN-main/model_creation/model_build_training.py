@@ -13,17 +13,32 @@ import keras
 from keras import layers
 import json
 import os
+import data_pipeline as dp
 
+# input pipeline settings used for training
+BATCH_SIZE = 32
+SHUFFLE_BUFFER = 256
+# cache of the training pipeline used by main: None reads the memory-mapped dataset
+# every epoch; "memory" holds every spectrogram in RAM and only suits small datasets
+TRAINING_CACHE = None
+# shortest prefix, in frames, that variable-length models are trained on (about 5 seconds)
+PREFIX_MIN_FRAMES = 216
 
-def build_model():
+
+def build_model(variable_length: bool = False):
     """
     Build a Convolutional Neural Network (CNN) model for genre classification.
 
+    Args:
+        variable_length (bool): If True, accept any number of frames by replacing
+            Flatten with an average over time of each frequency row, so
+            genre_prediction can score a short prefix of a window first. Default is the fixed 1292 frame model.
+
     Returns:
         A Keras Model object representing the genre classification model.
 
     Model Architecture:
-        - Input shape: (128, 1292, 1)
+        - Input shape: (128, 1292, 1), or (128, None, 1) with variable_length
         - Rescales input to the range of [0, 1].
         - Convolutional layers with ReLU activation.
         - Max pooling layers.
@@ -31,7 +46,8 @@ def build_model():
         - Dense layer with softmax activation for genre classification.
 
     Note:
-        The model is designed for a specific input shape (128, 1292, 1).
+        The default model is designed for a specific input shape (128, 1292, 1).
+        The variable_length model needs at least 63 frames.
 
     Reference:
         - The model architecture is inspired by common practices in image classification
@@ -42,7 +58,7 @@ def build_model():
     """
 
     number_of_genres = 10
-    input = keras.Input(shape=(128, 1292, 1))
+    input = keras.Input(shape=(128, None if variable_length else 1292, 1))
     # Rescaling puts everything in the range of [0, 1]
     output = layers.Rescaling(scale=1.0/80,
                               offset=1.0
@@ -64,8 +80,15 @@ def build_model():
     output = layers.Dropout(0.25)(output)
     output = layers.Conv2D(filters=512, kernel_size=(2, 2), activation="relu")(output)
     output = layers.AveragePooling2D(pool_size=(2, 2))(output)
-    # Flatten takes the entire system down to a 1D tensor
-    output = layers.Flatten()(output)
+    if variable_length:
+        # Average over time only: each of the frequency rows Flatten would keep gets
+        # its own 512 features, so any number of frames gives the same 3 x 512 inputs
+        output = layers.Permute((2, 1, 3))(output)
+        output = layers.Reshape((-1, output.shape[2] * output.shape[3]))(output)
+        output = layers.GlobalAveragePooling1D()(output)
+    else:
+        # Flatten takes the entire system down to a 1D tensor
+        output = layers.Flatten()(output)
     # Dropout randomly sets values to zero, to help with over fitting
     output = layers.Dropout(0.5)(output)
     # The last dense layer provides the "output" of 10 nodes
@@ -73,13 +96,82 @@ def build_model():
     return keras.Model(input, output)
 
 
-def train_model(path_to_dataset: str, model_name: str) -> None:
+def export_inference_model(model, export_dir: str) -> None:
+    """
+    Export a trained model as a SavedModel for genre_prediction.
+
+    The SavedModel has a 'serve' endpoint returning the softmax output, as before,
+    and a 'serve_with_embedding' endpoint that returns a dict with the softmax
+    'predictions' and the Flatten (or time pooling) layer activations as
+    'embedding' from the same forward pass. Models from build_model(variable_length=True)
+    are exported with a variable frame axis.
+
+    Args:
+        model: Trained Keras model from build_model.
+        export_dir (str): Directory the SavedModel is written to.
+
+    Returns:
+        None
+
+    Example:
+        export_inference_model(model, "../model_saved")
+    """
+
+    flatten_layer = [layer for layer in model.layers
+                     if isinstance(layer, (layers.Flatten, layers.GlobalAveragePooling1D))][-1]
+    embedding_model = keras.Model(model.input, {"predictions": model.output,
+                                                "embedding": flatten_layer.output})
+    input_signature = [tf.TensorSpec(shape=(None,) + tuple(model.input_shape[1:]), dtype=tf.float32)]
+
+    export_archive = keras.export.ExportArchive()
+    export_archive.track(model)
+    export_archive.track(embedding_model)
+    export_archive.add_endpoint(name="serve",
+                                fn=lambda inputs: model(inputs, training=False),
+                                input_signature=input_signature)
+    export_archive.add_endpoint(name="serve_with_embedding",
+                                fn=lambda inputs: embedding_model(inputs, training=False),
+                                input_signature=input_signature)
+    export_archive.write_out(export_dir)
+
+
+def random_prefix_crop(spectrograms, labels, min_frames: int = PREFIX_MIN_FRAMES) -> tuple:
+    """
+    Cut a batch of spectrograms to a random-length prefix, rescaled as genre_prediction does.
+
+    Each prefix is shifted so its loudest bin is 0 dB and floored at -80 dB, which
+    is what power_to_db(ref=np.max) gives for audio of that length.
+
+    Args:
+        spectrograms: Batch of spectrograms, shape (batch, 128, frames, 1).
+        labels: Batch of labels, passed through.
+        min_frames (int): Shortest prefix length.
+
+    Returns:
+        tuple: (cropped spectrograms, labels).
+
+    Example:
+        genre_dataset = genre_dataset.map(random_prefix_crop)
+    """
+
+    prefix_frames = tf.random.uniform((), min_frames, tf.shape(spectrograms)[2] + 1, dtype=tf.int32)
+    prefixes = spectrograms[:, :, :prefix_frames, :]
+    prefixes = prefixes - tf.reduce_max(prefixes, axis=[1, 2, 3], keepdims=True)
+    return tf.maximum(prefixes, -80.0), labels
+
+
+def train_model(path_to_dataset: str, model_name: str, batch_size: int = BATCH_SIZE, cache=None,
+                variable_length: bool = False) -> None:
     """
     Train a genre classification model using the provided dataset and save the trained model.
 
     Args:
-        path_to_dataset (str): The file path to the dataset for training.
+        path_to_dataset (str): The directory written by data_pipeline.build_spectrogram_dataset.
         model_name (str): The name to be used when saving the trained model.
+        batch_size (int): Number of samples per training batch.
+        cache: Input pipeline cache, None, "memory" or a file path prefix.
+        variable_length (bool): If True, train the time pooling model on random
+            prefixes of every batch, for early-exit prediction.
 
     Returns:
         None
@@ -88,16 +180,24 @@ def train_model(path_to_dataset: str, model_name: str) -> None:
         - The function uses the build_model function to create the neural network architecture.
         - The model is compiled using RMSprop optimizer and sparse categorical crossentropy loss.
         - The training is performed for 10 epochs.
+        - A SavedModel for genre_prediction is exported to model_name + "_saved".
+        - Validation uses the held-out tracks saved with the dataset, never the training samples.
 
     Example:
-        train_model("path/to/dataset.tfrecord", "my_trained_model")
+        train_model("path/to/dataset_arrays", "my_trained_model")
     """
 
-    path_to_val_set = "../dataset_file"
-    # generate the genre and validation datasets
-    genre_dataset = tf.data.Dataset.load(path_to_dataset)
-    val_dataset = tf.data.Dataset.load(path_to_val_set)
-    model = build_model()
+    # generate the genre and validation datasets from the saved track-level split
+    train_indices, validation_indices = dp.load_dataset_split(path_to_dataset)
+    genre_dataset = dp.create_tensorflow_dataset_from_directory(path_to_dataset, batch_size=batch_size,
+                                                                shuffle_buffer=SHUFFLE_BUFFER, cache=cache,
+                                                                sample_indices=train_indices)
+    val_dataset = dp.create_tensorflow_dataset_from_directory(path_to_dataset, batch_size=batch_size,
+                                                              sample_indices=validation_indices,
+                                                              shuffle=False)
+    if variable_length:
+        genre_dataset = genre_dataset.map(random_prefix_crop, num_parallel_calls=tf.data.AUTOTUNE)
+    model = build_model(variable_length)
     model.compile(optimizer="RMSprop",
                   loss="sparse_categorical_crossentropy",
                   metrics=[keras.metrics.SparseCategoricalAccuracy(name="Accuracy")])
@@ -107,14 +207,19 @@ def train_model(path_to_dataset: str, model_name: str) -> None:
               )
 
     model.save(model_name + ".keras")
+    export_inference_model(model, model_name + "_saved")
 
 
 def main():
-    path_to_dataset = "../dataset_file"
-    path_to_val_set = "../dataset_file"
-    # generate the genre and validation datasets
-    genre_dataset = tf.data.Dataset.load(path_to_dataset)
-    val_dataset = tf.data.Dataset.load(path_to_val_set)
+    path_to_dataset = "../dataset_arrays"
+    # generate the genre and validation datasets from the saved track-level split
+    train_indices, validation_indices = dp.load_dataset_split(path_to_dataset)
+    genre_dataset = dp.create_tensorflow_dataset_from_directory(path_to_dataset, batch_size=BATCH_SIZE,
+                                                                shuffle_buffer=SHUFFLE_BUFFER, cache=TRAINING_CACHE,
+                                                                sample_indices=train_indices)
+    val_dataset = dp.create_tensorflow_dataset_from_directory(path_to_dataset, batch_size=BATCH_SIZE,
+                                                              sample_indices=validation_indices,
+                                                              shuffle=False)
     model = build_model()
 
     # compile model with hyperparameters and RMSprop optimizer
@@ -149,6 +254,7 @@ def main():
               callbacks=[mod_check, csv_save, early_stop]
               )
     model.save(save_name + ".keras")
+    export_inference_model(model, save_name + "_saved")
     model_json = model.to_json()
     with open(save_name + ".json", "w") as output_file:
         json.dump(model_json, output_file)
@@ -12,7 +12,7 @@ import genre_prediction as gp
 
 # constants
 DATA_DIRECTORY = 'genres_original'
-TRAINING_DATASET_DIRECTORY = 'dataset_file'
+ARRAY_DATASET_DIRECTORY = 'dataset_arrays'
 MODEL_NAME = 'genre_model'
 SAMPLE_FILE_DIRECTORY = 'samples'
 
@@ -22,10 +22,8 @@ if not os.path.exists(MODEL_NAME + '.keras'):
     libc.process_audio_database(DATA_DIRECTORY)
 
     # build tensor from mel-spectrograms
-    tf_data, tf_labels = dp.pre_process(DATA_DIRECTORY)
-    tf_dataset = dp.create_tensorflow_dataset(tf_data, tf_labels)
-
-    tf_dataset.save(TRAINING_DATASET_DIRECTORY)
+    dp.build_spectrogram_dataset(DATA_DIRECTORY, ARRAY_DATASET_DIRECTORY)
+    tf_dataset = dp.create_tensorflow_dataset_from_directory(ARRAY_DATASET_DIRECTORY)
 
     # display basic tensor information
     print()
@@ -34,7 +32,7 @@ if not os.path.exists(MODEL_NAME + '.keras'):
     print()
 
     # train model
-    mbt.train_model(TRAINING_DATASET_DIRECTORY, MODEL_NAME)
+    mbt.train_model(ARRAY_DATASET_DIRECTORY, MODEL_NAME)
 
 else:
     print(MODEL_NAME + '.keras' + ' exists')
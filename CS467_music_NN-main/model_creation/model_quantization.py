@@ -0,0 +1,266 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Quantized TensorFlow Lite export of the Genre NN and comparison with the float32 model
+
+import os
+import sys
+import time
+import queue
+import resource
+import multiprocessing
+import numpy as np
+
+# TensorFlow and data_pipeline (which imports it) are imported inside the functions
+# that need them, so the spawned report processes only load their own runtime
+
+# the inference backends live in genre_prediction and numpy_inference, one directory up
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# training spectrograms used to calibrate int8 activation ranges
+CALIBRATION_SAMPLES = 200
+# validation spectrograms used for the parity and latency report
+REPORT_SAMPLES = 200
+# longest a backend may take to load and score the report spectrograms
+BACKEND_TIMEOUT_SECONDS = 15 * 60
+QUANTIZATION_TYPES = ("int8", "float16")
+
+
+def representative_spectrograms(path_to_dataset: str, sample_count: int = CALIBRATION_SAMPLES,
+                                seed: int = 0, validation: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Draw a random sample of spectrograms from the saved dataset.
+
+    Calibration samples come from the training split, so the validation split
+    stays unseen for the parity report.
+
+    Args:
+        path_to_dataset (str): The directory written by data_pipeline.build_spectrogram_dataset.
+        sample_count (int): Maximum number of spectrograms.
+        seed (int): Seed of the sample.
+        validation (bool): If True, sample the validation split instead.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (samples, 128, 1292, 1) float32 spectrograms and their labels.
+
+    Example:
+        spectrograms, labels = representative_spectrograms("../dataset_arrays")
+    """
+
+    import data_pipeline as dp
+
+    train_indices, validation_indices = dp.load_dataset_split(path_to_dataset)
+    split_indices = validation_indices if validation else train_indices
+    rng = np.random.default_rng(seed)
+    sample_indices = np.sort(rng.choice(split_indices, min(sample_count, len(split_indices)), replace=False))
+    data = np.load(os.path.join(path_to_dataset, dp.DATASET_SPECTROGRAMS_FILE), mmap_mode='r')
+    labels = np.load(os.path.join(path_to_dataset, dp.DATASET_LABELS_FILE))
+    return np.asarray(data[sample_indices], dtype=np.float32), labels[sample_indices]
+
+
+def export_tflite_model(saved_model_dir: str, output_path: str, quantization: str = "int8",
+                        calibration_spectrograms: np.ndarray = None) -> int:
+    """
+    Convert the inference SavedModel to a quantized TensorFlow Lite model.
+
+    'int8' quantizes weights and activations to 8 bits, with activation ranges
+    calibrated on calibration_spectrograms; the model keeps float32 input and
+    output so genre_prediction feeds it the same spectrograms. 'float16' stores
+    the weights as float16 and needs no calibration.
+
+    Args:
+        saved_model_dir (str): SavedModel written by model_build_training.export_inference_model.
+        output_path (str): Path of the .tflite file.
+        quantization (str): 'int8' or 'float16'.
+        calibration_spectrograms (np.ndarray): (samples, 128, frames, 1) training
+            spectrograms, required for 'int8'.
+
+    Returns:
+        int: Size of the written model in bytes.
+
+    Raises:
+        ValueError: If quantization is unknown, or 'int8' has no calibration data.
+
+    Example:
+        export_tflite_model("../model_saved", "../model_tflite/genre_model_int8.tflite", "int8", spectrograms)
+    """
+
+    if quantization not in QUANTIZATION_TYPES:
+        raise ValueError(f"quantization must be one of {QUANTIZATION_TYPES}, not {quantization!r}")
+
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir, signature_keys=["serve"])
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        if calibration_spectrograms is None or not len(calibration_spectrograms):
+            raise ValueError("int8 quantization needs calibration spectrograms")
+
+        def representative_dataset():
+            for spectrogram in calibration_spectrograms:
+                yield [spectrogram[np.newaxis].astype(np.float32)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    tflite_model = converter.convert()
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "wb") as output_file:
+        output_file.write(tflite_model)
+    return len(tflite_model)
+
+
+def _backend_run(backend: str, model_path: str, spectrograms: np.ndarray, result_queue) -> None:
+    """
+    Load one backend in a fresh process, score every spectrogram and report timings and memory.
+
+    Args:
+        backend (str): Name from genre_prediction.INFERENCE_BACKENDS.
+        model_path (str): Model directory or .tflite file.
+        spectrograms (np.ndarray): (samples, 128, frames, 1) spectrograms.
+        result_queue: Queue the result dict is put on, or a dict with an 'error' key.
+
+    Returns:
+        None
+    """
+
+    try:
+        result_queue.put(_backend_measure(backend, model_path, spectrograms))
+    except Exception as error:
+        result_queue.put({"error": f"{type(error).__name__}: {error}"})
+
+
+def _backend_measure(backend: str, model_path: str, spectrograms: np.ndarray) -> dict:
+    import genre_prediction as gp
+
+    load_start = time.perf_counter()
+    trained_model = gp.INFERENCE_BACKENDS[backend](model_path)
+    load_seconds = time.perf_counter() - load_start
+    # warm up before timing
+    np.asarray(trained_model.serve(spectrograms[:1]))
+
+    probabilities = []
+    latencies = []
+    for spectrogram in spectrograms:
+        inference_start = time.perf_counter()
+        probabilities.append(np.asarray(trained_model.serve(spectrogram[np.newaxis]))[0])
+        latencies.append(time.perf_counter() - inference_start)
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"probabilities": np.array(probabilities), "load_seconds": load_seconds,
+            "mean_latency_ms": 1000 * float(np.mean(latencies)),
+            "p95_latency_ms": 1000 * float(np.percentile(latencies, 95)), "peak_rss_mb": peak_rss_mb}
+
+
+def _backend_result(worker, result_queue, timeout_seconds: float) -> dict:
+    # poll rather than block, so a worker that dies without reporting is noticed
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        try:
+            return result_queue.get(timeout=1.0)
+        except queue.Empty:
+            if worker.exitcode is not None:
+                # the result may have been put just before the worker exited
+                try:
+                    return result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    return {"error": f"backend process exited with code {worker.exitcode}"}
+    worker.terminate()
+    return {"error": f"backend did not finish within {timeout_seconds:.0f} seconds"}
+
+
+def compare_backends(models: dict, spectrograms: np.ndarray, labels: np.ndarray = None,
+                     reference: str = "float32", timeout_seconds: float = BACKEND_TIMEOUT_SECONDS) -> dict:
+    """
+    Compare accuracy, CPU latency and memory of several exported models.
+
+    Each model runs in its own spawned process, so its peak resident memory
+    includes only the runtime it needs, plus the same copy of spectrograms for
+    every model. Parity is measured against the reference model: top-1
+    agreement and the largest probability difference. A model whose process
+    raises, crashes (e.g. a missing tflite runtime, or running out of memory
+    on load) or runs past timeout_seconds is reported with an 'error' instead.
+
+    Args:
+        models (dict): Name to (backend, model_path), e.g.
+            {"float32": ("saved_model", "../model_saved"), "int8": ("tflite", "int8.tflite")}.
+        spectrograms (np.ndarray): (samples, 128, frames, 1) held-out spectrograms.
+        labels (np.ndarray): Optional genre label of each spectrogram.
+        reference (str): Name of the model the others are compared with.
+        timeout_seconds (float): Longest each model may take before it is stopped.
+
+    Returns:
+        dict: Name to a dict of 'top1_agreement', 'max_probability_difference'
+            (both None if the reference failed), 'accuracy' (None without labels),
+            'load_seconds', 'mean_latency_ms', 'p95_latency_ms' and 'peak_rss_mb',
+            or to {'error': message} for a model that failed.
+
+    Example:
+        report = compare_backends(models, *representative_spectrograms("../dataset_arrays", validation=True))
+    """
+
+    spawn_context = multiprocessing.get_context("spawn")
+    runs = {}
+    for model_name, (backend, model_path) in models.items():
+        result_queue = spawn_context.Queue()
+        worker = spawn_context.Process(target=_backend_run, args=(backend, model_path, spectrograms, result_queue))
+        worker.start()
+        runs[model_name] = _backend_result(worker, result_queue, timeout_seconds)
+        worker.join()
+
+    reference_probabilities = runs.get(reference, {}).get("probabilities")
+    report = {}
+    for model_name, run in runs.items():
+        if "error" in run:
+            print(f"WARNING: {model_name} failed: {run['error']}")
+            report[model_name] = run
+            continue
+        probabilities = run.pop("probabilities")
+        if reference_probabilities is None:
+            run["top1_agreement"] = run["max_probability_difference"] = None
+        else:
+            run["top1_agreement"] = float(np.mean(probabilities.argmax(axis=1) ==
+                                                  reference_probabilities.argmax(axis=1)))
+            run["max_probability_difference"] = float(np.abs(probabilities - reference_probabilities).max())
+        run["accuracy"] = None if labels is None else float(np.mean(probabilities.argmax(axis=1) == labels))
+        report[model_name] = run
+    return report
+
+
+if __name__ == "__main__":
+    # run from model_creation: python model_quantization.py
+    from numpy_inference import export_numpy_weights, NUMPY_MODEL_FILE
+
+    PATH_TO_DATASET = "../dataset_arrays"
+    SAVED_MODEL_DIR = "../model_saved"
+    TFLITE_DIR = "../model_tflite"
+    NUMPY_MODEL_PATH = os.path.join("..", NUMPY_MODEL_FILE)
+
+    calibration, _ = representative_spectrograms(PATH_TO_DATASET)
+    exported_models = {"float32": ("saved_model", SAVED_MODEL_DIR)}
+    for quantization_type in QUANTIZATION_TYPES:
+        tflite_path = os.path.join(TFLITE_DIR, f"genre_model_{quantization_type}.tflite")
+        model_bytes = export_tflite_model(SAVED_MODEL_DIR, tflite_path, quantization_type, calibration)
+        print(f"Wrote {tflite_path} ({model_bytes / 1e6:.1f} MB)")
+        exported_models[quantization_type] = ("tflite", tflite_path)
+    # the float32 weights run by the NumPy forward pass, a check on the TensorFlow result
+    export_numpy_weights(SAVED_MODEL_DIR, NUMPY_MODEL_PATH)
+    exported_models["numpy"] = ("numpy", NUMPY_MODEL_PATH)
+
+    held_out, held_out_labels = representative_spectrograms(PATH_TO_DATASET, REPORT_SAMPLES, validation=True)
+    backend_report = compare_backends(exported_models, held_out, held_out_labels)
+    for model_name, model_report in backend_report.items():
+        if "error" in model_report:
+            print(f"{model_name}: failed, {model_report['error']}")
+            continue
+        if model_report["top1_agreement"] is None:
+            print(f"{model_name}: {model_report['mean_latency_ms']:.1f} ms mean, no parity without the reference")
+            continue
+        print(f"{model_name}: accuracy {model_report['accuracy']:.3f}, "
+              f"top-1 agreement {model_report['top1_agreement']:.3f}, "
+              f"max probability difference {model_report['max_probability_difference']:.4f}, "
+              f"{model_report['mean_latency_ms']:.1f} ms mean / {model_report['p95_latency_ms']:.1f} ms p95, "
+              f"peak RSS {model_report['peak_rss_mb']:.0f} MB")
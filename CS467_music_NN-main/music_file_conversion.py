@@ -5,8 +5,15 @@
 # Description: Converts music files to mp3 for use in the NN,
 #              and includes function to get audio from YouTube
 
-import pydub
-import yt_dlp
+import io
+import re
+from urllib.parse import urlparse, parse_qs
+
+# pydub and yt_dlp are imported where they are used, so the web app and GUI
+# start without loading the downloader until a YouTube link is submitted
+
+# YouTube video IDs are 11 characters of letters, digits, '-' and '_'
+YOUTUBE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
 
 
 def audio_conversion(file_path: str, new_format: str) -> None:
@@ -24,10 +31,70 @@ def audio_conversion(file_path: str, new_format: str) -> None:
         audio_conversion("path/to/audio/file.mp3", "wav")
     """
 
+    import pydub
+
     audio_piece = pydub.AudioSegment.from_file(file_path)
     # Make sure new filepath is the correct format
     audio_piece.export(file_path + "." + new_format, format=new_format)
 
+
+def convert_audio_bytes(audio_bytes: bytes, new_format: str) -> bytes:
+    """
+    Convert encoded audio held in memory to another format, without writing either to disk.
+
+    Args:
+        audio_bytes (bytes): The encoded input audio file.
+        new_format (str): Desired format for the output, e.g. "wav".
+
+    Returns:
+        bytes: The encoded output audio.
+
+    Example:
+        wav_bytes = convert_audio_bytes(mp3_bytes, "wav")
+    """
+
+    import pydub
+
+    audio_piece = pydub.AudioSegment.from_file(io.BytesIO(audio_bytes))
+    converted_audio = io.BytesIO()
+    audio_piece.export(converted_audio, format=new_format)
+    return converted_audio.getvalue()
+
+
+def youtube_video_id(video_url: str) -> str:
+    """
+    Extract the canonical video ID from the common forms of YouTube URL.
+
+    Handles watch?v=, youtu.be/, /shorts/, /embed/ and /live/ links. Any other
+    input is returned stripped, so it can still be used as a cache key.
+
+    Args:
+        video_url (str): YouTube video URL.
+
+    Returns:
+        str: The 11 character video ID, or the stripped URL if none is found.
+
+    Example:
+        youtube_video_id("https://youtu.be/9VSerKr1vBM?t=30")
+    """
+
+    video_url = video_url.strip()
+    parsed_url = urlparse(video_url if "://" in video_url else "https://" + video_url)
+    host = parsed_url.netloc.lower()
+    path_parts = [part for part in parsed_url.path.split("/") if part]
+    candidate = None
+    if host.endswith("youtu.be") and path_parts:
+        candidate = path_parts[0]
+    elif "youtube" in host:
+        query_ids = parse_qs(parsed_url.query).get("v")
+        if query_ids:
+            candidate = query_ids[0]
+        elif len(path_parts) >= 2 and path_parts[0] in ("shorts", "embed", "live", "v"):
+            candidate = path_parts[1]
+    if candidate and YOUTUBE_ID_PATTERN.match(candidate):
+        return candidate
+    return video_url
+
 # #############
 # modified from https://stackoverflow.com/questions/27473526/
 # download-only-audio-from-youtube-video-using-youtube-dl-in-python-script/
@@ -48,6 +115,8 @@ def youtube_get_audio(video_url: str, genre_string: str = "temp_file_youtube") -
     Example:
         youtube_get_audio("https://www.youtube.com/watch?v=your_video_id", "temp_file_youtube")
     """
+    import yt_dlp
+
     # set options to have the output be only audio, and filename as chosen
     ydl_opts = {
         'outtmpl': f'{genre_string}',
@@ -0,0 +1,358 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Pure-NumPy forward pass of the Genre NN
+
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# weights written by export_numpy_weights
+NUMPY_MODEL_FILE = os.path.join("model_numpy", "genre_model.npz")
+
+# Rescaling layer at the start of model_build_training.build_model
+RESCALE_SCALE = 1.0 / 80
+RESCALE_OFFSET = 1.0
+# every conv layer is 2x2 with stride 1, followed by 2x2 average pooling
+KERNEL_SIZE = 2
+POOL_SIZE = 2
+# largest im2col block, in float32 elements, built for one conv step
+BLOCK_ELEMENTS = 1 << 21
+# activation buffer sets each thread keeps, one per input shape; about 20 MB each
+# for one full-length spectrogram
+WORKSPACE_CACHE_SIZE = 2
+
+
+def export_numpy_weights(saved_model_dir: str, output_path: str = NUMPY_MODEL_FILE) -> int:
+    """
+    Copy the weights of an exported SavedModel into a .npz file for NumpyGenreModel.
+
+    The variables are matched by shape rather than name: the conv kernels chain
+    from 1 input channel through each layer's filters, every conv bias has its
+    layer's filter count and the Dense kernel is the only 2-D variable. Whether
+    the model averages over time is read from its serve endpoint's frame axis.
+
+    Args:
+        saved_model_dir (str): SavedModel written by model_build_training.export_inference_model.
+        output_path (str): Path of the .npz file.
+
+    Returns:
+        int: Number of conv layers written.
+
+    Raises:
+        ValueError: If the SavedModel does not have the build_model layer structure.
+
+    Example:
+        export_numpy_weights("model_saved")
+    """
+
+    # TensorFlow is only needed to read the SavedModel, never to run the NumPy model
+    import tensorflow as tf
+
+    loaded_model = tf.saved_model.load(saved_model_dir)
+    # the same variable can be tracked by both endpoints, so key by shape
+    variables = {}
+    for variable in loaded_model.variables:
+        if variable.dtype == tf.float32:
+            variables.setdefault(tuple(variable.shape), np.asarray(variable.numpy(), dtype=np.float32))
+
+    weights = {}
+    channels = 1
+    conv_count = 0
+    while True:
+        kernels = [shape for shape in variables if len(shape) == 4 and shape[2] == channels]
+        if not kernels:
+            break
+        if len(kernels) > 1 or (kernels[0][3],) not in variables:
+            raise ValueError(f"Cannot match the conv layer after {channels} channels in {saved_model_dir}")
+        weights[f"conv{conv_count}_kernel"] = variables[kernels[0]]
+        channels = kernels[0][3]
+        weights[f"conv{conv_count}_bias"] = variables[(channels,)]
+        conv_count += 1
+    dense_kernels = [shape for shape in variables if len(shape) == 2]
+    if not conv_count or len(dense_kernels) != 1 or (dense_kernels[0][1],) not in variables:
+        raise ValueError(f"{saved_model_dir} does not have the build_model layer structure")
+    weights["dense_kernel"] = variables[dense_kernels[0]]
+    weights["dense_bias"] = variables[(dense_kernels[0][1],)]
+    # the time pooling model of build_model(variable_length=True) is exported with a variable frame axis
+    from genre_prediction import accepts_variable_frames
+    weights["variable_frames"] = np.array(accepts_variable_frames(loaded_model))
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    np.savez(output_path, **weights)
+    return conv_count
+
+
+class NumpyGenreModel:
+    """
+    Runs the Genre NN forward pass in NumPy behind the same serve(batch) call as the SavedModel.
+
+    Each conv layer is an im2col matrix product: the 2x2 patches are a strided
+    view of the previous activations, copied block by block into a column
+    buffer and multiplied by the flattened kernel. ReLU and the 2x2 average
+    pooling are applied to each block as soon as it is computed, so only the
+    pooled activations of a layer are ever stored. Activation and scratch
+    buffers are kept per thread for the WORKSPACE_CACHE_SIZE most recently used
+    input shapes, so memory stays bounded however many frame counts and batch
+    sizes a server sees. float32 is used throughout, so the same input always
+    gives the same output. Dropout is a no-op at inference and is skipped.
+
+    Example:
+        trained_model = NumpyGenreModel("model_numpy/genre_model.npz")
+        probabilities = trained_model.serve(model_input)
+    """
+
+    def __init__(self, model_path: str = NUMPY_MODEL_FILE) -> None:
+        self.model_path = model_path
+        with np.load(model_path) as weights:
+            conv_count = len([name for name in weights.files if name.endswith("_kernel")]) - 1
+            # (2, 2, in, out) kernels flattened to match the (in, 2, 2) order of the patch view
+            conv_kernels = [weights[f"conv{index}_kernel"] for index in range(conv_count)]
+            self.conv_kernels = [np.ascontiguousarray(kernel.transpose(2, 0, 1, 3).reshape(-1, kernel.shape[3]),
+                                                      dtype=np.float32) for kernel in conv_kernels]
+            self.conv_biases = [weights[f"conv{index}_bias"].astype(np.float32) for index in range(conv_count)]
+            self.dense_kernel = np.ascontiguousarray(weights["dense_kernel"], dtype=np.float32)
+            self.dense_bias = weights["dense_bias"].astype(np.float32)
+            # the Dense layer follows Flatten, or averaging over time when the frame count is free
+            self.variable_frames = "variable_frames" in weights.files and bool(weights["variable_frames"])
+        self._local = threading.local()
+
+    def layer_shapes(self, mels: int, frames: int) -> list:
+        """
+        Return the pooled activation shape after each conv layer.
+
+        Args:
+            mels (int): Mel bands of the input.
+            frames (int): Frames of the input.
+
+        Returns:
+            list: (height, width, channels) after each conv and pooling step.
+
+        Raises:
+            ValueError: If the input is too small for every layer, or does not
+                give the Dense layer the number of features it was trained on.
+        """
+
+        shapes = []
+        height, width = mels, frames
+        for kernel in self.conv_kernels:
+            height = (height - KERNEL_SIZE + 1) // POOL_SIZE
+            width = (width - KERNEL_SIZE + 1) // POOL_SIZE
+            if height < 1 or width < 1:
+                raise ValueError(f"A ({mels}, {frames}) spectrogram is too small for the model")
+            shapes.append((height, width, kernel.shape[1]))
+        height, width, channels = shapes[-1]
+        if self.variable_frames and height * channels != self.dense_kernel.shape[0]:
+            raise ValueError(f"The model only accepts the number of mel bands it was trained on, not {mels}")
+        if not self.variable_frames and height * width * channels != self.dense_kernel.shape[0]:
+            raise ValueError(f"The model only accepts the spectrogram size it was trained on, not ({mels}, {frames})")
+        return shapes
+
+    def _workspace(self, batch_size: int, mels: int, frames: int) -> dict:
+        # one set of activation and scratch buffers per thread and recently used input shape
+        workspaces = getattr(self._local, "workspaces", None)
+        if workspaces is None:
+            workspaces = self._local.workspaces = OrderedDict()
+        workspace = workspaces.get((batch_size, mels, frames))
+        if workspace is not None:
+            workspaces.move_to_end((batch_size, mels, frames))
+        else:
+            activations = [np.empty((batch_size, mels, frames, 1), dtype=np.float32)]
+            activations += [np.empty((batch_size,) + shape, dtype=np.float32)
+                            for shape in self.layer_shapes(mels, frames)]
+            block_rows = []
+            column_size = 0
+            product_size = 0
+            for kernel, pooled in zip(self.conv_kernels, activations[1:]):
+                # conv outputs behind one pooled row, and the widest row of a position
+                row_positions = batch_size * POOL_SIZE * POOL_SIZE * pooled.shape[2]
+                rows = max(1, min(pooled.shape[1], BLOCK_ELEMENTS // (row_positions * max(kernel.shape))))
+                block_rows.append(rows)
+                column_size = max(column_size, rows * row_positions * kernel.shape[0])
+                product_size = max(product_size, rows * row_positions * kernel.shape[1])
+            workspace = {
+                "activations": activations,
+                # 2x2 patches of each layer input as (batch, rows, columns, channels, 2, 2) views
+                "patches": [np.lib.stride_tricks.sliding_window_view(
+                    layer_input, (KERNEL_SIZE, KERNEL_SIZE), axis=(1, 2)) for layer_input in activations[:-1]],
+                "block_rows": block_rows,
+                "columns": np.empty(column_size, dtype=np.float32),
+                "products": np.empty(product_size, dtype=np.float32),
+            }
+            workspaces[(batch_size, mels, frames)] = workspace
+            while len(workspaces) > WORKSPACE_CACHE_SIZE:
+                # drop the least recently used shape
+                workspaces.popitem(last=False)
+        return workspace
+
+    def _conv_relu_pool(self, layer: int, workspace: dict) -> None:
+        """
+        Run conv layer number layer with ReLU and average pooling, block by block.
+
+        Args:
+            layer (int): Index of the conv layer.
+            workspace (dict): Buffers from _workspace; the layer reads
+                activations[layer] and writes activations[layer + 1].
+
+        Returns:
+            None
+        """
+
+        kernel = self.conv_kernels[layer]
+        patches = workspace["patches"][layer]
+        pooled = workspace["activations"][layer + 1]
+        batch_size, pooled_height, pooled_width, filters = pooled.shape
+        # the last conv row and column are dropped by the pooling when the size is odd
+        conv_width = POOL_SIZE * pooled_width
+        for first_row in range(0, pooled_height, workspace["block_rows"][layer]):
+            last_row = min(first_row + workspace["block_rows"][layer], pooled_height)
+            conv_rows = POOL_SIZE * (last_row - first_row)
+            positions = batch_size * conv_rows * conv_width
+            columns = workspace["columns"][:positions * kernel.shape[0]]
+            np.copyto(columns.reshape(patches.shape[:1] + (conv_rows, conv_width) + patches.shape[3:]),
+                      patches[:, POOL_SIZE * first_row:POOL_SIZE * last_row, :conv_width])
+            products = workspace["products"][:positions * filters].reshape(positions, filters)
+            np.matmul(columns.reshape(positions, kernel.shape[0]), kernel, out=products)
+            products += self.conv_biases[layer]
+            np.maximum(products, 0.0, out=products)
+            # each pooled value is the mean of a 2x2 square of conv outputs
+            squares = products.reshape(batch_size, last_row - first_row, POOL_SIZE, pooled_width, POOL_SIZE, filters)
+            block = pooled[:, first_row:last_row]
+            np.add(squares[:, :, 0, :, 0], squares[:, :, 0, :, 1], out=block)
+            block += squares[:, :, 1, :, 0]
+            block += squares[:, :, 1, :, 1]
+            block *= 1.0 / (POOL_SIZE * POOL_SIZE)
+
+    def forward(self, model_input: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Run one batch through the model.
+
+        Args:
+            model_input (np.ndarray): Spectrograms of shape (tracks, 128, frames, 1)
+                or (tracks, 128, frames).
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: float32 softmax output of shape (tracks, genres)
+                and the Flatten (or time pooling) activations feeding the Dense layer.
+
+        Raises:
+            ValueError: If the spectrogram size does not fit the model.
+
+        Example:
+            probabilities, activations = trained_model.forward(model_input)
+        """
+
+        model_input = np.asarray(model_input, dtype=np.float32)
+        batch_size, mels, frames = model_input.shape[:3]
+        workspace = self._workspace(batch_size, mels, frames)
+        layer_input = workspace["activations"][0]
+        np.multiply(model_input.reshape(layer_input.shape), RESCALE_SCALE, out=layer_input)
+        layer_input += RESCALE_OFFSET
+        for layer in range(len(self.conv_kernels)):
+            self._conv_relu_pool(layer, workspace)
+
+        last_activations = workspace["activations"][-1]
+        if self.variable_frames:
+            # mean over time of each frequency row, in the (row, channel) order Keras flattens to
+            features = last_activations.mean(axis=2).reshape(batch_size, -1)
+        else:
+            # the buffer is reused by the next call, so the features are copied out
+            features = last_activations.reshape(batch_size, -1).copy()
+        logits = features @ self.dense_kernel + self.dense_bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        return probabilities, features
+
+    def serve(self, model_input: np.ndarray) -> np.ndarray:
+        """
+        Run one batch through the model.
+
+        Args:
+            model_input (np.ndarray): Spectrograms of shape (tracks, 128, frames, 1).
+
+        Returns:
+            np.ndarray: float32 softmax output of shape (tracks, genres).
+        """
+
+        return self.forward(model_input)[0]
+
+    def serve_with_embedding(self, model_input: np.ndarray) -> dict:
+        """
+        Run one batch through the model, like the SavedModel's 'serve_with_embedding' endpoint.
+
+        Args:
+            model_input (np.ndarray): Spectrograms of shape (tracks, 128, frames, 1).
+
+        Returns:
+            dict: 'predictions' softmax output and 'embedding' activations feeding the Dense layer.
+        """
+
+        probabilities, features = self.forward(model_input)
+        return {"predictions": probabilities, "embedding": features}
+
+
+def compare_with_saved_model(saved_model_dir: str, numpy_model: NumpyGenreModel, spectrograms: np.ndarray,
+                             batch_size: int = 8) -> dict:
+    """
+    Check the NumPy forward pass against the SavedModel and time both on the same batches.
+
+    Args:
+        saved_model_dir (str): SavedModel the NumPy weights were exported from.
+        numpy_model (NumpyGenreModel): Model loaded from the exported weights.
+        spectrograms (np.ndarray): (samples, 128, frames, 1) spectrograms.
+        batch_size (int): Spectrograms per serve call.
+
+    Returns:
+        dict: 'max_probability_difference', 'max_embedding_difference',
+            'top1_agreement', and 'saved_model_ms' / 'numpy_ms' per batch.
+
+    Example:
+        report = compare_with_saved_model("model_saved", NumpyGenreModel(), spectrograms)
+    """
+
+    from genre_prediction import load_saved_model
+
+    saved_model = load_saved_model(saved_model_dir)
+    runs = {}
+    for model_name, trained_model in (("saved_model", saved_model), ("numpy", numpy_model)):
+        # warm up before timing
+        trained_model.serve_with_embedding(spectrograms[:batch_size])
+        probabilities, embeddings, batch_seconds = [], [], []
+        for first in range(0, len(spectrograms), batch_size):
+            batch_start = time.perf_counter()
+            outputs = trained_model.serve_with_embedding(spectrograms[first:first + batch_size])
+            batch_seconds.append(time.perf_counter() - batch_start)
+            probabilities.append(np.asarray(outputs["predictions"]))
+            embeddings.append(np.asarray(outputs["embedding"]))
+        runs[model_name] = (np.concatenate(probabilities), np.concatenate(embeddings), 1000 * np.mean(batch_seconds))
+
+    (saved_probabilities, saved_embeddings, saved_ms), (numpy_probabilities, numpy_embeddings, numpy_ms) = \
+        runs["saved_model"], runs["numpy"]
+    return {"max_probability_difference": float(np.abs(numpy_probabilities - saved_probabilities).max()),
+            "max_embedding_difference": float(np.abs(numpy_embeddings - saved_embeddings).max()),
+            "top1_agreement": float(np.mean(numpy_probabilities.argmax(axis=1) == saved_probabilities.argmax(axis=1))),
+            "saved_model_ms": float(saved_ms), "numpy_ms": float(numpy_ms)}
+
+
+if __name__ == "__main__":
+    # python numpy_inference.py [audio files to compare on]
+    from genre_prediction import MODEL_DIRECTORY, process_audio_file
+
+    if not os.path.exists(NUMPY_MODEL_FILE):
+        print(f"Exported {export_numpy_weights(MODEL_DIRECTORY)} conv layers to {NUMPY_MODEL_FILE}")
+    if len(sys.argv) > 1:
+        comparison_spectrograms = np.concatenate([process_audio_file(audio_file) for audio_file in sys.argv[1:]])
+    else:
+        # without audio, compare on random spectrograms in the model's -80 to 0 dB range
+        comparison_spectrograms = np.random.default_rng(0).uniform(-80, 0, (16, 128, 1292, 1)).astype(np.float32)
+    comparison = compare_with_saved_model(MODEL_DIRECTORY, NumpyGenreModel(), comparison_spectrograms)
+    print(f"top-1 agreement {comparison['top1_agreement']:.3f}, "
+          f"max probability difference {comparison['max_probability_difference']:.2e}, "
+          f"max embedding difference {comparison['max_embedding_difference']:.2e}, "
+          f"{comparison['saved_model_ms']:.1f} ms per batch with TensorFlow, "
+          f"{comparison['numpy_ms']:.1f} ms with NumPy")
@@ -0,0 +1,197 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: On-disk cache of final genre predictions shared by web app workers
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+# default cache location and limits
+PREDICTION_CACHE_DIRECTORY = "prediction_cache"
+PREDICTION_CACHE_MAX_ENTRIES = 10000
+PREDICTION_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+# share of max_entries left after an eviction, so the directory is scanned at most
+# once every tenth of max_entries writes per worker
+PREDICTION_CACHE_EVICT_TO = 0.9
+
+
+def prediction_cache_key(source_key: str, confidence_threshold: float = None) -> str:
+    """
+    Return the cache key of a prediction made with or without early exit.
+
+    A prediction allowed to stop after a prefix of the window can differ from
+    the full-window one, so each early-exit threshold gets its own entry and a
+    full-window request never receives a prefix result.
+
+    Args:
+        source_key (str): Key of the audio, e.g. "upload:<sha256>" or "youtube:<video ID>".
+        confidence_threshold (float): Early-exit threshold of the prediction, or None
+            for a full-window prediction.
+
+    Returns:
+        str: The cache key.
+
+    Example:
+        key = prediction_cache_key("youtube:" + video_id, EARLY_EXIT_CONFIDENCE)
+    """
+
+    if confidence_threshold is None:
+        return source_key
+    return f"{source_key}:early-exit:{confidence_threshold}"
+
+
+class PredictionCache:
+    """
+    Bounded LRU/TTL cache of genre predictions stored as small JSON files.
+
+    Every Flask worker process points at the same directory, so a result computed
+    by one worker is served by all of them. Entries older than ttl_seconds are
+    treated as misses, and once the cache holds more than max_entries files the
+    least recently used ones are removed. Each worker counts its own writes since
+    its last scan of the directory and only scans again once that count says the
+    cache may be full, so writes are cheap; with several workers the cache can
+    briefly run over max_entries by a tenth per worker. Each entry records the
+    model version it was produced with, and entries from another model version
+    are ignored.
+
+    Example:
+        cache = PredictionCache("prediction_cache")
+        result_list = cache.get("upload:" + digest, model_version)
+    """
+
+    def __init__(self, cache_directory: str = PREDICTION_CACHE_DIRECTORY,
+                 max_entries: int = PREDICTION_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = PREDICTION_CACHE_TTL_SECONDS) -> None:
+        self.cache_directory = cache_directory
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        # entries believed to be on disk, None until the directory is first scanned
+        self._estimated_entries = None
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_directory, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def _count(self, stat_name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[stat_name] += amount
+
+    def get(self, key: str, model_version: str = ""):
+        """
+        Return the cached prediction for a key, or None on a miss.
+
+        Args:
+            key (str): Cache key such as 'upload:<digest>' or 'youtube:<video id>'.
+            model_version (str): Version of the model currently being served.
+
+        Returns:
+            Union[list, None]: List of (genre, probability) tuples, or None.
+        """
+
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path) as input_file:
+                entry = json.load(input_file)
+        except (OSError, ValueError):
+            self._count("misses")
+            return None
+
+        expired = time.time() - entry.get("created", 0) > self.ttl_seconds
+        if expired or entry.get("model_version") != model_version:
+            self._count("misses")
+            return None
+
+        try:
+            # mark as most recently used
+            os.utime(entry_path)
+        except OSError:
+            pass
+        self._count("hits")
+        return [tuple(each_result) for each_result in entry["result_list"]]
+
+    def put(self, key: str, result_list: list, model_version: str = "") -> None:
+        """
+        Store a prediction and evict old entries if the cache may be over its size limit.
+
+        Args:
+            key (str): Cache key such as 'upload:<digest>' or 'youtube:<video id>'.
+            result_list (list): List of (genre, probability) tuples.
+            model_version (str): Version of the model that produced the result.
+
+        Returns:
+            None
+        """
+
+        os.makedirs(self.cache_directory, exist_ok=True)
+        entry_path = self._entry_path(key)
+        entry = {"key": key, "created": time.time(), "model_version": model_version,
+                 "result_list": [list(each_result) for each_result in result_list]}
+        # write to a temporary name first so other workers never read a partial file
+        temp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as output_file:
+            json.dump(entry, output_file)
+        os.replace(temp_path, entry_path)
+        with self._lock:
+            if self._estimated_entries is not None:
+                self._estimated_entries += 1
+            may_be_full = self._estimated_entries is None or self._estimated_entries > self.max_entries
+        if may_be_full:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Remove least recently used entries once more than max_entries are stored.
+
+        The cache is trimmed to PREDICTION_CACHE_EVICT_TO of max_entries, leaving
+        room for later writes before the next scan. Other workers share the
+        directory, so an entry that disappears during the scan is skipped.
+
+        Returns:
+            None
+        """
+
+        entries = []
+        with os.scandir(self.cache_directory) as directory_entries:
+            for directory_entry in directory_entries:
+                if directory_entry.name.endswith(".json"):
+                    try:
+                        entries.append((directory_entry.stat().st_mtime_ns, directory_entry.path))
+                    except OSError:
+                        # evicted or replaced by another worker since the scan
+                        continue
+
+        remaining_entries = len(entries)
+        if remaining_entries > self.max_entries:
+            entries.sort()
+            keep_count = int(self.max_entries * PREDICTION_CACHE_EVICT_TO)
+            for _, entry_path in entries[:remaining_entries - keep_count]:
+                try:
+                    os.remove(entry_path)
+                except FileNotFoundError:
+                    remaining_entries -= 1
+                    continue
+                except OSError:
+                    continue
+                remaining_entries -= 1
+                self._count("evictions")
+        with self._lock:
+            self._estimated_entries = remaining_entries
+
+    def stats(self) -> dict:
+        """
+        Return hit, miss and eviction counts plus the hit rate.
+
+        Returns:
+            dict: Cache statistics for this process.
+        """
+
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,130 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Cold-start benchmark of the serving entry points
+
+import os
+import sys
+import json
+import time
+import subprocess
+
+# modules the serving entry points should not load until they are needed
+ENTRY_POINTS = ("genre_prediction", "content_suggestion", "app", "gui_prediction")
+HEAVY_MODULES = ("tensorflow", "keras", "scipy.signal", "numba", "pandas", "yt_dlp", "pydub")
+# earlier results are appended here so each run shows the change since the last one
+STARTUP_HISTORY_FILE = "startup_benchmark.json"
+
+# run in a fresh interpreter for every measurement
+MEASURE_SCRIPT = """
+import json, resource, sys, time
+import_start = time.perf_counter()
+__import__({module_name!r})
+result = {{"import_seconds": time.perf_counter() - import_start}}
+if {audio_file!r}:
+    import genre_prediction
+    prediction_start = time.perf_counter()
+    genre_prediction.predict_genre({audio_file!r})
+    result["first_prediction_seconds"] = time.perf_counter() - prediction_start
+result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+result["heavy_modules"] = [name for name in {heavy_modules!r} if name in sys.modules]
+print(json.dumps(result))
+"""
+
+
+def measure_startup(module_name: str, audio_file: str = None) -> dict:
+    """
+    Import one module in a fresh Python process and measure its cold start.
+
+    Args:
+        module_name (str): Module to import, e.g. 'app'.
+        audio_file (str): Optional audio file to predict right after the import,
+            which adds the lazy model and library loading to the measurement.
+
+    Returns:
+        dict: 'process_seconds' (interpreter start to exit), 'import_seconds',
+            'peak_rss_mb', 'heavy_modules' loaded by the import, and
+            'first_prediction_seconds' when audio_file is given.
+
+    Raises:
+        RuntimeError: If the import or prediction fails in the child process.
+
+    Example:
+        print(measure_startup("app"))
+    """
+
+    measure_code = MEASURE_SCRIPT.format(module_name=module_name, audio_file=audio_file or "",
+                                         heavy_modules=HEAVY_MODULES)
+    process_start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", measure_code], capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    process_seconds = time.perf_counter() - process_start
+    if completed.returncode != 0:
+        raise RuntimeError(f"Starting {module_name} failed: {completed.stderr.strip().splitlines()[-1:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_seconds"] = process_seconds
+    return result
+
+
+def benchmark_startup(module_names: tuple = ENTRY_POINTS, repeats: int = 3, audio_file: str = None) -> dict:
+    """
+    Measure the cold start of each entry point several times and keep the fastest run.
+
+    The fastest run is the one least disturbed by other work on the machine.
+
+    Args:
+        module_names (tuple): Modules to import.
+        repeats (int): Fresh processes started per module.
+        audio_file (str): Optional audio file predicted after the genre_prediction import.
+
+    Returns:
+        dict: Module name to its measure_startup result, or to {'error': message}
+            when the module cannot be imported here (e.g. a missing dependency).
+
+    Example:
+        report = benchmark_startup(("app",), repeats=5)
+    """
+
+    report = {}
+    for module_name in module_names:
+        try:
+            runs = [measure_startup(module_name, audio_file if module_name == "genre_prediction" else None)
+                    for _ in range(repeats)]
+        except RuntimeError as error:
+            report[module_name] = {"error": str(error)}
+            continue
+        report[module_name] = min(runs, key=lambda run: run["process_seconds"])
+    return report
+
+
+if __name__ == "__main__":
+    # python startup_benchmark.py [audio file for a first prediction]
+    first_audio_file = sys.argv[1] if len(sys.argv) > 1 else None
+    startup_report = benchmark_startup(audio_file=first_audio_file)
+
+    history = []
+    if os.path.exists(STARTUP_HISTORY_FILE):
+        with open(STARTUP_HISTORY_FILE) as history_file:
+            history = json.load(history_file)
+    previous_report = history[-1]["report"] if history else {}
+
+    for module_name, module_report in startup_report.items():
+        if "error" in module_report:
+            print(f"{module_name}: {module_report['error']}")
+            continue
+        change = ""
+        previous_seconds = previous_report.get(module_name, {}).get("process_seconds")
+        if previous_seconds:
+            change = f" ({module_report['process_seconds'] - previous_seconds:+.2f} s since last run)"
+        first_prediction = ""
+        if "first_prediction_seconds" in module_report:
+            first_prediction = f", first prediction {module_report['first_prediction_seconds']:.2f} s"
+        print(f"{module_name}: {module_report['process_seconds']:.2f} s to start{change}, "
+              f"import {module_report['import_seconds']:.2f} s{first_prediction}, "
+              f"peak RSS {module_report['peak_rss_mb']:.0f} MB, "
+              f"heavy modules loaded: {', '.join(module_report['heavy_modules']) or 'none'}")
+
+    history.append({"time": time.strftime("%Y-%m-%d %H:%M:%S"), "report": startup_report})
+    with open(STARTUP_HISTORY_FILE, "w") as history_file:
+        json.dump(history, history_file, indent=1)
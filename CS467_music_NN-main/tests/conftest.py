@@ -0,0 +1,44 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: pytest setup shared by the tests; run with python -m pytest from CS467_music_NN-main
+
+import os
+import sys
+import pytest
+
+# the modules are flat files in CS467_music_NN-main and model_creation, not a package
+PROJECT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_SONG = os.path.join(PROJECT_DIRECTORY, "sample_songs", "disturbed_ten_thousand_fists.mp3")
+sys.path[:0] = [PROJECT_DIRECTORY, os.path.join(PROJECT_DIRECTORY, "model_creation")]
+
+
+class DeletingScan:
+    """
+    Stand-in for os.scandir that deletes every listed file before the caller can stat it.
+
+    This plays another process evicting the same cache entries mid-scan.
+    """
+
+    real_scandir = os.scandir
+
+    def __init__(self, path):
+        self.scan = DeletingScan.real_scandir(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.scan.close()
+
+    def __iter__(self):
+        for directory_entry in self.scan:
+            os.remove(directory_entry.path)
+            yield directory_entry
+
+
+@pytest.fixture
+def concurrent_eviction(monkeypatch):
+    # every cache module calls os.scandir through the os module
+    monkeypatch.setattr(os, "scandir", DeletingScan)
@@ -0,0 +1,71 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Tests of the IVF approximate nearest-neighbour index
+
+import numpy as np
+import pytest
+from ann_index import IVFIndex
+from content_suggestion import RecommenderEngine
+
+REC_NUM = 10
+# smallest recall@10 accepted at the default n_probe of 8 out of 32 cells
+MIN_RECALL = 0.9
+
+
+@pytest.fixture(scope="module")
+def engines():
+    rng = np.random.default_rng(0)
+    # genre predictions cluster around a few dominant genres, like the real catalog
+    vectors = (rng.dirichlet(np.full(10, 0.3), size=5000) * 100).astype(np.float32)
+    queries = (rng.dirichlet(np.full(10, 0.3), size=100) * 100).astype(np.float32)
+    titles = np.arange(len(vectors)).astype(str)
+    ann_index = IVFIndex.build(vectors, n_lists=32, n_probe=8)
+    return RecommenderEngine(titles, vectors, None), RecommenderEngine(titles, vectors, ann_index), queries
+
+
+def recall(engines, **query_options) -> float:
+    exact_engine, ann_engine, queries = engines
+    hits = []
+    for query in queries:
+        exact = {title for title, _ in exact_engine.query(query, REC_NUM)}
+        approximate = {title for title, _ in ann_engine.query(query, REC_NUM, **query_options)}
+        hits.append(len(exact & approximate) / REC_NUM)
+    return float(np.mean(hits))
+
+
+def test_probing_every_cell_is_exact(engines):
+    assert recall(engines, n_probe=32) == 1.0
+
+
+def test_recall_at_default_n_probe(engines):
+    assert recall(engines) >= MIN_RECALL
+
+
+def test_recall_grows_with_n_probe(engines):
+    assert recall(engines, n_probe=1) <= recall(engines, n_probe=4) <= recall(engines, n_probe=16)
+
+
+def test_every_row_is_in_one_cell(engines):
+    ann_index = engines[1].ann_index
+    assert np.array_equal(np.sort(ann_index.list_rows), np.arange(len(ann_index.assignments)))
+
+
+def test_save_and_load(tmp_path, engines):
+    built_index = engines[1].ann_index
+    ann_index = IVFIndex(built_index.centroids, built_index.assignments, built_index.n_probe, "model-a")
+    index_path = str(tmp_path / "ann_index.npz")
+    ann_index.save(index_path)
+    loaded_index = IVFIndex.load(index_path)
+    assert loaded_index.model_fingerprint == "model-a" and loaded_index.n_probe == ann_index.n_probe
+    assert np.array_equal(loaded_index.candidate_rows(engines[2][0]), ann_index.candidate_rows(engines[2][0]))
+
+
+def test_added_rows_can_be_found():
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((500, 4)).astype(np.float32)
+    ann_index = IVFIndex.build(vectors, n_lists=10, n_probe=1)
+    new_vector = rng.standard_normal((1, 4)).astype(np.float32)
+    ann_index.add(new_vector)
+    assert 500 in ann_index.candidate_rows(new_vector[0])
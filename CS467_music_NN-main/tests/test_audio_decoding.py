@@ -0,0 +1,65 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Tests of windowed audio decoding
+
+import io
+import struct
+import numpy as np
+import pytest
+import audio_decoding
+from conftest import SAMPLE_SONG
+
+
+def test_mp3_windows_match_a_full_decode():
+    differences = audio_decoding.mp3_window_parity(SAMPLE_SONG)
+    # None would mean the frame index declined the window and fell back to soundfile's seek
+    assert None not in differences.values()
+    assert max(differences.values()) == 0.0
+
+
+def test_mp3_window_near_the_end():
+    song_length = audio_decoding.soundfile.info(SAMPLE_SONG).duration
+    differences = audio_decoding.mp3_window_parity(SAMPLE_SONG, (song_length - 10.0,))
+    assert list(differences.values()) == [0.0]
+
+
+@pytest.mark.parametrize("offset", [0.0, 60.0])
+def test_bytes_and_streams_decode_like_paths(offset):
+    with open(SAMPLE_SONG, "rb") as audio_file:
+        audio_bytes = audio_file.read()
+    from_path, path_sr = audio_decoding.decode_window(SAMPLE_SONG, 30.0, offset)
+    for audio in (audio_bytes, io.BytesIO(audio_bytes)):
+        samples, sr = audio_decoding.decode_window(audio, 30.0, offset)
+        assert sr == path_sr
+        assert np.array_equal(samples, from_path)
+    assert len(from_path) == 30 * audio_decoding.DEFAULT_SAMPLE_RATE
+
+
+def test_window_offset_can_depend_on_song_length():
+    # a centred window, as chosen by the prediction code
+    samples, _ = audio_decoding.decode_window(SAMPLE_SONG, 30.0, lambda song_length: song_length / 2 - 15)
+    song_length = audio_decoding.soundfile.info(SAMPLE_SONG).duration
+    expected, _ = audio_decoding.decode_window(SAMPLE_SONG, 30.0, song_length / 2 - 15)
+    assert np.array_equal(samples, expected)
+
+
+def piped_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    # as ffmpeg writes to a pipe: the RIFF and data sizes are left at their maximum
+    fmt_chunk = struct.pack("<HHIIHH", 3, 1, sample_rate, sample_rate * 4, 4, 32)
+    return (b"RIFF" + b"\xff\xff\xff\xff" + b"WAVE" + b"fmt " + struct.pack("<I", len(fmt_chunk)) + fmt_chunk
+            + b"LIST" + struct.pack("<I", 3) + b"abc\x00" + b"data" + b"\xff\xff\xff\xff"
+            + samples.astype("<f4").tobytes())
+
+
+def test_wav_stream_samples_reads_piped_wav():
+    samples = np.linspace(-1, 1, 1001, dtype=np.float32)
+    decoded, sample_rate = audio_decoding.wav_stream_samples(piped_wav(samples, 22050))
+    assert sample_rate == 22050
+    assert np.array_equal(decoded, samples)
+
+
+def test_wav_stream_samples_rejects_other_data():
+    with pytest.raises(ValueError):
+        audio_decoding.wav_stream_samples(b"RIFF\x00\x00\x00\x00WAVE" + b"\x00" * 64)
@@ -0,0 +1,65 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Tests of the binary recommender catalog and its ANN index upkeep
+
+import os
+import numpy as np
+import pytest
+import content_suggestion as cs
+from ann_index import IVFIndex, ANN_INDEX_FILE
+
+TITLES = ["song_a", "song_b", "song_c", "song_d"]
+
+
+def catalog_vectors(rows: int = len(TITLES), seed: int = 0) -> np.ndarray:
+    return (np.random.default_rng(seed).dirichlet(np.ones(10), size=rows) * 100).astype(np.float32)
+
+
+def test_catalog_round_trip(tmp_path):
+    vectors = catalog_vectors()
+    embeddings = np.random.default_rng(1).standard_normal((len(TITLES), 128))
+    cs.save_catalog(str(tmp_path), TITLES, vectors, "model-a", embeddings=embeddings)
+    header, titles, loaded_vectors = cs.load_catalog(str(tmp_path))
+    assert header["model_fingerprint"] == "model-a" and header["count"] == len(TITLES)
+    assert list(titles) == TITLES
+    assert np.array_equal(loaded_vectors, vectors)
+    assert np.array_equal(cs.load_catalog_embeddings(str(tmp_path), header), embeddings.astype(np.float16))
+
+
+def test_load_rejects_changed_vectors(tmp_path):
+    cs.save_catalog(str(tmp_path), TITLES, catalog_vectors(), "model-a")
+    # same shape and row count, different contents, as from an interrupted write
+    np.save(os.path.join(tmp_path, cs.CATALOG_VECTORS_FILE), catalog_vectors(seed=1))
+    with pytest.raises(ValueError):
+        cs.load_catalog(str(tmp_path))
+
+
+def test_load_rejects_row_count_mismatch(tmp_path):
+    cs.save_catalog(str(tmp_path), TITLES, catalog_vectors(), "model-a")
+    np.save(os.path.join(tmp_path, cs.CATALOG_TITLES_FILE), np.array(TITLES[:-1], dtype=str))
+    with pytest.raises(ValueError):
+        cs.load_catalog(str(tmp_path))
+
+
+def test_update_ann_index_keeps_cells_of_the_same_model(tmp_path):
+    vectors = catalog_vectors(200)
+    cs.save_catalog(str(tmp_path), [str(row) for row in range(200)], vectors, "model-a")
+    built_index = cs.build_ann_index(str(tmp_path), n_lists=8, n_probe=2)
+    cs.update_ann_index(str(tmp_path), np.arange(200))
+    updated_index = IVFIndex.load(os.path.join(tmp_path, ANN_INDEX_FILE))
+    assert np.array_equal(updated_index.centroids, built_index.centroids)
+    assert np.array_equal(updated_index.assignments, built_index.assignments)
+
+
+def test_update_ann_index_rebuilds_after_a_model_change(tmp_path):
+    titles = [str(row) for row in range(200)]
+    cs.save_catalog(str(tmp_path), titles, catalog_vectors(200), "model-a")
+    built_index = cs.build_ann_index(str(tmp_path), n_lists=8, n_probe=2)
+    cs.save_catalog(str(tmp_path), titles, catalog_vectors(200, seed=1), "model-b")
+    cs.update_ann_index(str(tmp_path), np.arange(200))
+    updated_index = IVFIndex.load(os.path.join(tmp_path, ANN_INDEX_FILE))
+    assert updated_index.model_fingerprint == "model-b"
+    assert len(updated_index.centroids) == 8 and updated_index.n_probe == 2
+    assert not np.array_equal(updated_index.centroids, built_index.centroids)
@@ -0,0 +1,67 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Tests of the track-grouped training and validation split
+
+import numpy as np
+import pytest
+
+# data_pipeline builds tf.data pipelines, so it imports TensorFlow
+pytest.importorskip("tensorflow")
+from data_pipeline import source_track_key, split_train_validation  # noqa: E402
+
+GENRES = ("blues", "metal", "rock")
+TRACKS_PER_GENRE = 10
+WINDOW_SUFFIXES = ("", "_30bef", "_60bef", "_30aft", "_12.5aft")
+
+
+def windowed_samples() -> tuple[list, list]:
+    sample_files = []
+    labels = []
+    for label, genre in enumerate(GENRES):
+        for track in range(TRACKS_PER_GENRE):
+            for window_suffix in WINDOW_SUFFIXES:
+                sample_files.append(f"genres_original/{genre}/{genre}{track}{window_suffix}_mel_spectrogram.txt.npy")
+                labels.append(label)
+    return sample_files, labels
+
+
+def test_source_track_key_strips_the_window():
+    keys = {source_track_key(f"genres_original/rock/rock1{window_suffix}_mel_spectrogram.txt.npy")
+            for window_suffix in WINDOW_SUFFIXES}
+    assert keys == {"genres_original/rock/rock1"}
+    assert source_track_key("rock/rock1_mel_spectrogram.npy") == "rock/rock1"
+    assert source_track_key("rock/rock10_mel_spectrogram.npy") != source_track_key("rock/rock1_mel_spectrogram.npy")
+
+
+def test_windows_of_a_track_stay_together():
+    sample_files, labels = windowed_samples()
+    train_indices, validation_indices = split_train_validation(sample_files, labels, 0.2)
+    assert sorted(np.concatenate((train_indices, validation_indices))) == list(range(len(sample_files)))
+    train_tracks = {source_track_key(sample_files[index]) for index in train_indices}
+    validation_tracks = {source_track_key(sample_files[index]) for index in validation_indices}
+    assert not train_tracks & validation_tracks
+
+
+def test_split_is_stratified_by_genre():
+    sample_files, labels = windowed_samples()
+    _, validation_indices = split_train_validation(sample_files, labels, 0.2)
+    validation_counts = np.bincount(np.asarray(labels)[validation_indices], minlength=len(GENRES))
+    assert list(validation_counts) == [0.2 * TRACKS_PER_GENRE * len(WINDOW_SUFFIXES)] * len(GENRES)
+
+
+def test_split_depends_only_on_names_and_seed():
+    sample_files, labels = windowed_samples()
+    _, validation_indices = split_train_validation(sample_files, labels, 0.2, seed=3)
+    validation_files = {sample_files[index] for index in validation_indices}
+
+    # the order a filesystem lists the files in must not matter
+    listing_order = np.random.default_rng(0).permutation(len(sample_files))
+    listed_files = [sample_files[index] for index in listing_order]
+    listed_labels = [labels[index] for index in listing_order]
+    _, listed_validation = split_train_validation(listed_files, listed_labels, 0.2, seed=3)
+    assert {listed_files[index] for index in listed_validation} == validation_files
+
+    _, other_seed_validation = split_train_validation(sample_files, labels, 0.2, seed=4)
+    assert {sample_files[index] for index in other_seed_validation} != validation_files
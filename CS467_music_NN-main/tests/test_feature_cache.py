@@ -0,0 +1,45 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Tests of the on-disk spectrogram cache
+
+import os
+import numpy as np
+from feature_cache import FeatureCache
+
+
+def test_cache_key_depends_on_content_and_parameters(tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    key = cache.cache_key(b"audio", {"sr": 22050})
+    assert key == cache.cache_key(b"audio", {"sr": 22050})
+    assert key != cache.cache_key(b"other audio", {"sr": 22050})
+    assert key != cache.cache_key(b"audio", {"sr": 44100})
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    spectrogram = np.zeros((128, 16), dtype=np.float32)
+    cache = FeatureCache(str(tmp_path), max_bytes=10 ** 9)
+    for key in ("old", "middle", "new"):
+        cache.put(key, spectrogram)
+        os.utime(os.path.join(tmp_path, key + ".npy"), ns=(0, {"old": 1, "middle": 2, "new": 3}[key] * 10 ** 9))
+    entry_bytes = os.path.getsize(os.path.join(tmp_path, "new.npy"))
+    cache.max_bytes = 2 * entry_bytes
+    cache.evict()
+    assert cache.get("old") is None
+    assert cache.get("middle") is not None and cache.get("new") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evict_skips_entries_removed_by_another_process(tmp_path, concurrent_eviction):
+    cache = FeatureCache(str(tmp_path), max_bytes=0)
+    for key in ("first", "second"):
+        np.save(os.path.join(tmp_path, key + ".npy"), np.zeros(4, dtype=np.float32))
+    cache.evict()
+    assert os.listdir(tmp_path) == []
+
+
+def test_put_survives_concurrent_eviction(tmp_path, concurrent_eviction):
+    cache = FeatureCache(str(tmp_path), max_bytes=0)
+    np.save(os.path.join(tmp_path, "other.npy"), np.zeros(4, dtype=np.float32))
+    cache.put("key", np.ones((4, 4), dtype=np.float32))
@@ -0,0 +1,41 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Tests of the shared mel extractor and the resampler it is fed by
+
+import numpy as np
+import pytest
+import feature_extraction as fe
+from conftest import SAMPLE_SONG
+
+# the sample MP3 is 44100 Hz, so every window is resampled
+PARITY_OFFSETS = (0.0, 60.0, 150.0)
+# largest mean difference from soxr_hq over the audible bins, in dB
+MAX_MEAN_DB = 0.05
+# soxr_mq only moves the top mel bands, next to its cutoff
+MAX_BANDS_OVER_1DB = 2
+
+
+@pytest.mark.parametrize("offset", PARITY_OFFSETS)
+def test_resampler_matches_reference_spectrogram(offset):
+    reference = fe.window_spectrogram(SAMPLE_SONG, offset, fe.REFERENCE_RESAMPLE_TYPE)
+    candidate = fe.window_spectrogram(SAMPLE_SONG, offset, fe.RESAMPLE_TYPE)
+    difference = fe.spectrogram_difference(reference, candidate)
+    assert difference["mean_abs_db"] < MAX_MEAN_DB
+    assert difference["bands_over_1db"] <= MAX_BANDS_OVER_1DB
+    lower_bands = fe.spectrogram_difference(reference[:-MAX_BANDS_OVER_1DB], candidate[:-MAX_BANDS_OVER_1DB])
+    assert lower_bands["max_abs_db"] <= 1.0
+
+
+def test_extractor_matches_librosa():
+    windows = np.stack([fe.decode_window(SAMPLE_SONG, fe.WINDOW_DURATION, offset)[0] for offset in PARITY_OFFSETS])
+    assert np.abs(fe.mel_extractor.extract(windows) - fe.librosa_mel_spectrogram_db(windows)).max() < 0.01
+
+
+def test_resampler_keeps_the_top_genre():
+    # needs the TensorFlow model in model_saved
+    pytest.importorskip("tensorflow")
+    prediction_report = fe.prediction_parity([SAMPLE_SONG])
+    assert prediction_report["top_genre_matches"] == prediction_report["files"]
+    assert prediction_report["max_probability_difference"] < 0.01
@@ -0,0 +1,118 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Tests of the prediction job queue's job states and worker recovery
+
+import os
+import time
+import threading
+import pytest
+from job_queue import JobQueue, QueueFullError, JOB_STAGES
+
+# spawned featurize workers import this module, so startup can take a few seconds
+JOB_TIMEOUT_SECONDS = 60
+
+
+def featurize(audio):
+    # runs in the spawned process pool, so it has to be a module-level function
+    if isinstance(audio, tuple):
+        # ("die", marker_path): kill the worker the first time, as the OOM killer would
+        _, marker_path = audio
+        if not os.path.exists(marker_path):
+            open(marker_path, "w").close()
+            os._exit(1)
+        return "revived"
+    if audio == "bad audio":
+        raise ValueError("cannot decode")
+    return audio.upper()
+
+
+def wait_for_job(queue: JobQueue, job_id: str) -> dict:
+    deadline = time.time() + JOB_TIMEOUT_SECONDS
+    while time.time() < deadline:
+        job_state = queue.status(job_id)
+        if job_state["status"] in ("done", "failed"):
+            return job_state
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+@pytest.fixture
+def finished_jobs():
+    return []
+
+
+@pytest.fixture
+def job_queue(finished_jobs):
+    queue = JobQueue(lambda source: source["audio"], featurize, lambda features: features + "!",
+                     lambda source, audio, result: finished_jobs.append((source["audio"], result)),
+                     featurize_workers=1)
+    yield queue
+    queue.shutdown()
+
+
+def test_job_runs_through_every_stage(job_queue, finished_jobs):
+    job_id = job_queue.submit({"audio": "song"})
+    assert job_queue.status(job_id)["status"] in ("queued", "running")
+    job_state = wait_for_job(job_queue, job_id)
+    assert job_state["status"] == "done" and job_state["result"] == "SONG!" and job_state["error"] is None
+    assert set(job_state["stage_wait_seconds"]) == set(JOB_STAGES)
+    assert set(job_state["stage_seconds"]) == set(JOB_STAGES)
+    assert finished_jobs == [("song", "SONG!")]
+    metrics = job_queue.metrics()
+    assert metrics["completed"] == 1 and metrics["queue_depth"] == 0
+
+
+def test_failed_stage_fails_the_job(job_queue, finished_jobs):
+    job_state = wait_for_job(job_queue, job_queue.submit({"audio": "bad audio"}))
+    assert job_state["status"] == "failed" and job_state["error"] == "cannot decode"
+    assert job_state["result"] is None
+    # finish still runs, so the caller can clean up
+    assert finished_jobs == [("bad audio", None)]
+    assert job_queue.metrics()["failed"] == 1
+
+
+def test_failed_fetch_fails_the_job(job_queue):
+    job_state = wait_for_job(job_queue, job_queue.submit({}))
+    assert job_state["status"] == "failed" and "featurize" not in job_state["stage_seconds"]
+
+
+def test_submit_refuses_jobs_beyond_max_pending():
+    fetch_released = threading.Event()
+    queue = JobQueue(lambda source: fetch_released.wait() and source["audio"], featurize,
+                     lambda features: features, max_pending=2, featurize_workers=1)
+    try:
+        job_ids = [queue.submit({"audio": "first"}), queue.submit({"audio": "second"})]
+        with pytest.raises(QueueFullError):
+            queue.submit({"audio": "third"})
+        assert queue.metrics()["rejected"] == 1
+        fetch_released.set()
+        assert [wait_for_job(queue, job_id)["result"] for job_id in job_ids] == ["FIRST", "SECOND"]
+        # finished jobs free their slots
+        assert wait_for_job(queue, queue.submit({"audio": "third"}))["result"] == "THIRD"
+    finally:
+        fetch_released.set()
+        queue.shutdown()
+
+
+def test_finished_and_unknown_jobs(job_queue):
+    job_id = job_queue.add_finished(["cached result"])
+    assert job_queue.status(job_id)["status"] == "done"
+    assert job_queue.status(job_id)["result"] == ["cached result"]
+    assert job_queue.metrics()["queue_depth"] == 0
+    assert job_queue.status("no such job") is None
+
+
+def test_finished_jobs_expire(job_queue):
+    job_queue.result_ttl_seconds = -1
+    assert job_queue.status(job_queue.add_finished("result")) is None
+
+
+def test_dead_featurize_worker_is_replaced(job_queue, tmp_path):
+    job_id = job_queue.submit({"audio": ("die", str(tmp_path / "died"))})
+    job_state = wait_for_job(job_queue, job_id)
+    assert job_state["status"] == "done" and job_state["result"] == "revived!"
+    assert job_queue.metrics()["featurize_pool_restarts"] == 1
+    # the replacement pool takes new jobs
+    assert wait_for_job(job_queue, job_queue.submit({"audio": "song"}))["result"] == "SONG!"
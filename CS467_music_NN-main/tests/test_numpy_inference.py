@@ -0,0 +1,115 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Tests of the NumPy forward pass against a float64 reference and the SavedModel
+
+import os
+import numpy as np
+import pytest
+import numpy_inference
+from numpy_inference import NumpyGenreModel
+from conftest import PROJECT_DIRECTORY
+
+CONV_FILTERS = (32, 64, 128, 256, 512)
+GENRES = 10
+# the float32 forward pass stays within this of the float64 reference
+MAX_PROBABILITY_DIFFERENCE = 1e-5
+MAX_RELATIVE_FEATURE_DIFFERENCE = 1e-5
+
+
+def write_random_model(model_path: str, variable_frames: bool, seed: int = 0) -> dict:
+    # random weights with the build_model layer structure, scaled so the softmax is not saturated
+    rng = np.random.default_rng(seed)
+    weights = {"variable_frames": np.array(variable_frames)}
+    channels = 1
+    for layer, filters in enumerate(CONV_FILTERS):
+        weights[f"conv{layer}_kernel"] = (rng.standard_normal((2, 2, channels, filters))
+                                          / np.sqrt(4 * channels)).astype(np.float32)
+        weights[f"conv{layer}_bias"] = (0.1 * rng.standard_normal(filters)).astype(np.float32)
+        channels = filters
+    # a (128, 1292) spectrogram leaves (3, 39, 512) activations; time pooling keeps (3, 512)
+    dense_inputs = 3 * channels if variable_frames else 3 * 39 * channels
+    weights["dense_kernel"] = (5 * rng.standard_normal((dense_inputs, GENRES))
+                               / np.sqrt(dense_inputs)).astype(np.float32)
+    weights["dense_bias"] = rng.standard_normal(GENRES).astype(np.float32)
+    np.savez(model_path, **weights)
+    return weights
+
+
+def reference_forward(weights: dict, model_input: np.ndarray, variable_frames: bool) -> tuple:
+    # direct float64 conv, ReLU and average pooling, written for clarity rather than speed
+    activations = model_input.astype(np.float64) / 80 + 1
+    for layer in range(len(CONV_FILTERS)):
+        kernel = weights[f"conv{layer}_kernel"].astype(np.float64)
+        height, width = activations.shape[1] - 1, activations.shape[2] - 1
+        conv = sum(np.einsum("nhwc,cf->nhwf", activations[:, row:row + height, column:column + width],
+                             kernel[row, column]) for row in range(2) for column in range(2))
+        conv = np.maximum(conv + weights[f"conv{layer}_bias"], 0)
+        height, width = height // 2, width // 2
+        activations = conv[:, :2 * height, :2 * width].reshape(
+            len(conv), height, 2, width, 2, -1).mean(axis=(2, 4))
+    if variable_frames:
+        features = activations.mean(axis=2).reshape(len(activations), -1)
+    else:
+        features = activations.reshape(len(activations), -1)
+    logits = features @ weights["dense_kernel"] + weights["dense_bias"]
+    probabilities = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return probabilities / probabilities.sum(axis=1, keepdims=True), features
+
+
+def random_spectrograms(tracks: int, frames: int, seed: int = 1) -> np.ndarray:
+    return np.random.default_rng(seed).uniform(-80, 0, (tracks, 128, frames, 1)).astype(np.float32)
+
+
+@pytest.mark.parametrize("variable_frames, frames", [(False, 1292), (True, 1292), (True, 431), (True, 100)])
+@pytest.mark.parametrize("tracks", [1, 3])
+def test_forward_matches_reference(tmp_path, variable_frames, frames, tracks):
+    weights = write_random_model(str(tmp_path / "model.npz"), variable_frames)
+    trained_model = NumpyGenreModel(str(tmp_path / "model.npz"))
+    assert trained_model.variable_frames == variable_frames
+    model_input = random_spectrograms(tracks, frames)
+    probabilities, features = trained_model.forward(model_input)
+    reference_probabilities, reference_features = reference_forward(weights, model_input, variable_frames)
+    assert np.abs(probabilities - reference_probabilities).max() < MAX_PROBABILITY_DIFFERENCE
+    assert (np.abs(features - reference_features).max() / np.abs(reference_features).max()
+            < MAX_RELATIVE_FEATURE_DIFFERENCE)
+    outputs = trained_model.serve_with_embedding(model_input)
+    assert np.array_equal(outputs["predictions"], probabilities)
+    assert np.array_equal(outputs["embedding"], features)
+
+
+def test_rejects_sizes_the_model_was_not_trained_on(tmp_path):
+    write_random_model(str(tmp_path / "fixed.npz"), False)
+    write_random_model(str(tmp_path / "variable.npz"), True)
+    with pytest.raises(ValueError):
+        NumpyGenreModel(str(tmp_path / "fixed.npz")).serve(random_spectrograms(1, 431))
+    with pytest.raises(ValueError):
+        NumpyGenreModel(str(tmp_path / "variable.npz")).serve(random_spectrograms(1, 40))
+    with pytest.raises(ValueError):
+        NumpyGenreModel(str(tmp_path / "variable.npz")).serve(np.zeros((1, 64, 431, 1), dtype=np.float32))
+
+
+def test_workspaces_are_bounded(tmp_path):
+    write_random_model(str(tmp_path / "model.npz"), True)
+    trained_model = NumpyGenreModel(str(tmp_path / "model.npz"))
+    for frames in (100, 120, 140, 160):
+        trained_model.serve(random_spectrograms(1, frames))
+    assert list(trained_model._local.workspaces) == [(1, 128, 140), (1, 128, 160)][
+        -numpy_inference.WORKSPACE_CACHE_SIZE:]
+    # reused buffers do not change the answer
+    model_input = random_spectrograms(2, 431)
+    first_probabilities = trained_model.serve(model_input).copy()
+    trained_model.serve(random_spectrograms(2, 431, seed=2))
+    assert np.array_equal(trained_model.serve(model_input), first_probabilities)
+
+
+def test_matches_saved_model(tmp_path):
+    # needs TensorFlow to export and run the trained model in model_saved
+    pytest.importorskip("tensorflow")
+    saved_model_dir = os.path.join(PROJECT_DIRECTORY, "model_saved")
+    numpy_inference.export_numpy_weights(saved_model_dir, str(tmp_path / "genre_model.npz"))
+    report = numpy_inference.compare_with_saved_model(
+        saved_model_dir, NumpyGenreModel(str(tmp_path / "genre_model.npz")), random_spectrograms(4, 1292))
+    assert report["max_probability_difference"] < MAX_PROBABILITY_DIFFERENCE
+    assert report["top1_agreement"] == 1.0
@@ -0,0 +1,59 @@
+# Names: Kyle Donovan, Philip Hopkins, Marco Scandroglio
+# Course: CS 467 Fall 2023
+# Project: Top-n Music Genre Classification Neural Network
+# GitHub Repo: https://github.com/pdhopkins/CS467_music_NN
+# Description: Tests of the on-disk genre prediction cache
+
+import os
+import prediction_cache
+from prediction_cache import PredictionCache, prediction_cache_key
+
+RESULT_LIST = [("rock", 0.75), ("metal", 0.25)]
+
+
+def test_early_exit_results_have_their_own_key():
+    assert prediction_cache_key("youtube:abc") == "youtube:abc"
+    assert prediction_cache_key("youtube:abc", 0.9) != prediction_cache_key("youtube:abc")
+    assert prediction_cache_key("youtube:abc", 0.9) != prediction_cache_key("youtube:abc", 0.8)
+
+
+def test_get_checks_model_version_and_age(tmp_path):
+    cache = PredictionCache(str(tmp_path))
+    cache.put("upload:1", RESULT_LIST, "model-a")
+    assert cache.get("upload:1", "model-a") == RESULT_LIST
+    assert cache.get("upload:1", "model-b") is None
+    assert cache.get("upload:2", "model-a") is None
+    cache.ttl_seconds = -1
+    assert cache.get("upload:1", "model-a") is None
+
+
+def test_evict_keeps_most_recently_used(tmp_path):
+    cache = PredictionCache(str(tmp_path), max_entries=10)
+    for entry_number in range(11):
+        cache.put(f"upload:{entry_number}", RESULT_LIST)
+        os.utime(cache._entry_path(f"upload:{entry_number}"), ns=(0, (entry_number + 1) * 10 ** 9))
+    # over the limit, so trimmed to PREDICTION_CACHE_EVICT_TO of it, oldest first
+    assert len(os.listdir(tmp_path)) == 9
+    assert cache.get("upload:0") is None and cache.get("upload:1") is None
+    assert cache.get("upload:10") == RESULT_LIST
+
+
+def test_put_scans_only_when_the_cache_may_be_full(tmp_path, monkeypatch):
+    cache = PredictionCache(str(tmp_path), max_entries=100)
+    scans = []
+    original_evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: scans.append(1) or original_evict())
+    for entry_number in range(100):
+        cache.put(f"upload:{entry_number}", RESULT_LIST)
+    # the first write learns the entry count, the rest stay within the limit
+    assert len(scans) == 1
+    cache.put("upload:100", RESULT_LIST)
+    assert len(scans) == 2
+    assert len(os.listdir(tmp_path)) == int(100 * prediction_cache.PREDICTION_CACHE_EVICT_TO)
+
+
+def test_put_survives_concurrent_eviction(tmp_path, concurrent_eviction):
+    cache = PredictionCache(str(tmp_path), max_entries=0)
+    cache.put("upload:1", RESULT_LIST)
+    cache.evict()
+    assert os.listdir(tmp_path) == []